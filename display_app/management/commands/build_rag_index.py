@@ -0,0 +1,116 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from display_app.views import agent_filter_keywords
+from rag_core.agent_tags import update_agent_tags
+from rag_core.index_builder import index_artifact_path
+from rag_core.lexical_index import update_lexical_index
+from rag_core.title_index import update_title_index
+from rag_core.rag_pipeline import create_chunker, create_index_builder, load_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the RAG corpus snapshot, chunk embeddings and FAISS index offline, so the "
+        "web process only has to load prebuilt artifacts. Interrupted builds resume from "
+        "the last checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--checkpoint-every', type=int, default=getattr(settings, 'RAG_CHECKPOINT_EVERY', 10),
+            help="Save the index every N batches of RAG_INDEX_BATCH_SIZE articles (0 disables checkpoints).",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help="Embedding worker processes (overrides RAG_EMBEDDING_WORKERS).",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help="Articles per indexing batch (overrides RAG_INDEX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Ignore the existing index and build a fresh one (cached embeddings are still reused).",
+        )
+
+    def _stage(self, name, timings, work):
+        started = time.perf_counter()
+        self.stdout.write(f"==> {name}")
+        result = work()
+        timings[name] = time.perf_counter() - started
+        self.stdout.write(f"    {name} took {timings[name]:.2f}s")
+        return result
+
+    def handle(self, *args, **options):
+        from sentence_transformers import SentenceTransformer
+
+        timings = {}
+        model_name = getattr(settings, 'RAG_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+        store = self._stage(
+            'Corpus snapshot', timings, lambda: load_corpus(settings.CSV_FILE_PATH, settings.CORPUS_SNAPSHOT_DIR),
+        )
+        if store.empty:
+            raise CommandError(f"No articles found in {settings.CSV_FILE_PATH}.")
+        model = self._stage('Embedding model', timings, lambda: SentenceTransformer(model_name))
+
+        builder = create_index_builder(settings.FAISS_INDEX_PATH, store, model, model_name, create_chunker(model))
+        if options['workers'] is not None:
+            builder.embedding_workers = options['workers']
+        if options['batch_size'] is not None:
+            builder.index_batch_size = options['batch_size']
+        index, chunks, stats = self._stage(
+            'FAISS index', timings,
+            lambda: builder.build(rebuild=options['rebuild'], checkpoint_every=options['checkpoint_every'] or None),
+        )
+
+        if getattr(settings, 'RAG_TITLE_CANDIDATES', 20) > 0:
+            self._stage(
+                'Title index', timings,
+                lambda: update_title_index(
+                    index_artifact_path(settings.FAISS_INDEX_PATH, '.titles.faiss'), store, model, model_name,
+                    builder.cache_dir, batch_size=builder.embedding_batch_size,
+                ),
+            )
+        if getattr(settings, 'RAG_BM25_CANDIDATES', 20) > 0:
+            self._stage(
+                'BM25 index', timings,
+                lambda: update_lexical_index(index_artifact_path(settings.FAISS_INDEX_PATH, '.bm25'), store),
+            )
+
+        self._stage(
+            'Agent tags', timings,
+            lambda: update_agent_tags(index_artifact_path(settings.FAISS_INDEX_PATH, ''), store, agent_filter_keywords()),
+        )
+
+        self.stdout.write("")
+        self.stdout.write("Build summary")
+        for name, seconds in timings.items():
+            self.stdout.write(f"  {name:<18} {seconds:8.2f}s")
+        for name in ('chunk', 'embed', 'add'):
+            self.stdout.write(f"    {name:<16} {stats[name + '_seconds']:8.2f}s")
+        index_seconds = max(timings['FAISS index'], 1e-9)
+        self.stdout.write(
+            f"  Articles embedded  {stats['embedded_docs']} ({stats['embedded_chunks']} chunks), "
+            f"removed {stats['removed_docs']}"
+        )
+        self.stdout.write(
+            f"  Throughput         {stats['embedded_docs'] / index_seconds:.1f} docs/sec, "
+            f"{stats['embedded_chunks'] / index_seconds:.1f} chunks/sec"
+        )
+        if 'cache_hits' in stats:
+            lookups = stats['cache_hits'] + stats['cache_misses']
+            self.stdout.write(
+                f"  Embedding cache    {stats['cache_hits']}/{lookups} hits "
+                f"({100.0 * stats['cache_hits'] / max(lookups, 1):.1f}%)"
+            )
+        if 'worker_texts' in stats:
+            self.stdout.write(
+                f"  Embedding workers  {stats['worker_texts']} texts in {stats['worker_seconds']:.2f}s "
+                f"({stats['worker_texts'] / max(stats['worker_seconds'], 1e-9):.1f} texts/sec)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Index ready: {index.ntotal} chunks from {stats['indexed_docs']} articles at {settings.FAISS_INDEX_PATH}"
+        ))
@@ -1,3 +1,919 @@
-from django.test import TestCase
+import contextlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from unittest import mock
 
-# Create your tests here.
+import faiss
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from rag_core.ann_index import fit_index_spec
+from rag_core.batching_encoder import BatchingEncoder
+from rag_core.binary_index import hamming_to_squared_l2
+from rag_core.chunking import CHUNK_NUMBER_BITS, Chunker, ChunkTable
+from rag_core.corpus_snapshot import load_snapshot
+from rag_core.dedup import SHINGLE_WORDS, NearDuplicateIndex, minhash_signature
+from rag_core.document_store import DocumentStore
+from rag_core.index_builder import IndexBuilder, index_artifact_path
+from rag_core.index_manifest import IndexManifest
+from rag_core.keyword_matcher import KeywordMatcher, compile_keywords
+from rag_core.lexical_index import BM25_B, BM25_K1, TITLE_WEIGHT, BM25Index, tokenize
+from rag_core.query_cache import QueryEmbeddingCache
+from rag_core.rag_pipeline import RAGPipeline
+from rag_core.search_filters import SearchFilter
+from rag_core.sharded_index import ShardedIndexBuilder
+from rag_core.title_index import TitleIndex, update_title_index
+
+DIMENSION = 64
+
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for the SentenceTransformer: a normalized hashed bag of words."""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.encoded += len(texts)
+        vectors = np.zeros((len(texts), DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, zlib.crc32(word.encode('utf-8')) % DIMENSION] += 1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+        return vectors
+
+
+ARTICLES = [
+    (101, 'Metro fare hike', 'Namma Metro fares rise by forty percent. Commuters protest the hike.', '2025-01-08 07:00', 'News', 'Transport'),
+    (102, 'Heavy rain floods roads', 'Heavy rain flooded several underpasses. The IMD issued an alert.', '2025-02-01 09:00', 'News', 'Weather'),
+    (103, 'SSLC exam schedule out', 'The board announced the SSLC exam timetable for March.', '2025-02-28 23:30', 'News', 'Education'),
+    (104, 'Lake encroachment survey', 'Officials surveyed encroachments around Bellandur lake.', '2025-03-01 00:00', 'Feature', 'Civic'),
+    (105, 'Undated civic notice', 'Water supply will be disrupted in parts of the city.', None, 'News', 'Civic'),
+]
+
+
+def write_export(path, articles):
+    pd.DataFrame(
+        [{'DOC_ID': doc_id, 'DOC_TITL': title, 'DOC_DET': text, 'DOC_URL': f'https://example.com/{doc_id}',
+          'DOC_PUBDATE': pubdate, 'DOC_SDATE': pubdate, 'DOC_CATEGRY': doc_category, 'NEWS_CATEGRY': news_category}
+         for doc_id, title, text, pubdate, doc_category, news_category in articles]
+    ).to_csv(path, index=False)
+
+
+class CorpusTestCase(SimpleTestCase):
+    """Writes a small export into a temporary directory and compiles it into a document store."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.csv_path = os.path.join(self.directory, 'export.csv')
+        self.model = FakeEmbeddingModel()
+        self.chunker = Chunker(None, max_tokens=12, overlap_tokens=2)
+
+    def load_store(self, articles=ARTICLES, dedup_threshold=None):
+        write_export(self.csv_path, articles)
+        return DocumentStore.from_snapshot(*load_snapshot(
+            self.csv_path, os.path.join(self.directory, 'snapshot'), dedup_threshold=dedup_threshold,
+        ))
+
+    def builder(self, store, **options):
+        return IndexBuilder(
+            os.path.join(self.directory, 'index.faiss'), store, self.model, 'fake-model', self.chunker,
+            cache_dir=os.path.join(self.directory, 'embeddings'), **options,
+        )
+
+    def nearest_doc_id(self, index, chunks, text):
+        _, ids = index.search(self.model.encode([text]), 1)
+        return int(chunks.doc_ids[chunks.rows_for_ids(ids[0])[0]])
+
+
+TOPICS = [
+    ('Transport', ['metro', 'bus', 'fare', 'commuters', 'route', 'station']),
+    ('Weather', ['rain', 'flood', 'monsoon', 'forecast', 'storm', 'humidity']),
+    ('Education', ['school', 'exam', 'syllabus', 'college', 'students', 'results']),
+    ('Civic', ['garbage', 'potholes', 'lake', 'water', 'footpath', 'drainage']),
+]
+
+
+def generated_articles(count=80):
+    """Articles cycling through TOPICS, published every second day from 2025-01-01."""
+    articles = []
+    for n in range(count):
+        category, words = TOPICS[n % len(TOPICS)]
+        picked = [words[(n + offset) % len(words)] for offset in range(4)]
+        pubdate = str(np.datetime64('2025-01-01T08:00') + np.timedelta64(2 * n, 'D')).replace('T', ' ')
+        articles.append((
+            2000 + n, f'{picked[0].title()} update {n}',
+            f'The {picked[0]} and {picked[1]} report number {n}. Residents of ward{n} discussed the {picked[2]}. '
+            f'Officials said the {picked[3]} would be reviewed.',
+            pubdate, 'News', category,
+        ))
+    return articles
+
+
+# A pipeline that builds its own artifacts in the test directory with the fake model
+PIPELINE_SETTINGS = {
+    'FAISS_INDEX_SPEC': 'Flat', 'FAISS_TRANSFORM': None, 'FAISS_RERANK_CANDIDATES': 0, 'FAISS_SHARD_PERIOD': None,
+    'RAG_DEDUP_THRESHOLD': None, 'RAG_CHUNK_MAX_TOKENS': 12, 'RAG_CHUNK_OVERLAP_TOKENS': 2,
+    'RAG_EMBEDDING_WORKERS': 1, 'RAG_QUERY_BATCH_SIZE': 1, 'RAG_QUERY_CACHE_PATH': None,
+}
+AGENT_KEYWORDS = {'public_transport': ['metro', 'bus'], 'bangalore_weather': ['rain', 'flood']}
+
+
+class PipelineTestCase(CorpusTestCase):
+    def pipeline(self, articles=None, agent_keywords=AGENT_KEYWORDS, **options):
+        write_export(self.csv_path, generated_articles() if articles is None else articles)
+        overrides = override_settings(**{
+            **PIPELINE_SETTINGS, 'RAG_EMBEDDING_CACHE_DIR': os.path.join(self.directory, 'embeddings'), **options,
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        with mock.patch('rag_core.rag_pipeline.SentenceTransformer', return_value=self.model):
+            pipeline = RAGPipeline(
+                self.csv_path, os.path.join(self.directory, 'index.faiss'), os.path.join(self.directory, 'snapshot'),
+                build_index=True, agent_keywords=agent_keywords,
+            )
+        self.assertIsNotNone(pipeline.index)
+        return pipeline
+
+    def doc_ids(self, results):
+        return [int(result['doc_id']) for result in results]
+
+
+class BuildCommandTests(CorpusTestCase):
+    def setUp(self):
+        super().setUp()
+        write_export(self.csv_path, generated_articles())
+        overrides = override_settings(**{
+            **PIPELINE_SETTINGS, 'CSV_FILE_PATH': self.csv_path,
+            'CORPUS_SNAPSHOT_DIR': os.path.join(self.directory, 'snapshot'),
+            'FAISS_INDEX_PATH': os.path.join(self.directory, 'index.faiss'),
+            'RAG_EMBEDDING_CACHE_DIR': os.path.join(self.directory, 'embeddings'),
+        })
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def call_build(self, **options):
+        output = io.StringIO()
+        with mock.patch('sentence_transformers.SentenceTransformer', return_value=self.model), \
+                contextlib.redirect_stdout(io.StringIO()):
+            call_command('build_rag_index', batch_size=10, checkpoint_every=1, stdout=output, **options)
+        return output.getvalue()
+
+    def test_summary_reports_embedding_worker_throughput(self):
+        model = self.model
+
+        class InProcessEncoder:
+            # ParallelEncoder's interface without spawning worker processes
+            def __init__(self, model_name, workers, batch_size):
+                self.texts_encoded, self.seconds = 0, 0.5
+
+            def encode(self, texts):
+                self.texts_encoded += len(texts)
+                return model.encode(texts)
+
+            def close(self):
+                pass
+
+        with mock.patch('rag_core.index_builder.ParallelEncoder', InProcessEncoder):
+            output = self.call_build(workers=2)
+        hits, lookups = map(int, re.search(r'Embedding cache +(\d+)/(\d+) hits', output).groups())
+        self.assertIn(f'Embedding workers  {lookups - hits} texts in 0.50s', output)
+        self.assertNotIn('Embedding workers', self.call_build())
+
+    def test_interrupted_build_resumes_from_the_checkpoint(self):
+        save = IndexBuilder.save
+
+        def save_then_interrupt(builder, index, chunks, manifest):
+            save(builder, index, chunks, manifest)
+            raise KeyboardInterrupt
+
+        with mock.patch.object(IndexBuilder, 'save', save_then_interrupt), self.assertRaises(KeyboardInterrupt):
+            self.call_build()
+        builder = IndexBuilder(
+            os.path.join(self.directory, 'index.faiss'), self.load_store(generated_articles()), self.model,
+            'all-MiniLM-L6-v2', self.chunker,
+        )
+        _, chunks, manifest = builder.load()
+        self.assertEqual(len(manifest.doc_ids), 10)
+        self.assertIsNone(manifest.snapshot_fingerprint)
+
+        output = self.call_build()
+        # Only the articles after the checkpoint are embedded
+        self.assertIn('Articles embedded  70 (210 chunks)', output)
+        self.assertIn('Index ready: ', output)
+        index, chunks, manifest = builder.load()
+        self.assertEqual(len(manifest.doc_ids), 80)
+        self.assertEqual(index.ntotal, len(chunks))
+        self.assertTrue(manifest.matches_corpus(builder.store))
+        self.assertIn('Articles embedded  0 ', self.call_build())
+
+
+class TransformSearchTests(PipelineTestCase):
+    def test_filtered_and_agent_scoped_search_on_a_pca_index(self):
+        # Chunk hits only: titles and BM25 would fill the results even if the index returned nothing
+        pipeline = self.pipeline(FAISS_TRANSFORM='PCA16', RAG_TITLE_CANDIDATES=0, RAG_BM25_CANDIDATES=0)
+        self.assertIsInstance(faiss.downcast_index(pipeline.index.index), faiss.IndexPreTransform)
+        articles = {article[0]: article for article in generated_articles()}
+
+        # Contiguous chunk ids (IDSelectorRange)
+        results = pipeline.retrieve_relevant_chunks(
+            'metro fare commuters', top_k=3, filters={'pubdate_from': '2025-02', 'pubdate_to': '2025-02'}
+        )
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertIsNotNone(result['distance'])
+            self.assertTrue(articles[int(result['doc_id'])][3].startswith('2025-02'))
+
+        # Scattered chunk ids (IDSelectorBatch)
+        results = pipeline.retrieve_relevant_chunks('metro fare', top_k=3, filters={'news_categories': ['Weather']})
+        self.assertEqual(len(results), 3)
+        self.assertEqual({articles[doc_id][5] for doc_id in self.doc_ids(results)}, {'Weather'})
+
+        results = pipeline.retrieve_relevant_chunks('rain flood', top_k=3, agent_id='public_transport')
+        self.assertEqual(len(results), 3)
+        self.assertEqual({articles[doc_id][5] for doc_id in self.doc_ids(results)}, {'Transport'})
+
+
+class UnfilterableIndexTests(PipelineTestCase):
+    def test_filtered_pq_search_still_returns_top_k(self):
+        # Flat PQ search takes no ID selector; without re-ranking nothing else over-fetches
+        pipeline = self.pipeline(generated_articles(200), FAISS_INDEX_SPEC='PQ8x2', RAG_TITLE_CANDIDATES=0,
+                                 RAG_BM25_CANDIDATES=0)
+        self.assertIsInstance(faiss.downcast_index(pipeline.index.index), faiss.IndexPQ)
+        articles = {article[0]: article for article in generated_articles(200)}
+        results = pipeline.retrieve_relevant_chunks('metro fare', top_k=5, filters={'news_categories': ['Civic']})
+        self.assertEqual(len(results), 5)
+        self.assertEqual({articles[doc_id][5] for doc_id in self.doc_ids(results)}, {'Civic'})
+
+
+class DigitBlindEmbeddingModel(FakeEmbeddingModel):
+    """Ignores every word containing a digit, the way dense embeddings blur ward numbers and FIR ids."""
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        return super().encode([re.sub(r'\w*\d\w*', ' ', text) for text in texts], batch_size)
+
+
+class LexicalSearchTests(PipelineTestCase):
+    def test_bm25_scores_on_a_tiny_corpus(self):
+        store = self.load_store()
+        index = BM25Index.build(store, block_rows=2)
+        words = [tokenize(title) * TITLE_WEIGHT + tokenize(text) for _, title, text, *_ in ARTICLES]
+        average_length = np.mean([len(article_words) for article_words in words])
+        # 'metro' is in article 101 only: twice per title copy, once in the text
+        frequency, length = words[0].count('metro'), len(words[0])
+        self.assertEqual(frequency, 3)
+        idf = np.log(1.0 + (len(ARTICLES) - 1 + 0.5) / (1 + 0.5))
+        expected = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+
+        positions, scores = index.search('Metro?', 5)
+        self.assertEqual(store.doc_ids[positions].tolist(), [101])
+        self.assertAlmostEqual(float(scores[0]), expected, places=5)
+        # Terms add up; the article matching both terms ranks first
+        positions, scores = index.search('heavy rain metro', 5)
+        self.assertEqual(store.doc_ids[positions].tolist(), [102, 101])
+        self.assertEqual(len(index.search('monorail', 5)[0]), 0)
+        mask = np.ones(len(store), dtype=bool)
+        mask[positions[0]] = False
+        self.assertEqual(store.doc_ids[index.search('heavy rain metro', 5, mask)[0]].tolist(), [101])
+
+    def test_fusion_surfaces_a_lexical_only_match(self):
+        self.model = DigitBlindEmbeddingModel()
+        pipeline = self.pipeline(RAG_TITLE_CANDIDATES=0)
+        results = pipeline.retrieve_relevant_chunks('what happened in ward57', top_k=5)
+        lexical_only = [result for result in results if result['distance'] is None]
+        self.assertEqual(self.doc_ids(lexical_only), [2057])
+        self.assertIn('ward57', lexical_only[0]['chunk_text'])
+
+        pipeline.lexical_index = None
+        self.assertNotIn(2057, self.doc_ids(pipeline.retrieve_relevant_chunks('what happened in ward57', top_k=5)))
+
+
+class AgentScopeTests(PipelineTestCase):
+    def test_agent_search_returns_only_its_tagged_articles(self):
+        pipeline = self.pipeline()
+        tagged = set(pipeline.data.doc_ids[pipeline.agent_tags.document_mask('public_transport', len(pipeline.data))].tolist())
+        texts = {doc_id: f'{title} {text}' for doc_id, title, text, *_ in generated_articles()}
+        self.assertEqual(tagged, {doc_id for doc_id, text in texts.items() if re.search(r'\b(metro|bus)\b', text, re.I)})
+
+        results = pipeline.retrieve_relevant_chunks('rain flood monsoon', top_k=10, agent_id='public_transport')
+        self.assertEqual(len(results), 10)
+        self.assertLessEqual(set(self.doc_ids(results)), tagged)
+
+    def test_search_is_unscoped_without_tags_for_the_agent(self):
+        pipeline = self.pipeline()
+        self.assertTrue(pipeline.scopes_agent('public_transport'))
+        self.assertFalse(pipeline.scopes_agent('general_news'))
+        unscoped = self.doc_ids(pipeline.retrieve_relevant_chunks('rain flood monsoon', top_k=5))
+        self.assertEqual(
+            self.doc_ids(pipeline.retrieve_relevant_chunks('rain flood monsoon', top_k=5, agent_id='general_news')), unscoped
+        )
+        pipeline.agent_tags = None
+        self.assertFalse(pipeline.scopes_agent('public_transport'))
+        self.assertEqual(
+            self.doc_ids(pipeline.retrieve_relevant_chunks('rain flood monsoon', top_k=5, agent_id='public_transport')),
+            unscoped,
+        )
+
+    def test_view_filters_by_keyword_when_the_agent_is_not_scoped(self):
+        pipeline = mock.Mock()
+        pipeline.scopes_agent.return_value = False
+        pipeline.retrieve_relevant_chunks.return_value = [
+            {'doc_id': 1, 'chunk_text': 'Small business owners met the mayor.'},
+            {'doc_id': 2, 'chunk_text': 'A new feeder bus route starts Monday.'},
+        ]
+        pipeline.generate_answer_with_llm.return_value = 'answer'
+        with mock.patch('display_app.views.load_rag_components_once', return_value=pipeline):
+            self.client.post(reverse('home'), {'user_query': 'new routes', 'agent_persona': 'public_transport'})
+        context = pipeline.generate_answer_with_llm.call_args.args[1]
+        self.assertEqual([chunk['doc_id'] for chunk in context], [2])
+
+
+def token_starts(text):
+    """Character offsets of the tokens the Chunker counts when it has no model tokenizer."""
+    return np.array([match.start() for match in re.finditer(r'\w+|[^\w\s]', text)])
+
+
+class BatchRetrievalTests(PipelineTestCase):
+    QUERIES = ['metro fare hike', 'rain flood alert', 'exam results', 'garbage on the footpath', 'metro station']
+    FILTERS = [None, {'news_categories': ['Transport']}, {'pubdate_from': '2025-03', 'pubdate_to': '2025-04'}, None,
+               {'news_categories': ['Transport']}]
+
+    def test_batch_results_match_single_queries(self):
+        pipeline = self.pipeline()
+        for filters in (self.FILTERS, {'pubdate_from': '2025-01', 'pubdate_to': '2025-03'}):
+            per_query = filters if isinstance(filters, list) else [filters] * len(self.QUERIES)
+            expected = [
+                pipeline.retrieve_relevant_chunks(query, top_k=4, filters=query_filters, agent_id='public_transport')
+                for query, query_filters in zip(self.QUERIES, per_query)
+            ]
+            batched = list(pipeline.retrieve_relevant_chunks_batch(
+                iter(self.QUERIES), top_k=4, filters=filters, agent_id='public_transport', batch_size=2
+            ))
+            self.assertEqual(len(batched), len(self.QUERIES))
+            for single, batch in zip(expected, batched):
+                self.assertTrue(single)
+                self.assertEqual(self.doc_ids(batch), self.doc_ids(single))
+                self.assertEqual([r['chunk_text'] for r in batch], [r['chunk_text'] for r in single])
+
+    def test_filters_list_of_the_wrong_length_is_rejected(self):
+        pipeline = self.pipeline()
+        for filters in (self.FILTERS[:4], self.FILTERS + [None]):
+            with self.assertRaises(ValueError):
+                list(pipeline.retrieve_relevant_chunks_batch(self.QUERIES, filters=filters, batch_size=2))
+
+
+class TitleIndexTests(PipelineTestCase):
+    def test_title_index_is_saved_loaded_and_rebuilt_for_a_new_corpus(self):
+        store = self.load_store()
+        path = os.path.join(self.directory, 'index.titles.faiss')
+        cache_dir = os.path.join(self.directory, 'embeddings')
+        self.assertEqual(update_title_index(path, store, self.model, 'fake-model', cache_dir).index.ntotal, len(ARTICLES))
+        encoded = self.model.encoded
+        title_index = update_title_index(path, store, self.model, 'fake-model', cache_dir)
+        self.assertEqual(self.model.encoded, encoded)
+        self.assertFalse(title_index.matches_corpus(store, 'other-model'))
+
+        similarities, positions = TitleIndex.load(path, mmap=True).search(
+            self.model.encode(['heavy rain floods roads']), 2, store
+        )
+        self.assertEqual(int(store.doc_ids[positions[0, 0]]), 102)
+        self.assertAlmostEqual(float(similarities[0, 0]), 1.0, places=5)
+        doc_mask = store.doc_ids != 102
+        _, positions = title_index.search(self.model.encode(['heavy rain floods roads']), 2, store, doc_mask)
+        self.assertNotIn(102, store.doc_ids[positions[0]].tolist())
+
+        store = self.load_store(ARTICLES[:3])
+        self.assertFalse(TitleIndex.load(path).matches_corpus(store, 'fake-model'))
+        self.assertEqual(update_title_index(path, store, self.model, 'fake-model', cache_dir).index.ntotal, 3)
+
+    def test_matching_headline_lifts_an_article_whose_body_misses(self):
+        articles = ARTICLES + [(106, 'Ward committee elections announced', 'Polling booths open at seven. Voters queue early.',
+                                '2025-03-02 08:00', 'News', 'Civic')]
+        pipeline = self.pipeline(articles, RAG_BM25_CANDIDATES=0, RAG_TITLE_FIRST_SIMILARITY=None)
+        query = 'ward committee elections'
+        results = pipeline.retrieve_relevant_chunks(query, top_k=3)
+        self.assertEqual(self.doc_ids(results)[0], 106)
+        pipeline.title_index = None
+        self.assertNotEqual(self.doc_ids(pipeline.retrieve_relevant_chunks(query, top_k=3))[0], 106)
+
+
+class ChunkerTests(CorpusTestCase):
+    # Twenty sentences of five tokens each ('Sentence', number, 'has', 'words', '.')
+    TEXT = ' '.join(f'Sentence {n} has words.' for n in range(20))
+
+    def window_tokens(self, text, spans):
+        starts = token_starts(text)
+        return [set(np.flatnonzero((starts >= start) & (starts < end)).tolist()) for start, end in spans]
+
+    def test_windows_cover_every_token_within_the_limit(self):
+        for text in (self.TEXT, ' '.join(f'word{n}' for n in range(50))): # the second is one long sentence
+            windows = self.window_tokens(text, Chunker(None, max_tokens=12, overlap_tokens=5).chunk(text))
+            self.assertEqual(set().union(*windows), set(range(len(token_starts(text)))))
+            self.assertLessEqual(max(len(window) for window in windows), 12)
+
+    def test_consecutive_windows_overlap_by_whole_sentences(self):
+        spans = Chunker(None, max_tokens=12, overlap_tokens=5).chunk(self.TEXT)
+        windows = self.window_tokens(self.TEXT, spans)
+        self.assertGreater(len(spans), 2)
+        sentence_starts = {match.start() for match in re.finditer('Sentence', self.TEXT)}
+        for (start, _), previous, window in zip(spans[1:], windows, windows[1:]):
+            self.assertIn(start, sentence_starts)
+            self.assertEqual(len(previous & window), 5)
+        no_overlap = self.window_tokens(self.TEXT, Chunker(None, max_tokens=12, overlap_tokens=4).chunk(self.TEXT))
+        # A trailing sentence that does not fit in the overlap budget is not repeated
+        self.assertTrue(all(not previous & window for previous, window in zip(no_overlap, no_overlap[1:])))
+
+    def test_overlap_must_be_smaller_than_the_window(self):
+        with self.assertRaises(ValueError):
+            Chunker(None, max_tokens=10, overlap_tokens=10)
+
+    def test_chunk_ids_pack_doc_id_and_chunk_number(self):
+        store = self.load_store()
+        table = ChunkTable.build(store, self.chunker, np.arange(len(store)))
+        np.testing.assert_array_equal(table.ids >> CHUNK_NUMBER_BITS, table.doc_ids)
+        np.testing.assert_array_equal(table.ids & ((1 << CHUNK_NUMBER_BITS) - 1), table.chunk_numbers)
+        for doc_id in store.doc_ids:
+            rows = table.rows_for_doc_id(int(doc_id))
+            self.assertEqual(table.chunk_numbers[rows].tolist(), list(range(len(rows))))
+            self.assertEqual(set(table.doc_ids[rows].tolist()), {int(doc_id)})
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = KeywordMatcher({
+            'public_transport': ['bus', 'namma metro', 'fare'], 'local_safety': ['fir', 'police'], 'general_news': [],
+        })
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertTrue(self.matcher.matches('public_transport', 'A BMTC bus broke down.'))
+        self.assertFalse(self.matcher.matches('public_transport', 'Business leaders met the minister.'))
+        self.assertFalse(self.matcher.matches('public_transport', 'The airbus landed.'))
+        self.assertTrue(self.matcher.matches('local_safety', 'An FIR was filed on Monday.'))
+        self.assertFalse(self.matcher.matches('local_safety', 'The first phase opens soon.'))
+
+    def test_plurals_and_multi_word_keywords(self):
+        self.assertTrue(self.matcher.matches('public_transport', 'Ten new buses were added.'))
+        self.assertTrue(self.matcher.matches('public_transport', 'Metro fares rise.'))
+        self.assertTrue(self.matcher.matches('local_safety', 'Two FIRs were registered.'))
+        self.assertTrue(self.matcher.matches('public_transport', 'Namma\n  Metro extends its line.'))
+        self.assertFalse(self.matcher.matches('public_transport', 'The metro extends its line.'))
+        self.assertFalse(self.matcher.matches('local_safety', 'Policeman on duty.'))
+
+    def test_agents_without_keywords_match_everything(self):
+        self.assertIsNone(compile_keywords([' ']))
+        self.assertTrue(self.matcher.matches('general_news', 'Anything at all.'))
+        self.assertTrue(self.matcher.matches('unknown_agent', 'Anything at all.'))
+
+    def test_cached_result_is_per_passage(self):
+        self.assertTrue(self.matcher.matches('public_transport', 'Bus strike.', doc_id=7))
+        self.assertFalse(self.matcher.matches('public_transport', 'Business news.', doc_id=7))
+        self.assertTrue(self.matcher.matches('public_transport', 'Bus strike.', doc_id=7))
+
+
+def shingle_jaccard(first, second):
+    """Exact Jaccard similarity of the word shingle sets MinHash estimates."""
+    def shingles(text):
+        words = re.findall(r'\w+', text.lower())
+        return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    first, second = shingles(first), shingles(second)
+    return len(first & second) / len(first | second)
+
+
+class NearDuplicateTests(CorpusTestCase):
+    SHARED = 'The BBMP commissioner said the work would be completed before the monsoon.'
+    WIRE = ' '.join(f'Residents of ward {n} reported potholes on the main road near the market.' for n in range(6))
+    SYNDICATED = WIRE[:-len('market.')] + 'bus stand.' # only the last shingles differ
+    OTHER = ('Metro commuters waited for an hour at Majestic after a signal failure. ' + SHARED +
+             ' Officials apologised and promised compensation to pass holders.')
+    UNRELATED = ('A new lake rejuvenation plan was unveiled for Hebbal. ' + SHARED +
+                 ' Volunteers will plant saplings along the bund this weekend.')
+
+    def test_near_duplicate_is_grouped_with_the_first_copy(self):
+        self.assertGreater(shingle_jaccard(self.WIRE, self.SYNDICATED), 0.85)
+        self.assertAlmostEqual(
+            float(np.mean(minhash_signature(self.WIRE) == minhash_signature(self.SYNDICATED))),
+            shingle_jaccard(self.WIRE, self.SYNDICATED), delta=0.15,
+        )
+        dedup = NearDuplicateIndex(threshold=0.8)
+        self.assertEqual(dedup.canonical_id(1, self.WIRE), 1)
+        self.assertEqual(dedup.canonical_id(2, self.SYNDICATED), 1)
+        self.assertEqual(dedup.duplicates, 1)
+
+    def test_articles_sharing_a_few_shingles_stay_distinct(self):
+        jaccard = shingle_jaccard(self.OTHER, self.UNRELATED)
+        self.assertGreater(jaccard, 0.0)
+        self.assertLess(jaccard, 0.3)
+        dedup = NearDuplicateIndex(threshold=0.8)
+        self.assertEqual([dedup.canonical_id(doc_id, text) for doc_id, text in
+                          ((1, self.OTHER), (2, self.UNRELATED), (3, self.WIRE), (4, ''))], [1, 2, 3, 4])
+        self.assertEqual(dedup.duplicates, 0)
+
+    def test_snapshot_records_duplicates_on_the_canonical_article(self):
+        articles = [(201, 'Potholes on main road', self.WIRE, '2025-01-02 08:00', 'News', 'Civic'),
+                    (202, 'Potholes reported', self.SYNDICATED, '2025-01-03 08:00', 'News', 'Civic'),
+                    (203, 'Lake plan', self.UNRELATED, '2025-01-04 08:00', 'News', 'Civic')]
+        store = self.load_store(articles, dedup_threshold=0.8)
+        canonical = store.doc_ids[store.canonical_mask].tolist()
+        self.assertEqual(canonical, [201, 203])
+        document = store.get_batch(np.flatnonzero(store.doc_ids == 201))[0]
+        self.assertEqual(list(document['duplicate_doc_ids']), [202])
+
+
+class IncrementalSyncTests(CorpusTestCase):
+    def test_edited_article_is_re_embedded_in_place(self):
+        self.builder(self.load_store()).build()
+        edited = list(ARTICLES)
+        edited[2] = (103, 'Metro line opens', 'The purple line extension to Whitefield opens to commuters.',
+                     '2025-02-28 23:30', 'News', 'Transport')
+        index, chunks, stats = self.builder(self.load_store(edited)).build()
+
+        self.assertEqual(stats['embedded_docs'], 1)
+        self.assertEqual(stats['removed_docs'], 1)
+        self.assertEqual(index.ntotal, len(chunks))
+        self.assertEqual(self.nearest_doc_id(index, chunks, 'purple line extension to Whitefield'), 103)
+        rebuilt, rebuilt_chunks, _ = self.builder(self.load_store(edited)).build(rebuild=True)
+        np.testing.assert_array_equal(np.sort(chunks.ids), np.sort(rebuilt_chunks.ids))
+
+    def test_unchanged_export_embeds_nothing(self):
+        store = self.load_store()
+        self.builder(store).build()
+        encoded = self.model.encoded
+        _, _, stats = self.builder(store).build()
+        self.assertEqual((stats['embedded_docs'], stats['removed_docs']), (0, 0))
+        self.assertEqual(self.model.encoded, encoded)
+
+    def test_deleted_article_is_removed(self):
+        self.builder(self.load_store()).build()
+        index, chunks, stats = self.builder(self.load_store(ARTICLES[:-1])).build()
+        self.assertEqual(stats['removed_docs'], 1)
+        self.assertNotIn(105, set(chunks.doc_ids.tolist()))
+        self.assertEqual(index.ntotal, len(chunks))
+
+
+class EmbeddingCacheTests(CorpusTestCase):
+    def test_rebuild_with_unchanged_texts_reads_the_cache(self):
+        store = self.load_store()
+        _, chunks, stats = self.builder(store).build()
+        encoded = self.model.encoded
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (0, len(chunks)))
+
+        # A new index type over the same chunks embeds nothing
+        _, rebuilt_chunks, stats = self.builder(store, index_spec='HNSW8').build(rebuild=True)
+        self.assertEqual(self.model.encoded, encoded)
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (len(rebuilt_chunks), 0))
+
+    def test_only_new_texts_reach_the_model(self):
+        self.builder(self.load_store()).build()
+        encoded = self.model.encoded
+        edited = ARTICLES[:-1] + [(105, 'Undated civic notice', 'Water supply resumes on Friday.', None, 'News', 'Civic')]
+        _, chunks, stats = self.builder(self.load_store(edited)).build(rebuild=True)
+        self.assertEqual(self.model.encoded - encoded, len(chunks.rows_for_doc_id(105)))
+        self.assertEqual(stats['cache_misses'], len(chunks.rows_for_doc_id(105)))
+
+
+class CorpusSnapshotTests(CorpusTestCase):
+    def load_quietly(self, articles, mtime_ns):
+        # Explicit mtimes: two writes within one filesystem timestamp tick would look unchanged
+        write_export(self.csv_path, articles)
+        os.utime(self.csv_path, ns=(mtime_ns, mtime_ns))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            store = DocumentStore.from_snapshot(*load_snapshot(
+                self.csv_path, os.path.join(self.directory, 'snapshot'), dedup_threshold=None,
+            ))
+        return store, output.getvalue()
+
+    def title_of(self, store, doc_id):
+        return store.get_batch(np.flatnonzero(store.doc_ids == doc_id))[0]['title']
+
+    def test_snapshot_is_recompiled_when_the_csv_content_changes(self):
+        store, output = self.load_quietly(ARTICLES, 10 ** 18)
+        self.assertIn('Compiling corpus snapshot', output)
+
+        # An edit that keeps the file size forces the CSV to be hashed
+        edited = [(101, 'Metro fare hikE') + ARTICLES[0][2:]] + ARTICLES[1:]
+        size = os.stat(self.csv_path).st_size
+        edited_store, output = self.load_quietly(edited, 10 ** 18 + 1)
+        self.assertEqual(os.stat(self.csv_path).st_size, size)
+        self.assertIn('Compiling corpus snapshot', output)
+        self.assertEqual(self.title_of(edited_store, 101), 'Metro fare hikE')
+        self.assertNotEqual(edited_store.snapshot_fingerprint, store.snapshot_fingerprint)
+
+        added_store, output = self.load_quietly(
+            edited + [(106, 'New article', 'Fresh text.', None, 'News', 'Civic')], 10 ** 18 + 2
+        )
+        self.assertIn('Compiling corpus snapshot', output)
+        self.assertEqual(len(added_store), len(ARTICLES) + 1)
+
+    def test_rewritten_but_identical_csv_is_not_recompiled(self):
+        store, _ = self.load_quietly(ARTICLES, 10 ** 18)
+        reloaded, output = self.load_quietly(ARTICLES, 10 ** 18 + 1)
+        self.assertIn('Corpus snapshot is up to date', output)
+        self.assertEqual(reloaded.snapshot_fingerprint, store.snapshot_fingerprint)
+
+
+class SnapshotStalenessTests(CorpusTestCase):
+    # A word-for-word copy of article 101 under a new DOC_ID
+    DUPLICATED = ARTICLES + [(106,) + ARTICLES[0][1:]]
+
+    def manifest(self):
+        return IndexManifest.load(index_artifact_path(os.path.join(self.directory, 'index.faiss'), ''))
+
+    def test_manifest_matches_the_snapshot_it_was_synced_against(self):
+        store = self.load_store()
+        self.builder(store).build()
+        self.assertTrue(self.manifest().matches_corpus(store))
+        self.assertFalse(self.manifest().matches_corpus(self.load_store(ARTICLES[:-1])))
+
+    def test_changed_dedup_threshold_makes_artifacts_stale(self):
+        store = self.load_store(self.DUPLICATED)
+        self.builder(store).build()
+        bm25 = BM25Index.build(store)
+        deduplicated = self.load_store(self.DUPLICATED, dedup_threshold=0.8)
+        # Same CSV, but the copy now collapses into article 101
+        self.assertEqual(deduplicated.source_sha256, store.source_sha256)
+        self.assertEqual(int(deduplicated.canonical_ids[-1]), 101)
+        self.assertFalse(self.manifest().matches_corpus(deduplicated))
+        self.assertFalse(bm25.matches_corpus(deduplicated))
+
+        index, chunks, stats = self.builder(deduplicated).build()
+        self.assertEqual(stats['removed_docs'], 1)
+        self.assertNotIn(106, set(chunks.doc_ids.tolist()))
+        self.assertTrue(self.manifest().matches_corpus(deduplicated))
+
+
+class AnswerCacheVersionTests(CorpusTestCase):
+    def pipeline(self, store, index):
+        # Only the attributes current_index_version reads; the model and LLM are not needed
+        pipeline = RAGPipeline.__new__(RAGPipeline)
+        pipeline.index_file_path = os.path.join(self.directory, 'index.faiss')
+        pipeline.model_name = 'fake-model'
+        pipeline.data, pipeline.index = store, index
+        return pipeline
+
+    def test_index_sync_by_another_process_changes_the_version(self):
+        store = self.load_store()
+        index, _, _ = self.builder(store).build()
+        pipeline = self.pipeline(store, index)
+        version = pipeline.current_index_version()
+        self.assertEqual(pipeline.current_index_version(), version)
+
+        # build_rag_index syncs an edited export while the server keeps its loaded index
+        self.builder(self.load_store(ARTICLES[:-1])).build()
+        self.assertNotEqual(pipeline.current_index_version(), version)
+
+
+class AnswerCacheEncodingTests(PipelineTestCase):
+    def ask(self, pipeline, query):
+        llm = mock.Mock()
+        llm.return_value.chat.completions.create.return_value.choices = [mock.Mock(message=mock.Mock(content='answer'))]
+        with mock.patch('display_app.views.load_rag_components_once', return_value=pipeline), \
+                mock.patch('rag_core.rag_pipeline.OpenAI', llm), contextlib.redirect_stdout(io.StringIO()):
+            self.client.post(reverse('home'), {'user_query': query, 'agent_persona': 'public_transport'})
+        return llm.return_value.chat.completions.create.call_count
+
+    def test_query_is_encoded_once_per_request_without_the_query_cache(self):
+        pipeline = self.pipeline(RAG_QUERY_CACHE_SIZE=0, OPENAI_API_KEY='test-key')
+        self.assertIsNone(pipeline.query_cache)
+        encoded = self.model.encoded
+        self.assertEqual(self.ask(pipeline, 'metro fare hike'), 1)
+        self.assertEqual(self.model.encoded - encoded, 1)
+        # The repeated question is answered from the answer cache, still with a single encode
+        self.assertEqual(self.ask(pipeline, 'metro fare hike'), 0)
+        self.assertEqual(self.model.encoded - encoded, 2)
+
+
+class FullVectorTests(CorpusTestCase):
+    def test_edited_article_gets_new_full_precision_vectors(self):
+        self.builder(self.load_store(), index_spec='SQ8', full_vectors=True).build()
+        # Same DOC_ID and chunk count (one chunk), so the chunk id is unchanged
+        edited = list(ARTICLES)
+        edited[2] = (103, 'Metro line opens', 'Purple line extension to Whitefield opens today.',
+                     '2025-02-28 23:30', 'News', 'Transport')
+        store = self.load_store(edited)
+        builder = self.builder(store, index_spec='SQ8', full_vectors=True)
+        _, chunks, _ = builder.build()
+
+        vectors = builder.load_full_vectors(chunks)
+        rows = chunks.rows_for_doc_id(103)
+        self.assertEqual(len(rows), 1)
+        expected = self.model.encode(chunks.texts(store, rows))
+        stored = vectors.vectors[vectors.rows_for_ids(chunks.ids[rows])]
+        np.testing.assert_allclose(stored, expected, atol=1e-6)
+        distances, chunk_ids = vectors.rerank(self.model.encode(['purple line extension to Whitefield'])[0], chunks.ids)
+        self.assertEqual(int(chunk_ids[0]), int(chunks.ids[rows[0]]))
+
+    def test_unchanged_side_file_is_not_rewritten(self):
+        store = self.load_store()
+        self.builder(store, index_spec='SQ8', full_vectors=True).build()
+        builder = self.builder(store, index_spec='SQ8', full_vectors=True)
+        modified = os.stat(builder.full_vectors_path).st_mtime_ns
+        builder.build()
+        self.assertEqual(os.stat(builder.full_vectors_path).st_mtime_ns, modified)
+
+
+class BinaryIndexTests(PipelineTestCase):
+    def test_hamming_distances_map_onto_squared_l2(self):
+        np.testing.assert_allclose(hamming_to_squared_l2([0, 32, 64], 64), [0.0, 2.0, 4.0], atol=1e-6)
+
+    def test_binary_index_without_full_vectors_still_scores_sensibly(self):
+        with mock.patch('rag_core.index_builder.IndexBuilder.load_full_vectors', side_effect=OSError('missing')):
+            pipeline = self.pipeline(FAISS_INDEX_SPEC='BFlat', RAG_TITLE_CANDIDATES=0, RAG_BM25_CANDIDATES=0)
+        self.assertIsNone(pipeline.full_vectors)
+        results = pipeline.retrieve_relevant_chunks('metro fare report number 12', top_k=5)
+        distances = [result['distance'] for result in results]
+        self.assertEqual(len(results), 5)
+        self.assertEqual(distances, sorted(distances))
+        self.assertTrue(all(0.0 <= distance <= 4.0 for distance in distances))
+        self.assertIn(2012, self.doc_ids(results))
+        self.assertLess(distances[0], 1.0)
+
+
+class IndexSpecFittingTests(CorpusTestCase):
+    def test_spec_is_scaled_to_the_training_points(self):
+        self.assertEqual(fit_index_spec('IVF1024,Flat', 559), 'Flat')
+        self.assertEqual(fit_index_spec('IVF1024,Flat', 5000), 'IVF128,Flat')
+        self.assertEqual(fit_index_spec('IVF1024,Flat', 50000), 'IVF1024,Flat')
+        self.assertEqual(fit_index_spec('IVF256,PQ16', 5000), 'IVF128,SQ8')
+        self.assertEqual(fit_index_spec('PCA128,IVF1024,Flat', 100), 'Flat')
+        self.assertEqual(fit_index_spec('BIVF1024', 559), 'BFlat')
+        self.assertEqual(fit_index_spec('HNSW32', 10), 'HNSW32')
+
+    def test_small_shards_build_with_an_ivf_spec(self):
+        store = self.load_store()
+        builder = ShardedIndexBuilder(
+            os.path.join(self.directory, 'index.faiss'), store, self.model, 'fake-model', self.chunker,
+            period='M', index_spec='IVF1024,Flat', cache_dir=os.path.join(self.directory, 'embeddings'),
+        )
+        index, chunks, _ = builder.build()
+        self.assertEqual(index.ntotal, len(chunks))
+        self.assertEqual(self.nearest_doc_id(index, chunks, 'SSLC exam timetable'), 103)
+        loaded, _, manifests = builder.load()
+        self.assertEqual(loaded.ntotal, index.ntotal)
+        self.assertEqual({manifest.trained_spec for manifest in manifests.values()}, {'Flat'})
+
+
+class SearchFilterTests(CorpusTestCase):
+    def doc_ids(self, store, **filters):
+        return store.doc_ids[SearchFilter(**filters).document_mask(store)].tolist()
+
+    def test_month_upper_bound_covers_the_whole_month(self):
+        store = self.load_store()
+        self.assertEqual(self.doc_ids(store, pubdate_from='2025-02', pubdate_to='2025-02'), [102, 103])
+
+    def test_day_bounds_are_inclusive(self):
+        store = self.load_store()
+        self.assertEqual(self.doc_ids(store, pubdate_from='2025-02-28', pubdate_to='2025-03-01'), [103, 104])
+        self.assertEqual(self.doc_ids(store, pubdate_to='2025-01-08'), [101])
+
+    def test_undated_articles_never_match_a_range(self):
+        store = self.load_store()
+        self.assertNotIn(105, self.doc_ids(store, pubdate_from='1900-01-01'))
+        self.assertIn(105, self.doc_ids(store, news_categories=['Civic']))
+
+    def test_pubdate_bounds(self):
+        lower, upper = SearchFilter(pubdate_from='2025-02', pubdate_to='2025-02').pubdate_bounds()
+        self.assertEqual(lower, np.datetime64('2025-02-01T00:00:00'))
+        self.assertEqual(upper, np.datetime64('2025-03-01T00:00:00'))
+        self.assertEqual(SearchFilter().pubdate_bounds(), (None, None))
+
+    def test_categories(self):
+        store = self.load_store()
+        self.assertEqual(self.doc_ids(store, doc_categories='Feature'), [104])
+        self.assertEqual(self.doc_ids(store, news_categories=['Nope']), [])
+
+
+class BatchingEncoderTests(PipelineTestCase):
+    def test_concurrent_callers_share_batches(self):
+        model = FakeEmbeddingModel()
+        batch_sizes = []
+
+        def encode(texts):
+            batch_sizes.append(len(texts))
+            return model.encode(texts)
+
+        encoder = BatchingEncoder(encode, max_batch=4, max_wait_ms=200)
+        self.addCleanup(encoder.close)
+        texts = [f'metro line {n}' for n in range(8)]
+        vectors = [None] * len(texts)
+        start = threading.Barrier(len(texts))
+
+        def query(n):
+            start.wait()
+            vectors[n] = encoder.encode(texts[n])
+
+        threads = [threading.Thread(target=query, args=(n,)) for n in range(len(texts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Every caller gets its own row back, and no batch exceeds max_batch
+        np.testing.assert_array_equal(np.stack(vectors), model.encode(texts))
+        self.assertEqual(sum(batch_sizes), len(texts))
+        self.assertLessEqual(max(batch_sizes), 4)
+        self.assertLess(len(batch_sizes), len(texts))
+        stats = encoder.stats()
+        self.assertEqual((stats['queries'], stats['batches'], stats['largest_batch']),
+                         (len(texts), len(batch_sizes), max(batch_sizes)))
+
+    def test_pipeline_logs_cache_and_batching_stats(self):
+        pipeline = self.pipeline(RAG_QUERY_BATCH_SIZE=4, RAG_QUERY_STATS_EVERY=3)
+        self.addCleanup(pipeline.query_encoder.close)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            pipeline.retrieve_relevant_chunks('metro fare')
+            pipeline.retrieve_relevant_chunks('rain flood')
+            self.assertNotIn('Query batching:', output.getvalue())
+            pipeline.retrieve_relevant_chunks('Metro  fare')
+        self.assertIn('Query embedding cache: 1 hits, 2 misses', output.getvalue())
+        self.assertIn('Query batching: 2 queries in 2 batches', output.getvalue())
+
+
+class QueryCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'queries')
+        self.model = FakeEmbeddingModel()
+
+    def cache(self, **options):
+        return QueryEmbeddingCache('fake-model', DIMENSION, path=self.path, **options)
+
+    def encode(self, query):
+        return self.model.encode([query])[0]
+
+    def test_saved_entries_are_reloaded(self):
+        cache = self.cache()
+        cache.get('Bangalore  rain', self.encode)
+        cache.save()
+        reloaded = self.cache()
+        self.assertEqual(len(reloaded), 1)
+        reloaded.get('bangalore rain', lambda query: self.fail("cached query was encoded again"))
+
+    def test_concurrent_saves_leave_a_consistent_file(self):
+        # One cache per worker, as in separate server processes sharing the path
+        caches = [self.cache(save_every=1) for _ in range(4)]
+        errors = []
+
+        def work(worker, cache):
+            try:
+                for n in range(25):
+                    cache.get(f'worker {worker} query {n}', self.encode)
+                    self.cache()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=item) for item in enumerate(caches)]
+        # Failed saves and unreadable files are reported as warnings rather than raised
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertNotIn('Warning', output.getvalue())
+        self.assertEqual([name for name in os.listdir(self.directory)], ['queries.npz'])
+        reloaded = self.cache()
+        self.assertEqual(len(reloaded), 25)
+        for query, vector in reloaded._entries.items():
+            np.testing.assert_allclose(vector, self.encode(query), atol=1e-6)
+
+
+class DateFilterFormTests(SimpleTestCase):
+    def post(self, **fields):
+        pipeline = mock.Mock()
+        pipeline.retrieve_relevant_chunks.return_value = []
+        with mock.patch('display_app.views.load_rag_components_once', return_value=pipeline):
+            response = self.client.post(reverse('home'), {'user_query': 'metro fares', **fields})
+        return response, pipeline
+
+    def test_invalid_date_shows_a_form_error(self):
+        response, pipeline = self.post(date_from='garbage')
+        self.assertContains(response, 'must be a date in YYYY-MM-DD format')
+        pipeline.retrieve_relevant_chunks.assert_not_called()
+
+    def test_reversed_range_shows_a_form_error(self):
+        response, pipeline = self.post(date_from='2025-03-01', date_to='2025-02-01')
+        self.assertContains(response, 'must not be later than')
+        pipeline.retrieve_relevant_chunks.assert_not_called()
+
+    def test_valid_range_is_passed_to_the_search(self):
+        response, pipeline = self.post(date_from='2025-02-01', date_to='2025-02-28', agent_persona='general_news')
+        self.assertEqual(response.status_code, 200)
+        filters = pipeline.retrieve_relevant_chunks.call_args.kwargs['filters']
+        self.assertEqual(filters, {'pubdate_from': '2025-02-01', 'pubdate_to': '2025-02-28'})
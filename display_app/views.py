@@ -1,7 +1,9 @@
 import os
+from datetime import date
 import pandas as pd # Although pandas is mostly used in rag_pipeline, it's good to keep if direct data interaction were here
 from django.shortcuts import render
 from django.conf import settings # To access settings like API key and file paths
+from rag_core.keyword_matcher import KeywordMatcher
 from rag_core.rag_pipeline import RAGPipeline # Import your RAG pipeline class
 
 # --- Global variable to hold RAGPipeline instance ---
@@ -17,7 +19,8 @@ def load_rag_components_once():
     if _rag_pipeline is None:
         csv_path = settings.CSV_FILE_PATH
         index_path = settings.FAISS_INDEX_PATH
-        _rag_pipeline = RAGPipeline(csv_path, index_path)
+        snapshot_dir = settings.CORPUS_SNAPSHOT_DIR
+        _rag_pipeline = RAGPipeline(csv_path, index_path, snapshot_dir, agent_keywords=agent_filter_keywords())
         print("RAG Pipeline components loaded successfully!") # For debugging
     return _rag_pipeline
 
@@ -103,27 +106,55 @@ AGENT_CONFIGS = {
     # Add other agent configurations here if needed
 }
 
+def agent_filter_keywords():
+    """Maps each agent with keywords_for_filtering to its keywords; articles are tagged with these at ingest."""
+    return {
+        agent_id: config["keywords_for_filtering"]
+        for agent_id, config in AGENT_CONFIGS.items() if config.get("keywords_for_filtering")
+    }
+
+# Each agent's keywords compiled once into a word-boundary regex; results are cached per DOC_ID and passage
+_keyword_matcher = KeywordMatcher(agent_filter_keywords())
+
 def get_specialized_context_for_agent(query_text, agent_id, all_chunks, top_n=3):
     """
     Filters retrieved chunks based on keywords relevant to the selected agent.
-    This helps provide more targeted context to the LLM.
+    This helps provide more targeted context to the LLM. Only used when the pipeline
+    has no precomputed document set for the agent (agent tags missing).
     """
     agent_config = AGENT_CONFIGS.get(agent_id)
     # If agent_id not found or no specific keywords, return a default number of chunks
     if not agent_config or not agent_config.get("keywords_for_filtering"):
         return all_chunks[:top_n]
 
-    keywords = [keyword.lower() for keyword in agent_config["keywords_for_filtering"]]
     filtered_chunks = []
 
     for chunk in all_chunks:
-        text_lower = chunk['chunk_text'].lower()
-        if any(keyword in text_lower for keyword in keywords):
+        # Whole-word match, so 'bus' does not pick up 'business' nor 'fir' 'first'
+        if _keyword_matcher.matches(agent_id, chunk['chunk_text'], doc_id=chunk.get('doc_id')):
             filtered_chunks.append(chunk)
 
     # Return up to top_n of the filtered chunks
     return filtered_chunks[:top_n]
 
+def validate_date_range(date_from, date_to):
+    """
+    Checks the optional YYYY-MM-DD bounds of the date filter form fields.
+    Returns an error message for the form, or None when the range is usable.
+    """
+    parsed = []
+    for label, value in (("Published from", date_from), ("Published to", date_to)):
+        if not value:
+            parsed.append(None)
+            continue
+        try:
+            parsed.append(date.fromisoformat(value))
+        except ValueError:
+            return f"{label} must be a date in YYYY-MM-DD format (got '{value}')."
+    if parsed[0] and parsed[1] and parsed[0] > parsed[1]:
+        return "Published from must not be later than Published to."
+    return None
+
 def home_view(request):
     """
     Handles the main web page for the RAG application.
@@ -133,15 +164,28 @@ def home_view(request):
     answer = None
     selected_agent_id = request.POST.get('agent_persona', 'general_news') # Get selected agent from form
     user_query = request.POST.get('user_query', '').strip() # Get user query from form, strip whitespace
+    # Optional publication date range (YYYY-MM-DD, both ends inclusive), applied inside the index search
+    date_from = request.POST.get('date_from', '').strip()
+    date_to = request.POST.get('date_to', '').strip()
+    date_error = validate_date_range(date_from, date_to)
 
-    if request.method == 'POST' and user_query: # Only process if it's a POST request and query is not empty
+    if request.method == 'POST' and user_query and not date_error: # Only process a POST with a query and valid dates
         print(f"User Query: '{user_query}' with Agent: '{selected_agent_id}'") # Debugging
         
-        # 1. Retrieve initial broad relevant chunks from the FAISS index
-        retrieved_chunks = rag_pipeline.retrieve_relevant_chunks(user_query, top_k=7) # Get more chunks initially
+        # 1. Retrieve relevant chunks from the FAISS index, searching only the agent's own articles.
+        # The query is encoded once and the embedding reused for the answer cache lookup.
+        query_embedding = rag_pipeline.encode_query(user_query) if rag_pipeline.model is not None else None
+        filters = {'pubdate_from': date_from or None, 'pubdate_to': date_to or None}
+        retrieved_chunks = rag_pipeline.retrieve_relevant_chunks(
+            user_query, top_k=7, filters=filters, agent_id=selected_agent_id, query_embedding=query_embedding
+        )
 
         # 2. Apply agent-specific context filtering
-        if selected_agent_id != 'general_news':
+        if rag_pipeline.scopes_agent(selected_agent_id):
+            # The search was already limited to this agent's articles
+            specialized_context = retrieved_chunks[:3]
+            system_prompt = AGENT_CONFIGS[selected_agent_id]["system_prompt"]
+        elif selected_agent_id != 'general_news':
             specialized_context = get_specialized_context_for_agent(
                 user_query, selected_agent_id, retrieved_chunks, top_n=3 # Pass filtered chunks to LLM
             )
@@ -157,7 +201,10 @@ def home_view(request):
             answer = "I'm sorry, I couldn't find relevant information in the news for your query, even with the selected agent's focus."
         else:
             # 3. Generate answer using the LLM with the specialized context and system prompt
-            answer = rag_pipeline.generate_answer_with_llm(user_query, specialized_context, system_prompt)
+            answer = rag_pipeline.generate_answer_with_llm(
+                user_query, specialized_context, system_prompt, agent_id=selected_agent_id,
+                query_embedding=query_embedding,
+            )
         
         print(f"Generated Answer: {answer[:100]}...") # Debugging
 
@@ -166,7 +213,10 @@ def home_view(request):
         'answer': answer,
         'agent_configs': AGENT_CONFIGS,
         'selected_agent': selected_agent_id,
-        'user_query': user_query # To re-populate the query box after submission
+        'user_query': user_query, # To re-populate the query box after submission
+        'date_from': date_from,
+        'date_to': date_to,
+        'date_error': date_error,
     })
 
 # Note: display_app/admin.py, display_app/apps.py, display_app/models.py, display_app/tests.py can be left empty
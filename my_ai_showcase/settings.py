@@ -94,5 +94,103 @@ OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', 'YOUR_OPENAI_API_KEY')
 # Path to your CSV file
 CSV_FILE_PATH = os.path.join(BASE_DIR, 'kf_docmnt_export.csv')
 
+# Directory for the columnar snapshot compiled from the CSV (rebuilt when the CSV changes)
+CORPUS_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'corpus_snapshot')
+
+# CSV rows parsed per block while compiling the snapshot; bounds ingestion memory for large exports
+RAG_INGEST_BLOCK_ROWS = 5000
+# Near-duplicate (syndicated / re-published) articles whose estimated MinHash Jaccard similarity
+# reaches this threshold are collapsed onto one canonical copy at ingest. None disables it.
+RAG_DEDUP_THRESHOLD = 0.8
+
 # Path to your FAISS index file
-FAISS_INDEX_PATH = os.path.join(BASE_DIR, 'bangalore_news_index.faiss')
\ No newline at end of file
+FAISS_INDEX_PATH = os.path.join(BASE_DIR, 'bangalore_news_index.faiss')
+
+# faiss.index_factory spec for the chunk index: 'Flat' (exact), 'IVF1024,Flat', 'HNSW32', 'IVF1024,PQ16', ...
+# Binary specs ('BFlat', 'BIVF1024', 'BHNSW32') index sign bits (48 bytes per chunk) with Hamming search and
+# re-score FAISS_RERANK_CANDIDATES hits (default 300) against the full-precision vector file.
+# Changing it rebuilds the index from the embedding cache. IVF/PQ indexes are trained on up to
+# FAISS_TRAIN_SAMPLE chunk vectors; HNSW cannot delete, so removals trigger a rebuild.
+FAISS_INDEX_SPEC = 'Flat'
+FAISS_TRAIN_SAMPLE = 50000
+# Default search knobs (overridable per request): IVF lists probed, HNSW candidate list size
+FAISS_NPROBE = 16
+FAISS_EF_SEARCH = 64
+# With a quantized spec ('SQfp16', 'SQ8', 'PQ48', 'IVF1024,SQ8', ...) the top FAISS_RERANK_CANDIDATES
+# chunk hits are re-scored against float32 vectors kept in a memory-mapped side file; 0 disables this
+FAISS_RERANK_CANDIDATES = 0
+# Optional trained transform applied to chunk vectors before indexing and to queries at search time,
+# e.g. 'PCA128' (384 -> 128 dims, ~3x less scan work and memory per vector) or 'OPQ16_128' in front of
+# a PQ spec. Final candidates are re-scored at full dimension (FAISS_RERANK_CANDIDATES, default 300).
+FAISS_TRANSFORM = None
+# Web processes memory-map the prebuilt index, chunk table and vector side file read-only, so
+# gunicorn/uwsgi workers share page-cache pages instead of each holding a copy
+FAISS_MMAP_INDEX = True
+# Optionally split the index into one shard per DOC_PUBDATE period ('Y', 'M', 'W' or 'D'; None keeps a
+# single index) under bangalore_news_index.shards/. Ingest only rewrites shards whose articles changed,
+# past shards stay memory-mapped, and date-filtered searches only visit the shards in range. Searches
+# fan out over FAISS_SHARD_SEARCH_THREADS threads. Each shard trains on its own articles only, so IVF
+# list counts and PQ codes are scaled down per shard (a month of a few hundred articles gets 'Flat').
+FAISS_SHARD_PERIOD = None
+FAISS_SHARD_SEARCH_THREADS = 4
+# BM25 over DOC_TITL + DOC_DET (bangalore_news_index.bm25/) catches rare names such as MUDA, BMRCL or
+# FIR numbers that dense embeddings miss. Its top RAG_BM25_CANDIDATES articles are merged with the FAISS
+# results by reciprocal-rank fusion (each list adds 1 / (RAG_RRF_K + rank)); 0 disables lexical search.
+RAG_BM25_CANDIDATES = 20
+RAG_RRF_K = 60
+# Headlines (DOC_TITL) get their own vector index (bangalore_news_index.titles.faiss, one vector per
+# article). The top RAG_TITLE_CANDIDATES titles are combined with the body chunk hits per article:
+# 'max' or 'sum' of the body similarity and RAG_TITLE_WEIGHT * title similarity. When at least top_k
+# titles reach RAG_TITLE_FIRST_SIMILARITY (cosine), the chunk index is skipped. 0 candidates disables it.
+RAG_TITLE_CANDIDATES = 20
+RAG_TITLE_WEIGHT = 0.9
+RAG_TITLE_COMBINE = 'max'
+RAG_TITLE_FIRST_SIMILARITY = 0.8
+
+# --- RAG chunking ---
+# Articles are split into sentence-aligned windows of at most RAG_CHUNK_MAX_TOKENS word pieces
+# (all-MiniLM-L6-v2 truncates at 256), with RAG_CHUNK_OVERLAP_TOKENS carried over between windows.
+RAG_CHUNK_MAX_TOKENS = 200
+RAG_CHUNK_OVERLAP_TOKENS = 40
+# Chunk hits fetched per requested article before collapsing hits back onto articles
+RAG_CHUNK_CANDIDATES_PER_RESULT = 4
+
+# --- RAG index ---
+# The snapshot, embeddings and FAISS index are built offline with `python manage.py build_rag_index`;
+# web processes only load them. Set to True to let a web process build missing/stale artifacts itself.
+RAG_BUILD_INDEX_ON_STARTUP = False
+# build_rag_index saves a resumable checkpoint every this many indexing batches
+RAG_CHECKPOINT_EVERY = 10
+RAG_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+# Articles chunked, encoded and appended per add_with_ids call when (re)indexing; together with
+# RAG_INGEST_BLOCK_ROWS this bounds peak memory during ingestion
+RAG_INDEX_BATCH_SIZE = 256
+# Worker processes used to embed chunks during index builds (each loads its own model; 1 = in-process)
+RAG_EMBEDDING_WORKERS = 1
+# Texts per SentenceTransformer.encode batch
+RAG_EMBEDDING_BATCH_SIZE = 32
+# Disk cache of chunk embeddings keyed by (model, chunking config, text hash); defaults to
+# a directory next to the FAISS index. Lets index rebuilds skip model inference entirely.
+RAG_EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, 'embedding_cache')
+# In-memory LRU of query embeddings keyed by model and normalized query text, so repeated questions
+# skip the model (0 disables it). With RAG_QUERY_CACHE_PATH set (e.g.
+# os.path.join(RAG_EMBEDDING_CACHE_DIR, 'queries')), the entries are saved to '<path>.npz' every
+# RAG_QUERY_CACHE_SAVE_EVERY new queries and at exit, and reloaded on restart. Worker processes
+# sharing the path each write the whole file and the last save wins. None keeps it in memory only.
+RAG_QUERY_CACHE_SIZE = 1024
+RAG_QUERY_CACHE_PATH = None
+RAG_QUERY_CACHE_SAVE_EVERY = 20
+# Query encodes arriving from concurrent requests within RAG_QUERY_BATCH_WAIT_MS milliseconds are run
+# through the model together, up to RAG_QUERY_BATCH_SIZE at a time (1 encodes each query on its own)
+RAG_QUERY_BATCH_SIZE = 16
+RAG_QUERY_BATCH_WAIT_MS = 5
+# The query cache and batching counters are printed every RAG_QUERY_STATS_EVERY retrievals (0 disables them)
+RAG_QUERY_STATS_EVERY = 500
+# LLM answers are cached per agent persona in memory (at most RAG_ANSWER_CACHE_SIZE, 0 disables it) and
+# reused for a query whose embedding is at least RAG_ANSWER_CACHE_SIMILARITY (cosine) close to an answered
+# one when their retrieved DOC_IDs overlap by RAG_ANSWER_CACHE_MIN_OVERLAP (Jaccard). Answers expire after
+# RAG_ANSWER_CACHE_TTL seconds and are all dropped when the corpus snapshot or index changes.
+RAG_ANSWER_CACHE_SIZE = 500
+RAG_ANSWER_CACHE_TTL = 3600
+RAG_ANSWER_CACHE_SIMILARITY = 0.95
+RAG_ANSWER_CACHE_MIN_OVERLAP = 0.5
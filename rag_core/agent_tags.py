@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from .document_store import matches_snapshot
+from .index_sync import replace_file, save_json, save_npy
+from .keyword_matcher import MATCH_RULES, KeywordMatcher
+
+AGENT_TAGS_FORMAT_VERSION = 1
+TAG_RECORD_DTYPE = np.dtype([('doc_id', np.int64), ('content_hash', np.uint64), ('agents', np.uint64)])
+# One bit per agent in the uint64 tag of each article
+MAX_AGENTS = 64
+
+
+def keywords_fingerprint(agent_keywords):
+    """Stable hash of the agents, their keyword lists and the matching rules; tags are recomputed when it changes."""
+    payload = json.dumps({
+        'rules': MATCH_RULES,
+        'agents': {agent: sorted(keywords) for agent, keywords in agent_keywords.items()},
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _tagged_agents(agent_keywords):
+    """Lower-cased keywords of the agents that have any (agents without keywords see every article)."""
+    return {agent: [keyword.lower() for keyword in keywords] for agent, keywords in agent_keywords.items() if keywords}
+
+
+def _agent_bits(text, matcher):
+    bits = 0
+    for bit, agent_id in enumerate(matcher.agents):
+        if matcher.matches(agent_id, text):
+            bits |= 1 << bit
+    return bits
+
+
+class AgentTags:
+    """
+    Which agent personas each article belongs to, computed once at ingest from the
+    agents' keywords_for_filtering (matched as whole words against title and text,
+    like the per-passage filter). Records are (DOC_ID, content hash, agent bitmask) in
+    '<index>.agents.npy' with the agent order in '<index>.agents.json', so a
+    persona's search can be restricted to its articles through an ID selector.
+    """
+
+    def __init__(self, records, agents, fingerprint, snapshot_fingerprint=None):
+        self.records = records
+        self.agents = agents # agent ids in bit order
+        self.fingerprint = fingerprint
+        self.snapshot_fingerprint = snapshot_fingerprint
+        self.positions = None
+        self._masks = {}
+
+    @staticmethod
+    def _paths(base_path):
+        return base_path + '.agents.npy', base_path + '.agents.json'
+
+    @classmethod
+    def build(cls, store, agent_keywords, previous=None, block_rows=5000):
+        """
+        Tags every article in the store. Articles whose DOC_ID and content hash are
+        unchanged since the previous tags (built with the same keywords) keep their tag.
+        """
+        agent_keywords = _tagged_agents(agent_keywords)
+        if len(agent_keywords) > MAX_AGENTS:
+            raise ValueError(f"at most {MAX_AGENTS} agents can be tagged, got {len(agent_keywords)}")
+        fingerprint = keywords_fingerprint(agent_keywords)
+        records = np.empty(len(store), dtype=TAG_RECORD_DTYPE)
+        records['doc_id'] = store.doc_ids
+        records['content_hash'] = store.content_hashes
+        todo = np.ones(len(store), dtype=bool)
+        if previous is not None and previous.fingerprint == fingerprint and len(previous.records):
+            old = previous.records
+            order = np.argsort(old['doc_id'], kind='stable')
+            slots = np.minimum(np.searchsorted(old['doc_id'][order], records['doc_id']), len(old) - 1)
+            matches = old[order[slots]]
+            reuse = (matches['doc_id'] == records['doc_id']) & (matches['content_hash'] == records['content_hash'])
+            records['agents'][reuse] = matches['agents'][reuse]
+            todo = ~reuse
+
+        matcher = KeywordMatcher(agent_keywords, cache_size=0)
+        positions = np.flatnonzero(todo)
+        for start in range(0, len(positions), block_rows):
+            block = positions[start:start + block_rows]
+            titles = store.texts('title', int(block[0]), int(block[-1]) + 1)
+            contents = store.texts('content', int(block[0]), int(block[-1]) + 1)
+            for position in block:
+                offset = position - block[0]
+                records['agents'][position] = _agent_bits(titles[offset] + '\n' + contents[offset], matcher)
+        tags = cls(records, list(agent_keywords), fingerprint, store.snapshot_fingerprint)
+        tags.bind(store)
+        return tags
+
+    @classmethod
+    def load(cls, base_path):
+        records_path, meta_path = cls._paths(base_path)
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != AGENT_TAGS_FORMAT_VERSION:
+            raise ValueError(f"unsupported agent tags version {meta.get('format_version')}")
+        records = np.load(records_path, mmap_mode='r')
+        if records.dtype != TAG_RECORD_DTYPE or len(records) != meta['tagged_docs']:
+            raise ValueError("agent tag records do not match their metadata")
+        return cls(records, meta['agents'], meta['fingerprint'], meta.get('snapshot_fingerprint'))
+
+    def save(self, base_path):
+        records_path, meta_path = self._paths(base_path)
+        replace_file(records_path, lambda path: save_npy(path, self.records))
+        meta = {
+            'format_version': AGENT_TAGS_FORMAT_VERSION,
+            'agents': self.agents,
+            'fingerprint': self.fingerprint,
+            'snapshot_fingerprint': self.snapshot_fingerprint,
+            'tagged_docs': len(self.records),
+        }
+        replace_file(meta_path, lambda path: save_json(path, meta))
+
+    def is_current(self, store, agent_keywords):
+        """Whether these tags were computed for exactly this snapshot and these keywords."""
+        agent_keywords = _tagged_agents(agent_keywords)
+        return (
+            self.fingerprint == keywords_fingerprint(agent_keywords)
+            and matches_snapshot(self.snapshot_fingerprint, store)
+        )
+
+    def bind(self, store):
+        self.positions = store.positions_for_doc_ids(self.records['doc_id'])
+        self._masks = {}
+
+    def document_mask(self, agent_id, store_size):
+        """Boolean mask over document store positions of the agent's articles (None for untagged agents)."""
+        if agent_id not in self.agents:
+            return None
+        if agent_id not in self._masks:
+            bit = np.uint64(1 << self.agents.index(agent_id))
+            tagged = (self.records['agents'] & bit) != 0
+            mask = np.zeros(store_size, dtype=bool)
+            known = self.positions >= 0
+            mask[self.positions[known]] = tagged[known]
+            self._masks[agent_id] = mask
+        return self._masks[agent_id]
+
+
+def update_agent_tags(base_path, store, agent_keywords):
+    """Loads the agent tags next to the index, re-tagging changed articles when they are stale."""
+    previous = None
+    if os.path.exists(AgentTags._paths(base_path)[1]):
+        try:
+            previous = AgentTags.load(base_path)
+            if previous.is_current(store, agent_keywords):
+                previous.bind(store)
+                return previous
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable agent tags at {base_path}.agents.npy: {e}")
+            previous = None
+    print("Tagging articles with agent personas...")
+    tags = AgentTags.build(store, agent_keywords, previous)
+    tags.save(base_path)
+    counts = ", ".join(f"{agent}: {int(tags.document_mask(agent, len(store)).sum())}" for agent in tags.agents)
+    print(f"Agent tags saved ({counts}).")
+    return tags
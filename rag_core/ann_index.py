@@ -0,0 +1,206 @@
+import re
+
+import faiss
+import numpy as np
+
+from .binary_index import BinaryCodeIndex, is_binary_spec
+
+# faiss.index_factory vector transforms that can prefix a spec ('PCA128,Flat', 'OPQ16_128,IVF1024,PQ16')
+TRANSFORM_PREFIXES = ('PCA', 'OPQ', 'ITQ', 'RR')
+# Training points k-means needs per IVF list / PQ centroid for useful clusters (below this FAISS warns)
+MIN_POINTS_PER_CENTROID = 39
+# IVF indexes with fewer lists than this are replaced by a flat scan of the same codes
+MIN_IVF_LISTS = 16
+
+
+def has_transform(spec):
+    """Whether the spec reduces or rotates vectors before indexing them."""
+    return spec.split(',')[0].startswith(TRANSFORM_PREFIXES)
+
+
+def compose_spec(spec, transform=None):
+    """
+    Index spec with an optional trained transform prefixed (e.g. 'PCA128' + 'IVF1024,Flat').
+    The transform is applied to vectors when indexing and to queries when searching.
+    """
+    if not transform:
+        return spec
+    if is_binary_spec(spec):
+        raise ValueError(f"transform '{transform}' cannot be combined with binary index spec '{spec}'")
+    if has_transform(spec):
+        raise ValueError(f"index spec '{spec}' already starts with a transform")
+    return f"{transform},{spec}"
+
+
+def _ivf_lists(training_points, nlist):
+    """Largest power of two up to nlist that leaves MIN_POINTS_PER_CENTROID points per list (0 when too few)."""
+    lists = training_points // MIN_POINTS_PER_CENTROID
+    if lists >= nlist:
+        return nlist
+    if lists < MIN_IVF_LISTS:
+        return 0
+    return 1 << (int(lists).bit_length() - 1)
+
+
+def fit_index_spec(spec, training_points):
+    """
+    The spec scaled to an index trained on training_points vectors, so a small corpus
+    or shard does not fail k-means training: IVF list counts are lowered to a power of
+    two with MIN_POINTS_PER_CENTROID points per list (or the IVF level is dropped for
+    a flat scan), PQ codes needing more training points than there are fall back to
+    SQ8, and PCA/OPQ transforms that cannot be trained are dropped. Specs without
+    training ('Flat', 'HNSW32', 'SQ8') and specs the data is large enough for come
+    back unchanged. Power-of-two steps keep the fitted spec stable while a corpus grows.
+    """
+    parts = []
+    for part in spec.split(','):
+        ivf = re.match(r'(B?)IVF(\d+)(.*)$', part)
+        pq = re.match(r'(?:OPQ|PQ)(\d+)(?:x(\d+))?', part)
+        pca = re.match(r'PCAR?W?(\d+)', part)
+        if ivf:
+            lists = _ivf_lists(training_points, int(ivf.group(2)))
+            if lists:
+                parts.append(f"{ivf.group(1)}IVF{lists}{ivf.group(3)}")
+            elif ivf.group(1):
+                parts.append('BFlat')
+            continue
+        if pq and training_points < MIN_POINTS_PER_CENTROID * (1 << int(pq.group(2) or 8)):
+            if part.startswith('PQ'):
+                parts.append('SQ8')
+            continue
+        if pca and training_points < int(pca.group(1)):
+            continue
+        parts.append(part)
+    # A spec reduced to a transform alone (or nothing) still needs an index after it
+    if not parts or has_transform(parts[-1]):
+        parts.append('Flat')
+    return ','.join(parts)
+
+
+def create_index(dimension, spec='Flat'):
+    """
+    Empty index built from a faiss.index_factory spec (e.g. 'Flat', 'IVF1024,Flat',
+    'HNSW32', 'IVF256,PQ16') whose vectors are addressed by chunk id rather than by row.
+    Binary specs ('BFlat', 'BIVF1024', 'BHNSW32') give a BinaryCodeIndex over sign bits.
+    """
+    if is_binary_spec(spec):
+        return BinaryCodeIndex.create(dimension, spec)
+    index = faiss.index_factory(dimension, spec)
+    # IVF lists store the ids themselves (and IndexIDMap2 would mis-track their
+    # removals); every other index type gets an id map on top
+    if faiss.try_extract_index_ivf(index) is None:
+        index = faiss.IndexIDMap2(index)
+    return index
+
+
+def read_index(path, mmap=False, binary=False):
+    """
+    Reads an index from disk (binary=True for indexes created from a binary spec).
+    With mmap, its vectors/codes are memory-mapped read-only instead of copied onto
+    the heap, so every process loading the same file shares the page cache. A mapped
+    index must never be modified (FAISS aborts on writes to mapped storage); the
+    build path always loads with mmap=False.
+    """
+    reader = faiss.read_index_binary if binary else faiss.read_index
+    index = None
+    if mmap:
+        last_error = None
+        # IO_FLAG_MMAP_IFC maps flat codes (Flat, SQ, PQ, HNSW storage); IO_FLAG_MMAP maps IVF lists
+        for flag_name in ('IO_FLAG_MMAP_IFC', 'IO_FLAG_MMAP'):
+            flag = getattr(faiss, flag_name, None)
+            if flag is None:
+                continue
+            try:
+                index = reader(path, flag | faiss.IO_FLAG_READ_ONLY)
+                break
+            except RuntimeError as e:
+                last_error = e
+        if index is None:
+            print(f"Warning: Could not memory-map FAISS index {path} ({last_error}); loading it into memory instead.")
+    if index is None:
+        index = reader(path)
+    return BinaryCodeIndex(index) if binary else index
+
+
+def write_index(index, path):
+    if isinstance(index, BinaryCodeIndex):
+        faiss.write_index_binary(index.index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def is_id_keyed(index):
+    """Whether add_with_ids/remove_ids address the index by chunk id."""
+    if isinstance(index, BinaryCodeIndex):
+        return True
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or faiss.try_extract_index_ivf(index) is not None
+
+
+def supports_removal(index):
+    """Whether remove_ids works on this index type (graph indexes such as HNSW cannot delete)."""
+    try:
+        index.remove_ids(faiss.IDSelectorBatch(np.empty(0, dtype=np.int64)))
+        return True
+    except RuntimeError:
+        return False
+
+
+def applies_selector(index):
+    """
+    Whether search_parameters can restrict a search on this index with an ID selector.
+    Flat PQ and binary IVF searches cannot, so their callers have to over-fetch and
+    filter the hits themselves.
+    """
+    if isinstance(index, BinaryCodeIndex):
+        return index.applies_selector
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return not isinstance(index, faiss.IndexPQ)
+
+
+def search_parameters(index, nprobe=None, ef_search=None, selector=None):
+    """
+    Per-request search parameters for whichever index type sits under the id map and
+    any pre-transform: nprobe for IVF indexes, efSearch for HNSW, and an optional
+    faiss.IDSelector restricting the search to some chunk ids. Returns None when
+    there is nothing to set, so callers can pass it straight to
+    index.search(..., params=...).
+    """
+    if isinstance(index, BinaryCodeIndex):
+        return index.search_parameters(nprobe, ef_search, selector)
+    id_map = None
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        # The id map translates a top-level selector to the inner index's row numbers
+        id_map = index.id_map
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        # ...but not one nested in the pre-transform's index_params, so translate it here
+        inner_selector = selector
+        if selector is not None and id_map is not None:
+            inner_selector = faiss.IDSelectorTranslated(id_map, selector)
+        params = search_parameters(faiss.downcast_index(index.index), nprobe, ef_search, inner_selector)
+        if params is None:
+            return None
+        params = faiss.SearchParametersPreTransform(index_params=params)
+        # SWIG does not keep the selectors alive through the C++ pointers alone
+        params.referenced_objects = [selector, inner_selector]
+        return params
+    if nprobe is None and ef_search is None and selector is None:
+        return None
+    if isinstance(index, faiss.IndexPQ):
+        # Flat PQ search takes no parameters at all, so the selector is dropped and callers filter the hits
+        return None
+    # Unset knobs keep the index's own setting rather than the SearchParameters default
+    if isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(nprobe=nprobe or index.nprobe)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
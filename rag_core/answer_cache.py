@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+def document_overlap(doc_ids, other_doc_ids):
+    """Jaccard overlap of two sets of DOC_IDs (1.0 when both are empty)."""
+    doc_ids, other_doc_ids = set(doc_ids), set(other_doc_ids)
+    if not doc_ids and not other_doc_ids:
+        return 1.0
+    return len(doc_ids & other_doc_ids) / len(doc_ids | other_doc_ids)
+
+
+class _CachedAnswer:
+    __slots__ = ('agent_id', 'doc_ids', 'answer', 'created')
+
+    def __init__(self, agent_id, doc_ids, answer, created):
+        self.agent_id = agent_id
+        self.doc_ids = frozenset(doc_ids)
+        self.answer = answer
+        self.created = created
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of LLM answers keyed by query meaning rather than query text.
+    Each agent persona has a small inner-product FAISS index of the query
+    embeddings it answered (the embeddings are unit length, so scores are cosine
+    similarities). A new query reuses an answer when it is at least
+    similarity_threshold close to a cached query of the same agent and the
+    articles retrieved for it overlap the cached answer's articles by at least
+    min_overlap (Jaccard over DOC_IDs), so a paraphrase reuses the answer but a
+    query whose context has moved on does not. Entries expire after ttl_seconds,
+    the least recently used ones are evicted past max_entries, and everything is
+    dropped when the corpus index version changes.
+    """
+
+    def __init__(self, dimension, max_entries=500, ttl_seconds=3600, similarity_threshold=0.95, min_overlap=0.5,
+                 candidates=4):
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.min_overlap = min_overlap
+        self.candidates = candidates # nearest cached queries checked per lookup
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._indexes = {} # agent id -> faiss.IndexIDMap2 over query embeddings
+        self._entries = OrderedDict() # entry id -> _CachedAnswer, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def validate(self, index_version):
+        """Drops every cached answer when the corpus index they were generated from has changed."""
+        with self._lock:
+            if index_version != self.index_version:
+                if self._entries:
+                    print(f"Answer cache: index version changed, dropping {len(self._entries)} cached answers.")
+                self._clear()
+                self.index_version = index_version
+
+    def lookup(self, agent_id, query_vector, doc_ids):
+        """Cached answer for a query of this agent close enough to an earlier one, or None."""
+        with self._lock:
+            self._expire()
+            index = self._indexes.get(agent_id)
+            if index is None or index.ntotal == 0:
+                self.misses += 1
+                return None
+            similarities, entry_ids = index.search(self._vector(query_vector), min(self.candidates, index.ntotal))
+            for similarity, entry_id in zip(similarities[0], entry_ids[0]):
+                if entry_id < 0 or similarity < self.similarity_threshold:
+                    break
+                entry = self._entries[int(entry_id)]
+                if document_overlap(entry.doc_ids, doc_ids) >= self.min_overlap:
+                    self._entries.move_to_end(int(entry_id))
+                    self.hits += 1
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def store(self, agent_id, query_vector, doc_ids, answer):
+        with self._lock:
+            index = self._indexes.get(agent_id)
+            if index is None:
+                index = self._indexes[agent_id] = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(self._vector(query_vector), np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = _CachedAnswer(agent_id, doc_ids, answer, time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._remove([next(iter(self._entries))])
+
+    def _vector(self, query_vector):
+        return np.ascontiguousarray(query_vector, dtype=np.float32).reshape(1, self.dimension)
+
+    def _expire(self):
+        if self.ttl_seconds is None:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        self._remove([entry_id for entry_id, entry in self._entries.items() if entry.created < cutoff])
+
+    def _remove(self, entry_ids):
+        by_agent = {}
+        for entry_id in entry_ids:
+            by_agent.setdefault(self._entries.pop(entry_id).agent_id, []).append(entry_id)
+        for agent_id, ids in by_agent.items():
+            self._indexes[agent_id].remove_ids(np.array(ids, dtype=np.int64))
+
+    def _clear(self):
+        self._indexes = {}
+        self._entries.clear()
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"Answer cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate, {len(self)} answers)."
@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchingEncoder:
+    """
+    Shares one encode call between queries that arrive together. Callers from any
+    thread submit a single text and block on its vector; a background thread takes
+    the first waiting query, keeps collecting until max_batch queries are waiting
+    or max_wait_ms has passed, encodes them in one batch and hands each caller its
+    row. Under load this replaces many batch-of-1 transformer passes with a few
+    larger ones; an idle server only adds max_wait_ms to a lone query.
+    """
+
+    def __init__(self, encode, max_batch=16, max_wait_ms=5.0):
+        self._encode = encode # encode(list_of_texts) -> (n, dimension) array
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self.wait_seconds = 0.0 # summed over queries: submission until their batch starts encoding
+        self.encode_seconds = 0.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='query-batching-encoder', daemon=True)
+        self._thread.start()
+
+    def encode(self, text):
+        """Embedding of one text as a float32 vector, encoded together with any concurrent callers' texts."""
+        if self._closed:
+            raise RuntimeError("batching encoder is closed")
+        future = Future()
+        self._queue.put((text, time.perf_counter(), future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                vectors = np.asarray(self._encode([text for text, _, _ in batch]), dtype=np.float32)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.encode_seconds += time.perf_counter() - started
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.wait_seconds += sum(started - submitted for _, submitted, _ in batch)
+            for row, (_, _, future) in enumerate(batch):
+                future.set_result(vectors[row])
+
+    def stats(self):
+        """Per-batch size and wait metrics since startup."""
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'mean_batch_size': self.queries / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'mean_wait_ms': 1000.0 * self.wait_seconds / self.queries if self.queries else 0.0,
+            'mean_encode_ms': 1000.0 * self.encode_seconds / self.batches if self.batches else 0.0,
+        }
+
+    def stats_line(self):
+        stats = self.stats()
+        return (f"Query batching: {stats['queries']} queries in {stats['batches']} batches "
+                f"(mean {stats['mean_batch_size']:.1f}, largest {stats['largest_batch']}), "
+                f"mean wait {stats['mean_wait_ms']:.1f} ms, mean encode {stats['mean_encode_ms']:.1f} ms per batch.")
+
+    def close(self):
+        """Stops the background thread once the queued queries are encoded."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            # Fail any query submitted while the thread was stopping rather than leave it waiting
+            while not self._queue.empty():
+                request = self._queue.get()
+                if request is not None:
+                    request[2].set_exception(RuntimeError("batching encoder is closed"))
@@ -0,0 +1,97 @@
+import faiss
+import numpy as np
+
+# Candidates re-scored with full vectors when FAISS_RERANK_CANDIDATES is not set and the index
+# only approximates them (binary codes, or vectors reduced by a PCA/OPQ transform)
+DEFAULT_RERANK_CANDIDATES = 300
+
+
+def is_binary_spec(spec):
+    """Binary specs use faiss.index_binary_factory names: 'BFlat', 'BIVF1024', 'BHNSW32'."""
+    return spec.startswith('B')
+
+
+def binarize(vectors):
+    """Sign bits of float vectors packed 8 per byte (384 dimensions -> 48 bytes)."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def hamming_to_squared_l2(distances, bits):
+    """
+    Squared L2 distance between unit vectors estimated from the Hamming distance of
+    their sign bits (angle ~ pi * hamming / bits, as in SimHash), so binary hits
+    read on the same scale as the distances of a float index.
+    """
+    angles = np.pi * np.minimum(np.asarray(distances, dtype=np.float32), bits) / bits
+    return (2.0 - 2.0 * np.cos(angles)).astype(np.float32)
+
+
+class BinaryCodeIndex:
+    """
+    Float-vector interface over a FAISS binary index of sign-binarized embeddings,
+    so the build and search code can treat it like any other id-keyed index.
+    Search estimates squared L2 distances from the Hamming distances: the index is a
+    small, fast candidate generator whose hits are re-scored against the
+    full-precision vector file, and the estimate only ranks them when that file is
+    missing.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def create(cls, dimension, spec):
+        index = faiss.index_binary_factory(dimension, spec)
+        # Same rule as float indexes: IVF lists keep the ids, anything else gets an id map
+        if not isinstance(index, faiss.IndexBinaryIVF):
+            index = faiss.IndexBinaryIDMap2(index)
+        return cls(index)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def is_trained(self):
+        return self.index.is_trained
+
+    def train(self, vectors):
+        self.index.train(binarize(vectors))
+
+    def add_with_ids(self, vectors, ids):
+        self.index.add_with_ids(binarize(vectors), ids)
+
+    def remove_ids(self, selector):
+        return self.index.remove_ids(selector)
+
+    def search(self, vectors, k, params=None):
+        D, I = self.index.search(binarize(vectors), k, params=params)
+        return hamming_to_squared_l2(D, self.index.d), I
+
+    @property
+    def applies_selector(self):
+        """Whether search_parameters passes an ID selector on (binary IVF search does not take one)."""
+        index = self.index
+        if isinstance(index, faiss.IndexBinaryIDMap2):
+            index = faiss.downcast_IndexBinary(index.index)
+        return not isinstance(index, faiss.IndexBinaryIVF)
+
+    def search_parameters(self, nprobe=None, ef_search=None, selector=None):
+        """
+        Search parameters for the binary index. Binary IVF search does not accept an
+        ID selector, so there the selector is dropped and callers filter the hits.
+        """
+        index = self.index
+        if isinstance(index, faiss.IndexBinaryIDMap2):
+            index = faiss.downcast_IndexBinary(index.index)
+        if isinstance(index, faiss.IndexBinaryIVF):
+            return faiss.SearchParametersIVF(nprobe=nprobe) if nprobe else None
+        if isinstance(index, faiss.IndexBinaryHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch)
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        if selector is not None:
+            params.sel = selector
+        return params
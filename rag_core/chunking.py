@@ -0,0 +1,227 @@
+import re
+
+import numpy as np
+
+# A sentence ends at ., ! or ? (plus any closing quotes/brackets) followed by
+# whitespace or directly by a capital letter -- the export often drops the space
+# after a full stop ("north Bengaluru.Sadashivanagar police said...").
+_SENTENCE_END = re.compile(r'[.!?]+["\'’”)\]]*(?=\s|[A-Z]|$)')
+_FALLBACK_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+class Chunker:
+    """
+    Splits article text into overlapping, sentence-aligned token windows.
+    Windows are measured in the embedding model's own word pieces so that every
+    chunk fits inside the model's max sequence length and nothing is truncated.
+    Chunks are returned as (start, end) character spans into the original text.
+    """
+
+    def __init__(self, tokenizer=None, max_tokens=200, overlap_tokens=40):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens.")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def config_key(self):
+        """Stable description of the chunking parameters, used to key derived artifacts."""
+        return f"sentence-window:max={self.max_tokens}:overlap={self.overlap_tokens}"
+
+    def _token_starts(self, text):
+        """Character offset at which each token of text starts."""
+        if self.tokenizer is not None and getattr(self.tokenizer, 'is_fast', False):
+            encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return np.array([start for start, end in encoding['offset_mapping']], dtype=np.int64)
+        return np.array([match.start() for match in _FALLBACK_TOKEN.finditer(text)], dtype=np.int64)
+
+    def _sentence_units(self, text, token_starts):
+        """Sentence token ranges, with sentences longer than one window cut into window-sized pieces."""
+        boundaries = [match.end() for match in _SENTENCE_END.finditer(text)]
+        token_bounds = np.searchsorted(token_starts, boundaries).tolist()
+        units = []
+        previous = 0
+        for bound in token_bounds + [len(token_starts)]:
+            for start in range(previous, bound, self.max_tokens):
+                units.append((start, min(start + self.max_tokens, bound)))
+            previous = max(previous, bound)
+        return units
+
+    def chunk(self, text):
+        """Returns the (start, end) character spans of the chunks of text."""
+        token_starts = self._token_starts(text)
+        if len(token_starts) == 0:
+            return []
+        units = self._sentence_units(text, token_starts)
+
+        def char_span(first_token, last_token):
+            end = token_starts[last_token] if last_token < len(token_starts) else len(text)
+            return int(token_starts[first_token]), int(end)
+
+        spans = []
+        first = 0
+        while first < len(units):
+            last = first
+            while last + 1 < len(units) and units[last + 1][1] - units[first][0] <= self.max_tokens:
+                last += 1
+            spans.append(char_span(units[first][0], units[last][1]))
+            if last == len(units) - 1:
+                break
+            # Start the next window on the trailing sentences that fit in the overlap budget
+            next_first = last + 1
+            while next_first - 1 > first and units[last][1] - units[next_first - 1][0] <= self.overlap_tokens:
+                next_first -= 1
+            # ...but drop overlap sentences that would leave no room for the next new one
+            while next_first <= last and units[last + 1][1] - units[next_first][0] > self.max_tokens:
+                next_first += 1
+            first = next_first
+        return spans
+
+
+# FAISS ids pack the article's DOC_ID and the chunk's ordinal within it, so all the
+# chunks of one article can be found (and removed) from its DOC_ID alone.
+CHUNK_NUMBER_BITS = 16
+
+
+CHUNK_RECORD_DTYPE = np.dtype([
+    ('ids', np.int64), ('doc_ids', np.int64), ('chunk_numbers', np.int32), ('starts', np.int32), ('ends', np.int32),
+])
+
+
+def make_chunk_ids(doc_ids, chunk_numbers):
+    return (np.asarray(doc_ids, dtype=np.int64) << CHUNK_NUMBER_BITS) | np.asarray(chunk_numbers, dtype=np.int64)
+
+
+class ChunkTable:
+    """
+    Parallel arrays describing every indexed chunk, sorted by FAISS chunk id: the
+    DOC_ID it belongs to, its ordinal within the article, and its character span.
+    doc_positions maps each chunk to its article's row in the current document store
+    and is recomputed by bind() rather than persisted, since rows move between exports.
+    """
+
+    def __init__(self, ids, doc_ids, chunk_numbers, starts, ends):
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.chunk_numbers = chunk_numbers
+        self.starts = starts
+        self.ends = ends
+        self.doc_positions = None
+
+    @classmethod
+    def create_empty(cls):
+        return cls(
+            ids=np.empty(0, dtype=np.int64), doc_ids=np.empty(0, dtype=np.int64),
+            chunk_numbers=np.empty(0, dtype=np.int32), starts=np.empty(0, dtype=np.int32),
+            ends=np.empty(0, dtype=np.int32),
+        )
+
+    @classmethod
+    def build(cls, store, chunker, positions):
+        """Chunks the documents at the given store positions."""
+        doc_positions, chunk_numbers, starts, ends = [], [], [], []
+        for position in positions:
+            for number, (start, end) in enumerate(chunker.chunk(store.text('content', position))):
+                doc_positions.append(position)
+                chunk_numbers.append(number)
+                starts.append(start)
+                ends.append(end)
+        doc_positions = np.array(doc_positions, dtype=np.int64)
+        doc_ids = np.asarray(store.doc_ids[doc_positions], dtype=np.int64)
+        chunk_numbers = np.array(chunk_numbers, dtype=np.int32)
+        table = cls(
+            ids=make_chunk_ids(doc_ids, chunk_numbers),
+            doc_ids=doc_ids,
+            chunk_numbers=chunk_numbers,
+            starts=np.array(starts, dtype=np.int32),
+            ends=np.array(ends, dtype=np.int32),
+        )
+        table.doc_positions = doc_positions
+        return table
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Reads a table written by save(). With mmap the columns are read-only views of
+        the memory-mapped file, so processes loading the same table share its pages.
+        """
+        records = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(*(records[name] for name in CHUNK_RECORD_DTYPE.names))
+
+    def save(self, path):
+        # One record per chunk in a single .npy, so the table can be memory-mapped
+        records = np.empty(len(self), dtype=CHUNK_RECORD_DTYPE)
+        for name in CHUNK_RECORD_DTYPE.names:
+            records[name] = getattr(self, name)
+        # np.save appends .npy to names without it, so write through an open file
+        with open(path, 'wb') as f:
+            np.save(f, records)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def bind(self, store):
+        """Resolves every chunk's DOC_ID to its position in the given document store."""
+        self.doc_positions = store.positions_for_doc_ids(self.doc_ids)
+
+    def _take(self, rows):
+        table = ChunkTable(self.ids[rows], self.doc_ids[rows], self.chunk_numbers[rows], self.starts[rows], self.ends[rows])
+        if self.doc_positions is not None:
+            table.doc_positions = self.doc_positions[rows]
+        return table
+
+    def without_doc_ids(self, doc_ids):
+        """Returns a copy of the table without the chunks of the given articles."""
+        return self._take(~np.isin(self.doc_ids, doc_ids))
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Returns a new table holding the chunks of all the given tables, sorted by chunk id."""
+        combined = cls(*(
+            np.concatenate([getattr(table, name) for table in tables])
+            for name in ('ids', 'doc_ids', 'chunk_numbers', 'starts', 'ends')
+        ))
+        if all(table.doc_positions is not None for table in tables):
+            combined.doc_positions = np.concatenate([table.doc_positions for table in tables])
+        return combined._take(np.argsort(combined.ids, kind='stable'))
+
+    def rows_for_ids(self, chunk_ids):
+        """Maps FAISS chunk ids to table rows, with -1 for ids that are not in the table."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(chunk_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, chunk_ids), len(self) - 1)
+        rows[self.ids[rows] != chunk_ids] = -1
+        return rows
+
+    def rows_for_doc_id(self, doc_id):
+        """Table rows of one article's chunks (contiguous, since chunk ids start with the DOC_ID)."""
+        lo, hi = np.searchsorted(self.ids, make_chunk_ids([doc_id, doc_id + 1], [0, 0]))
+        return np.arange(lo, hi)
+
+    def texts(self, store, rows=None):
+        """Returns the chunk texts for the given table rows (all rows by default)."""
+        rows = range(len(self)) if rows is None else rows
+        contents = {}
+        texts = []
+        for row in rows:
+            position = int(self.doc_positions[row])
+            if position not in contents:
+                contents[position] = store.text('content', position)
+            texts.append(contents[position][self.starts[row]:self.ends[row]].strip())
+        return texts
+
+    def passage_text(self, content, rows, separator=' ... '):
+        """
+        Joins the spans of the given rows (all from one article) into a single passage
+        string, merging overlapping or adjacent spans and keeping article order.
+        """
+        spans = sorted((int(self.starts[row]), int(self.ends[row])) for row in rows)
+        merged = [list(spans[0])]
+        for start, end in spans[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return separator.join(content[start:end].strip() for start, end in merged)
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .dedup import NearDuplicateIndex
+
+# Bump this whenever the on-disk layout or SNAPSHOT_COLUMNS changes so stale
+# snapshots are recompiled instead of being misread.
+SNAPSHOT_FORMAT_VERSION = 5
+
+MANIFEST_FILE = 'manifest.json'
+
+# CSV column -> (snapshot column name, kind). Only the columns retrieval needs are
+# kept; the other ~44 columns of the export never leave the CSV.
+SNAPSHOT_COLUMNS = {
+    'DOC_ID': ('doc_id', 'int64'),
+    'DOC_DET': ('content', 'text'),
+    'DOC_TITL': ('title', 'text'),
+    'DOC_URL': ('url', 'text'),
+    'DOC_PUBDATE': ('pubdate', 'datetime64[s]'),
+    'DOC_SDATE': ('sdate', 'datetime64[s]'),
+    'DOC_CATEGRY': ('doc_category', 'category'),
+    'NEWS_CATEGRY': ('news_category', 'category'),
+}
+
+# The column that holds the main article text; rows without it are dropped.
+TEXT_COLUMN = 'DOC_DET'
+# Articles are keyed by this column; when an export repeats an ID the first row wins.
+ID_COLUMN = 'DOC_ID'
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Returns the hex SHA-256 of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _source_matches(manifest, csv_path, dedup_threshold):
+    """
+    Checks whether the snapshot was compiled from the current CSV with the same settings.
+    A matching size/mtime is trusted as-is; otherwise the CSV is hashed so that a
+    touched-but-unchanged export does not force a recompile.
+    """
+    if not manifest or manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        return False
+    if manifest.get('dedup_threshold') != dedup_threshold:
+        return False
+    source = manifest.get('source', {})
+    stat = os.stat(csv_path)
+    if source.get('size') == stat.st_size and source.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    if source.get('size') != stat.st_size:
+        return False
+    return source.get('sha256') == file_sha256(csv_path)
+
+
+def content_hash(text):
+    """64-bit fingerprint of an article's text, used to detect edited articles between exports."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _column_values(df, csv_column, kind):
+    if kind == 'text':
+        return df[csv_column].fillna('').astype(str).tolist()
+    if kind == 'category':
+        return df[csv_column].fillna('').astype(str).str.strip().tolist()
+    if kind.startswith('datetime64'):
+        return pd.to_datetime(df[csv_column], errors='coerce').to_numpy(dtype=kind)
+    return pd.to_numeric(df[csv_column], errors='coerce').fillna(-1).to_numpy(dtype=kind)
+
+
+class _SnapshotWriter:
+    """Appends blocks of CSV rows to the column files of a snapshot being compiled."""
+
+    def __init__(self, directory, dedup_threshold):
+        self.directory = directory
+        self.dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold else None
+        self.rows = 0
+        self._text_sizes = {}
+        self.categories = {} # category column -> {label: code}, in order of first appearance
+        self._seen_ids = set()
+        for name, kind in SNAPSHOT_COLUMNS.values():
+            if kind == 'text':
+                np.zeros(1, dtype=np.int64).tofile(self._path(f'{name}.offsets'))
+                self._text_sizes[name] = 0
+            elif kind == 'category':
+                self.categories[name] = {}
+
+    def _path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def _append(self, file_name, data):
+        with open(self._path(file_name), 'ab') as f:
+            f.write(data)
+
+    def append(self, df):
+        df = df.dropna(subset=[TEXT_COLUMN])
+        ids = _column_values(df, ID_COLUMN, SNAPSHOT_COLUMNS[ID_COLUMN][1])
+        keep = []
+        for doc_id in ids.tolist():
+            keep.append(doc_id not in self._seen_ids)
+            self._seen_ids.add(doc_id)
+        keep = np.array(keep, dtype=bool)
+        df, ids = df[keep], ids[keep]
+
+        for csv_column, (name, kind) in SNAPSHOT_COLUMNS.items():
+            values = _column_values(df, csv_column, kind)
+            if csv_column == TEXT_COLUMN:
+                hashes = np.array([content_hash(text) for text in values], dtype=np.uint64)
+                self._append('content_hash.bin', hashes.tobytes())
+                canonical_ids = ids
+                if self.dedup is not None:
+                    canonical_ids = np.array([
+                        self.dedup.canonical_id(doc_id, text) for doc_id, text in zip(ids.tolist(), values)
+                    ], dtype=np.int64)
+                self._append('canonical_id.bin', canonical_ids.astype(np.int64).tobytes())
+            if kind == 'text':
+                encoded = [value.encode('utf-8') for value in values]
+                offsets = np.cumsum([len(value) for value in encoded], dtype=np.int64) + self._text_sizes[name]
+                self._append(f'{name}.utf8', b''.join(encoded))
+                self._append(f'{name}.offsets', offsets.tobytes())
+                if len(offsets):
+                    self._text_sizes[name] = int(offsets[-1])
+            elif kind == 'category':
+                # Dictionary-encoded: int32 codes per row, -1 for blanks, labels kept in the manifest
+                codes = self.categories[name]
+                self._append(f'{name}.bin', np.array([
+                    codes.setdefault(value, len(codes)) if value else -1 for value in values
+                ], dtype=np.int32).tobytes())
+            else:
+                self._append(f'{name}.bin', values.tobytes())
+        self.rows += len(df)
+
+    def category_labels(self):
+        return {name: list(codes) for name, codes in self.categories.items()}
+
+    @staticmethod
+    def columns():
+        columns = {name: kind for name, kind in SNAPSHOT_COLUMNS.values()}
+        columns['content_hash'] = 'uint64'
+        # DOC_ID of the article's canonical copy; equal to its own DOC_ID unless it is a near-duplicate
+        columns['canonical_id'] = 'int64'
+        return columns
+
+
+def compile_snapshot(csv_path, snapshot_dir, block_rows=5000, dedup_threshold=0.8):
+    """
+    Compiles the CSV export into a columnar snapshot directory: one raw binary file
+    per numeric or (dictionary-encoded) category column and a UTF-8 buffer + offsets
+    pair per text column, all of which can be memory-mapped back without parsing.
+    The CSV is streamed in blocks of block_rows, so memory stays bounded by the
+    block size rather than the size of the export. When dedup_threshold is set,
+    near-duplicate articles (MinHash Jaccard estimate >= threshold) are pointed at
+    the first copy of their story through the canonical_id column.
+    """
+    print(f"Compiling corpus snapshot from {csv_path} into {snapshot_dir}...")
+    header = pd.read_csv(csv_path, nrows=0).columns
+    if TEXT_COLUMN not in header:
+        raise ValueError(f"Text column '{TEXT_COLUMN}' not found in CSV.")
+    if ID_COLUMN not in header:
+        raise ValueError(f"ID column '{ID_COLUMN}' not found in CSV.")
+    missing = [column for column in SNAPSHOT_COLUMNS if column not in header]
+    for column in missing:
+        print(f"Snapshot Warning: column '{column}' not found in CSV; filling with blanks.")
+
+    tmp_dir = snapshot_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    writer = _SnapshotWriter(tmp_dir, dedup_threshold)
+    blocks = pd.read_csv(csv_path, usecols=lambda column: column in SNAPSHOT_COLUMNS, chunksize=block_rows)
+    for block in blocks:
+        for column in missing:
+            block[column] = None
+        writer.append(block)
+
+    stat = os.stat(csv_path)
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'source': {
+            'path': os.path.abspath(csv_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(csv_path),
+        },
+        'rows': writer.rows,
+        'dedup_threshold': dedup_threshold,
+        'columns': writer.columns(),
+        'categories': writer.category_labels(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(tmp_dir, snapshot_dir)
+    duplicates = writer.dedup.duplicates if writer.dedup is not None else 0
+    print(f"Corpus snapshot compiled. Rows: {writer.rows} ({duplicates} near-duplicates of other articles)")
+    return manifest
+
+
+def _map(path, dtype, count):
+    # np.memmap refuses zero-length files, so empty columns are materialised directly.
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def read_snapshot(snapshot_dir, manifest=None):
+    """
+    Memory-maps a compiled snapshot. Returns (manifest, columns) where numeric
+    columns map to arrays, each text column `name` maps to a (buffer, offsets)
+    tuple of uint8 and int64 arrays, and each category column to a (codes, labels)
+    tuple of an int32 array and the list of labels its codes index.
+    """
+    manifest = manifest or _read_manifest(snapshot_dir)
+    rows = manifest['rows']
+    columns = {}
+    for name, kind in manifest['columns'].items():
+        if kind == 'text':
+            offsets = _map(os.path.join(snapshot_dir, f'{name}.offsets'), np.int64, rows + 1)
+            buffer_size = int(offsets[-1]) if rows else 0
+            buffer = _map(os.path.join(snapshot_dir, f'{name}.utf8'), np.uint8, buffer_size)
+            columns[name] = (buffer, offsets)
+        elif kind == 'category':
+            codes = _map(os.path.join(snapshot_dir, f'{name}.bin'), np.int32, rows)
+            columns[name] = (codes, manifest['categories'][name])
+        else:
+            columns[name] = _map(os.path.join(snapshot_dir, f'{name}.bin'), np.dtype(kind), rows)
+    return manifest, columns
+
+
+def load_snapshot(csv_path, snapshot_dir, block_rows=5000, dedup_threshold=0.8):
+    """Loads the snapshot for csv_path, recompiling it first if the CSV or dedup setting has changed."""
+    manifest = _read_manifest(snapshot_dir)
+    if _source_matches(manifest, csv_path, dedup_threshold):
+        print(f"Corpus snapshot is up to date ({manifest['rows']} rows).")
+    else:
+        manifest = compile_snapshot(csv_path, snapshot_dir, block_rows, dedup_threshold)
+    return read_snapshot(snapshot_dir, manifest)
+
+
+def open_snapshot(csv_path, snapshot_dir):
+    """
+    Memory-maps an existing snapshot without ever compiling one (read-only processes).
+    Warns when the CSV has changed since the snapshot was compiled.
+    """
+    manifest = _read_manifest(snapshot_dir)
+    if manifest is None or manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise FileNotFoundError(f"no compatible corpus snapshot in {snapshot_dir}")
+    if os.path.exists(csv_path) and not _source_matches(manifest, csv_path, manifest.get('dedup_threshold')):
+        print(f"Snapshot Warning: {csv_path} has changed since the snapshot was compiled; serving the snapshot.")
+    return read_snapshot(snapshot_dir, manifest)
+
+
+def decode_text(buffer, offsets, start=0, stop=None):
+    """Decodes rows [start, stop) of a text column back into Python strings."""
+    stop = len(offsets) - 1 if stop is None else stop
+    raw = bytes(buffer[offsets[start]:offsets[stop]])
+    base = int(offsets[start])
+    return [
+        raw[int(offsets[i]) - base:int(offsets[i + 1]) - base].decode('utf-8')
+        for i in range(start, stop)
+    ]
@@ -0,0 +1,77 @@
+import re
+import zlib
+
+import numpy as np
+
+_WORD = re.compile(r'\w+')
+
+NUM_PERMUTATIONS = 64
+# 8 bands of 8 rows: pairs with Jaccard similarity around 0.75+ almost always share a band
+NUM_BANDS = 8
+SHINGLE_WORDS = 5
+
+_rng = np.random.RandomState(20240822)
+_SEEDS = _rng.randint(0, 2 ** 63 - 1, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+_MULTIPLIERS = _rng.randint(0, 2 ** 63 - 1, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+# Per-position multipliers used to fold SHINGLE_WORDS word hashes into one shingle hash
+_SHINGLE_WEIGHTS = _rng.randint(1, 2 ** 63 - 1, size=SHINGLE_WORDS, dtype=np.int64).astype(np.uint64)
+
+
+def _word_hashes(text):
+    # crc32 is stable across processes (unlike hash()) and runs in C
+    words = _WORD.findall(text.lower())
+    return np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64, count=len(words))
+
+
+def minhash_signature(text):
+    """MinHash signature over word 5-gram shingles, or None for text without words."""
+    words = _word_hashes(text)
+    if len(words) == 0:
+        return None
+    width = min(SHINGLE_WORDS, len(words))
+    count = len(words) - width + 1
+    with np.errstate(over='ignore'):
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset in range(width):
+            shingles += words[offset:offset + count] * _SHINGLE_WEIGHTS[offset]
+        hashed = (shingles[:, None] ^ _SEEDS[None, :]) * _MULTIPLIERS[None, :]
+    return (hashed >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Streaming MinHash/LSH grouping of near-duplicate articles.
+    Articles are fed in corpus order; the first article of each group becomes its
+    canonical copy and later articles whose estimated Jaccard similarity to it
+    reaches the threshold are recorded as its aliases. Only canonical articles keep
+    their signatures and LSH buckets, so memory grows with the number of groups.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._buckets = {} # (band, band bytes) -> [canonical DOC_ID, ...]
+        self._signatures = {} # canonical DOC_ID -> signature
+        self.duplicates = 0
+
+    def canonical_id(self, doc_id, text):
+        """Registers an article and returns the DOC_ID of its canonical copy (itself if new)."""
+        signature = minhash_signature(text)
+        if signature is None:
+            return doc_id
+        rows = NUM_PERMUTATIONS // NUM_BANDS
+        band_keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(NUM_BANDS)]
+
+        checked = set()
+        for key in band_keys:
+            for candidate in self._buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    self.duplicates += 1
+                    return candidate
+
+        self._signatures[doc_id] = signature
+        for key in band_keys:
+            self._buckets.setdefault(key, []).append(doc_id)
+        return doc_id
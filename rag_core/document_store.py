@@ -0,0 +1,166 @@
+import hashlib
+
+import numpy as np
+
+from .corpus_snapshot import decode_text
+
+
+def snapshot_fingerprint(source_sha256, rows, dedup_threshold, canonical_ids):
+    """
+    Hex digest identifying a compiled snapshot: the CSV hash and row count, the
+    near-duplicate threshold and the canonical_id column it produced. Artifacts
+    derived from the store record it, so a changed RAG_DEDUP_THRESHOLD (or a new
+    canonical set) makes them stale even though the CSV did not change.
+    """
+    digest = hashlib.blake2b(f"{source_sha256}|{rows}|{dedup_threshold}".encode('utf-8'), digest_size=16)
+    digest.update(np.ascontiguousarray(canonical_ids, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def matches_snapshot(fingerprint, store):
+    """O(1) check (after the store's first call) that an artifact was built from exactly this snapshot."""
+    return fingerprint is not None and fingerprint == store.snapshot_fingerprint
+
+
+class DocumentStore:
+    """
+    Read-only, array-backed store of the corpus documents.
+    Each text field is one contiguous UTF-8 buffer plus an int64 offsets array, and
+    the scalar fields are parallel typed arrays, so the store can sit on top of the
+    memory-mapped corpus snapshot without materialising Python objects per row.
+    Positions are the row numbers the FAISS index was built against.
+    """
+
+    TEXT_FIELDS = ('content', 'title', 'url')
+    CATEGORY_FIELDS = ('doc_category', 'news_category')
+
+    def __init__(self, doc_ids, pubdates, content_hashes, canonical_ids, texts, sdates=None, categories=None,
+                 source_sha256=None, dedup_threshold=None):
+        self.doc_ids = doc_ids
+        self.pubdates = pubdates
+        self.sdates = np.full(len(doc_ids), np.datetime64('NaT'), dtype='datetime64[s]') if sdates is None else sdates
+        self.content_hashes = content_hashes
+        self.canonical_ids = canonical_ids # near-duplicates point at the first copy of their story
+        self._texts = texts # field name -> (uint8 buffer, int64 offsets)
+        # field name -> (int32 codes, labels); code -1 means the field is blank
+        self.categories = categories or {
+            field: (np.full(len(doc_ids), -1, dtype=np.int32), []) for field in self.CATEGORY_FIELDS
+        }
+        self.source_sha256 = source_sha256 # SHA-256 of the CSV the snapshot was compiled from
+        self.dedup_threshold = dedup_threshold # RAG_DEDUP_THRESHOLD the canonical_ids were computed with
+        self._snapshot_fingerprint = None
+        self._id_order = None
+        self._alias_order = None
+
+    @classmethod
+    def from_snapshot(cls, manifest, columns):
+        """Builds a store from the (manifest, columns) returned by corpus_snapshot.read_snapshot."""
+        return cls(
+            doc_ids=columns['doc_id'],
+            pubdates=columns['pubdate'],
+            content_hashes=columns['content_hash'],
+            canonical_ids=columns['canonical_id'],
+            texts={field: columns[field] for field in cls.TEXT_FIELDS},
+            sdates=columns['sdate'],
+            categories={field: columns[field] for field in cls.CATEGORY_FIELDS},
+            source_sha256=manifest['source']['sha256'],
+            dedup_threshold=manifest.get('dedup_threshold'),
+        )
+
+    @classmethod
+    def create_empty(cls):
+        offsets = np.zeros(1, dtype=np.int64)
+        buffer = np.empty(0, dtype=np.uint8)
+        return cls(
+            doc_ids=np.empty(0, dtype=np.int64),
+            pubdates=np.empty(0, dtype='datetime64[s]'),
+            content_hashes=np.empty(0, dtype=np.uint64),
+            canonical_ids=np.empty(0, dtype=np.int64),
+            texts={field: (buffer, offsets) for field in cls.TEXT_FIELDS},
+        )
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def snapshot_fingerprint(self):
+        """See snapshot_fingerprint(); None for a store not compiled from a CSV."""
+        if self.source_sha256 is None:
+            return None
+        if self._snapshot_fingerprint is None:
+            self._snapshot_fingerprint = snapshot_fingerprint(
+                self.source_sha256, len(self), self.dedup_threshold, self.canonical_ids
+            )
+        return self._snapshot_fingerprint
+
+    @property
+    def canonical_mask(self):
+        """True for articles that are the canonical copy of their near-duplicate group."""
+        return self.canonical_ids == self.doc_ids
+
+    def text(self, field, position):
+        """Decodes a single text field for the document at position."""
+        buffer, offsets = self._texts[field]
+        return bytes(buffer[offsets[position]:offsets[position + 1]]).decode('utf-8')
+
+    def texts(self, field, start=0, stop=None):
+        """Decodes a text field for the contiguous position range [start, stop)."""
+        return decode_text(*self._texts[field], start, stop)
+
+    def category(self, field, position):
+        """Label of a category field for the document at position, or None when blank."""
+        codes, labels = self.categories[field]
+        code = codes[position]
+        return labels[code] if code >= 0 else None
+
+    def category_codes(self, field, labels):
+        """Codes of the given labels in a category field (labels not in the corpus are skipped)."""
+        known = {label: code for code, label in enumerate(self.categories[field][1])}
+        return [known[label] for label in labels if label in known]
+
+    def get_batch(self, positions):
+        """
+        Materialises the documents at the given positions (e.g. FAISS result ids) as
+        dicts, in the order given. Cost is O(k) slices of the underlying buffers.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        doc_ids = self.doc_ids[positions]
+        pubdates = self.pubdates[positions]
+        documents = []
+        for i, position in enumerate(positions):
+            document = {field: self.text(field, position) for field in self.TEXT_FIELDS}
+            document['doc_id'] = int(doc_ids[i])
+            document['pubdate'] = None if np.isnat(pubdates[i]) else str(pubdates[i])
+            document['sdate'] = None if np.isnat(self.sdates[position]) else str(self.sdates[position])
+            for field in self.CATEGORY_FIELDS:
+                document[field] = self.category(field, position)
+            document['position'] = int(position)
+            document['duplicate_doc_ids'] = self.alias_ids(document['doc_id'])
+            documents.append(document)
+        return documents
+
+    def positions_for_doc_ids(self, doc_ids):
+        """Maps DOC_IDs to store positions, with -1 for IDs that are not in the store."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if self.empty:
+            return np.full(len(doc_ids), -1, dtype=np.int64)
+        if self._id_order is None:
+            self._id_order = np.argsort(self.doc_ids, kind='stable')
+        sorted_ids = self.doc_ids[self._id_order]
+        slots = np.minimum(np.searchsorted(sorted_ids, doc_ids), len(sorted_ids) - 1)
+        positions = self._id_order[slots].astype(np.int64)
+        positions[sorted_ids[slots] != doc_ids] = -1
+        return positions
+
+    def alias_ids(self, doc_id):
+        """DOC_IDs of the near-duplicate copies collapsed into the given canonical article."""
+        if self._alias_order is None:
+            self._alias_order = np.argsort(self.canonical_ids, kind='stable')
+        sorted_canonical = self.canonical_ids[self._alias_order]
+        lo, hi = np.searchsorted(sorted_canonical, [doc_id, doc_id + 1])
+        aliases = self.doc_ids[self._alias_order[lo:hi]]
+        return [int(alias) for alias in aliases if alias != doc_id]
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+KEYS_FILE = 'keys.bin'
+VECTORS_FILE = 'vectors.f32'
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    """
+    Append-only disk cache of text embeddings.
+    Entries are keyed by a hash of (model name, chunking config, text), so any text
+    that was ever encoded under the same configuration is never sent through the
+    model again -- whatever index type or layout it ends up in. Vectors live in a
+    raw float32 file that is memory-mapped for reads; keys live in a parallel file
+    of 16-byte digests that is loaded into a dict on open.
+    """
+
+    def __init__(self, cache_dir, model_name, config_key, dimension):
+        namespace = f"{model_name}|{config_key}"
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', model_name).strip('-')
+        self.directory = os.path.join(cache_dir, f"{slug}-{hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:12]}")
+        self.dimension = dimension
+        self._namespace = namespace.encode('utf-8') + b'\0'
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        info_path = os.path.join(self.directory, 'info.json')
+        if not os.path.exists(info_path):
+            with open(info_path, 'w') as f:
+                json.dump({'model': model_name, 'config': config_key, 'dimension': dimension}, f, indent=2)
+        self._keys_path = os.path.join(self.directory, KEYS_FILE)
+        self._vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        self._rows = self._load_keys()
+
+    def _load_keys(self):
+        keys = open(self._keys_path, 'rb').read() if os.path.exists(self._keys_path) else b''
+        vector_bytes = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        # An interrupted append can leave the two files at different lengths; keep the common prefix
+        count = min(len(keys) // KEY_BYTES, vector_bytes // (4 * self.dimension))
+        if len(keys) != count * KEY_BYTES or vector_bytes != count * 4 * self.dimension:
+            print(f"Embedding cache: truncating {self.directory} to {count} consistent entries.")
+            with open(self._keys_path, 'ab') as f:
+                f.truncate(count * KEY_BYTES)
+            with open(self._vectors_path, 'ab') as f:
+                f.truncate(count * 4 * self.dimension)
+        return {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(count)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _key(self, text):
+        return hashlib.blake2b(self._namespace + text.encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+    def _vector_matrix(self):
+        if self._vectors is None or len(self._vectors) != len(self._rows):
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(len(self._rows), self.dimension))
+        return self._vectors
+
+    def _append(self, keys, vectors):
+        with open(self._vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._keys_path, 'ab') as f:
+            f.write(b''.join(keys))
+        for key in keys:
+            self._rows[key] = len(self._rows)
+
+    def encode(self, texts, encode):
+        """
+        Returns float32 embeddings for texts, calling encode(list_of_texts) only for
+        texts that are not cached yet and storing their vectors for next time.
+        """
+        keys = [self._key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        if missing:
+            vectors = np.asarray(encode(list(missing.values())), dtype=np.float32)
+            self._append(list(missing), vectors)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.array(self._vector_matrix()[rows])
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"Embedding cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate, {len(self)} entries)."
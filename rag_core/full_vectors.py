@@ -0,0 +1,134 @@
+import numpy as np
+
+# What a stored vector was computed from: the chunk id, the content hash of its article
+# and its character span. A vector is only reused while all four still match.
+CHUNK_KEY_DTYPE = np.dtype([('id', np.int64), ('content_hash', np.uint64), ('start', np.int32), ('end', np.int32)])
+
+
+def _record_dtype(dimension):
+    return np.dtype(CHUNK_KEY_DTYPE.descr + [('vector', np.float32, (dimension,))])
+
+
+def chunk_keys(chunks, store):
+    """CHUNK_KEY_DTYPE records of a (bound) chunk table, in table order."""
+    keys = np.empty(len(chunks), dtype=CHUNK_KEY_DTYPE)
+    keys['id'] = chunks.ids
+    known = chunks.doc_positions >= 0
+    keys['content_hash'] = 0
+    keys['content_hash'][known] = store.content_hashes[chunks.doc_positions[known]]
+    keys['start'] = chunks.starts
+    keys['end'] = chunks.ends
+    return keys
+
+
+class FullPrecisionVectors:
+    """
+    Full-precision (float32) chunk vectors kept in a memory-mapped .npy side file,
+    used to re-score the candidates of a quantized index (SQ8, PQ, ...) exactly.
+    Each record is (chunk id, article content hash, span, vector), sorted by chunk
+    id, in one file so that keys and vectors are always replaced together. Only the
+    rows of the candidates being re-scored are ever paged in.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.ids = records['id']
+        self.vectors = records['vector']
+
+    @classmethod
+    def load(cls, path):
+        records = np.load(path, mmap_mode='r')
+        if records.dtype.names != CHUNK_KEY_DTYPE.names + ('vector',):
+            raise ValueError(f"{path} is not a full-precision vector file")
+        return cls(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def rows_for_ids(self, chunk_ids):
+        """Maps chunk ids to record rows, with -1 for ids that are not stored."""
+        chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(chunk_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, chunk_ids), len(self) - 1)
+        rows[self.ids[rows] != chunk_ids] = -1
+        return rows
+
+    def distances(self, query_vector, chunk_ids):
+        """Exact squared L2 distances to the given chunks, inf for chunks without a stored vector."""
+        rows = self.rows_for_ids(chunk_ids)
+        distances = np.full(len(chunk_ids), np.inf, dtype=np.float32)
+        known = rows >= 0
+        # Sorted row order keeps reads from the mapped file sequential
+        order = np.argsort(rows[known], kind='stable')
+        vectors = np.empty((int(known.sum()), self.vectors.shape[1]), dtype=np.float32)
+        vectors[order] = self.vectors[rows[known][order]]
+        distances[known] = ((vectors - query_vector) ** 2).sum(axis=1)
+        return distances
+
+    def rerank(self, query_vector, chunk_ids):
+        """
+        Exact squared L2 distances between the query and the given candidates.
+        Returns (distances, chunk_ids) sorted by distance; candidates without a
+        stored vector (including FAISS's -1 padding) sort last with distance inf.
+        """
+        return _ranked(self.distances(query_vector, chunk_ids), chunk_ids)
+
+    def matches(self, keys):
+        """Whether the file holds exactly the chunks described by keys (CHUNK_KEY_DTYPE, sorted by id)."""
+        if len(self) != len(keys):
+            return False
+        return all(np.array_equal(self.records[name], keys[name]) for name in CHUNK_KEY_DTYPE.names)
+
+    @staticmethod
+    def write(path, keys, dimension, vectors_for, previous=None, batch_rows=4096):
+        """
+        Writes the side file for the chunks described by keys (CHUNK_KEY_DTYPE, sorted by
+        id) to path. Vectors in the previous side file are copied over when their chunk
+        id, content hash and span all match; vectors_for(rows) is called for the
+        positions (into keys) of the remaining ones, e.g. chunks of edited articles.
+        """
+        records = np.lib.format.open_memmap(path, mode='w+', dtype=_record_dtype(dimension), shape=(len(keys),))
+        for start in range(0, len(keys), batch_rows):
+            block_keys = keys[start:start + batch_rows]
+            block = np.empty(len(block_keys), dtype=records.dtype)
+            for name in CHUNK_KEY_DTYPE.names:
+                block[name] = block_keys[name]
+            known = np.zeros(len(block_keys), dtype=bool)
+            if previous is not None:
+                old_rows = previous.rows_for_ids(block_keys['id'])
+                known = old_rows >= 0
+                old = previous.records[old_rows[known]]
+                known[known] = (
+                    (old['content_hash'] == block_keys['content_hash'][known])
+                    & (old['start'] == block_keys['start'][known])
+                    & (old['end'] == block_keys['end'][known])
+                )
+                block['vector'][known] = previous.vectors[old_rows[known]]
+            if not known.all():
+                block['vector'][~known] = vectors_for(start + np.flatnonzero(~known))
+            records[start:start + len(block)] = block
+        records.flush()
+        del records
+
+
+class VectorShards:
+    """Full-precision vectors spread over one side file per index shard, re-ranked as one."""
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def rerank(self, query_vector, chunk_ids):
+        distances = np.full(len(chunk_ids), np.inf, dtype=np.float32)
+        for shard in self.shards:
+            # Each chunk id lives in exactly one shard; the others report inf for it
+            distances = np.minimum(distances, shard.distances(query_vector, chunk_ids))
+        return _ranked(distances, chunk_ids)
+
+
+def _ranked(distances, chunk_ids):
+    ranking = np.argsort(distances, kind='stable')
+    return distances[ranking], np.asarray(chunk_ids)[ranking]
@@ -0,0 +1,291 @@
+import os
+
+import numpy as np
+
+from .ann_index import create_index, fit_index_spec, has_transform, is_id_keyed, read_index, supports_removal, write_index
+from .binary_index import is_binary_spec
+from .chunking import ChunkTable
+from .embedding_cache import EmbeddingCache
+from .full_vectors import FullPrecisionVectors, chunk_keys
+from .index_manifest import IndexManifest
+from .index_sync import diff_documents, new_sync_stats, replace_file, sync_index
+from .parallel_encoder import ParallelEncoder
+
+
+def index_artifact_path(index_file_path, suffix):
+    """Path of a sidecar file stored next to the FAISS index (e.g. '.chunks.npy')."""
+    return os.path.splitext(index_file_path)[0] + suffix
+
+
+class ChunkEncoder:
+    """
+    Encodes chunk texts through the embedding cache, falling back to the model (or a
+    pool of worker processes) only for texts never seen before. The cache and pool
+    are opened on first use, so a build with nothing to embed never starts them.
+    """
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.cache = None
+        self.parallel = None
+
+    def encode_uncached(self, texts):
+        builder = self.builder
+        if builder.embedding_workers <= 1:
+            return builder.model.encode(texts, batch_size=builder.embedding_batch_size)
+        if self.parallel is None:
+            print(f"Starting {builder.embedding_workers} embedding worker processes...")
+            self.parallel = ParallelEncoder(builder.model_name, builder.embedding_workers, builder.embedding_batch_size)
+        return self.parallel.encode(texts)
+
+    def __call__(self, texts):
+        if self.cache is None:
+            self.cache = self.builder.open_embedding_cache()
+        return self.cache.encode(texts, self.encode_uncached)
+
+    def close(self, stats=None):
+        """Stops the worker pool and reports cache hits and misses and the pool's throughput (into stats, if given)."""
+        if self.parallel is not None:
+            self.parallel.close()
+            if stats is not None:
+                stats['worker_texts'], stats['worker_seconds'] = self.parallel.texts_encoded, self.parallel.seconds
+            self.parallel = None
+        if self.cache is not None:
+            print(self.cache.stats_line())
+            if stats is not None:
+                stats['cache_hits'], stats['cache_misses'] = self.cache.hits, self.cache.misses
+
+
+class IndexBuilder:
+    """
+    Write path for the FAISS index and its sidecar files (chunk table, index manifest
+    and, for re-ranking, the full-precision vector file).
+    Loads whatever was built before, applies the changes in the document store
+    through the embedding cache, and saves the result. The web process only ever
+    reads these artifacts; building them is done by `manage.py build_rag_index`.
+    """
+
+    def __init__(self, index_file_path, store, model, model_name, chunker, index_spec='Flat', train_sample=50000,
+                 full_vectors=False, embedding_workers=1, embedding_batch_size=32, index_batch_size=256, cache_dir=None,
+                 doc_mask=None):
+        self.index_file_path = index_file_path
+        self.store = store
+        self.model = model
+        self.model_name = model_name
+        self.chunker = chunker
+        self.index_spec = index_spec # faiss.index_factory spec, e.g. 'Flat', 'IVF1024,Flat', 'HNSW32'
+        self.train_sample = train_sample # chunk vectors used to train IVF/PQ indexes
+        # Keep float32 vectors next to a quantized index for re-ranking; binary and dimension-reduced
+        # indexes always need them
+        self.full_vectors = full_vectors or is_binary_spec(index_spec) or has_transform(index_spec)
+        self.full_vectors_path = index_artifact_path(index_file_path, '.vectors.npy')
+        self.embedding_workers = embedding_workers
+        self.embedding_batch_size = embedding_batch_size
+        self.index_batch_size = index_batch_size
+        self.cache_dir = cache_dir or index_artifact_path(index_file_path, '.embeddings')
+        # Store positions this index covers (one shard of a sharded index); None means every article
+        self.doc_mask = doc_mask
+
+    @property
+    def indexable_mask(self):
+        if self.doc_mask is None:
+            return self.store.canonical_mask
+        return self.store.canonical_mask & self.doc_mask
+
+    @property
+    def training_points(self):
+        """Lower bound on the chunk vectors train() gets: one per sampled article."""
+        return min(self.train_sample, int(self.indexable_mask.sum()))
+
+    @property
+    def fitted_spec(self):
+        """index_spec scaled down to what the articles this index covers can train (see fit_index_spec)."""
+        return fit_index_spec(self.index_spec, self.training_points)
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def new_manifest(self, trained_spec=None):
+        return IndexManifest(self.model_name, self.dimension, self.chunker.config_key, self.index_spec,
+                             trained_spec=trained_spec)
+
+    def new_index(self):
+        spec = self.fitted_spec
+        if spec != self.index_spec:
+            print(f"FAISS index spec '{self.index_spec}' needs more training data than {self.training_points} "
+                  f"articles; building '{spec}' instead.")
+        return create_index(self.dimension, spec), ChunkTable.create_empty(), self.new_manifest(spec)
+
+    def load(self, mmap=False):
+        """
+        Reads the prebuilt index and its sidecars and checks, without running the
+        model, that they belong together and match the current model and chunking.
+        With mmap, the index and chunk table are memory-mapped read-only (for serving
+        processes only: a mapped index cannot be updated).
+        Returns (index, chunks, manifest); raises if they are missing or inconsistent.
+        """
+        manifest = IndexManifest.load(index_artifact_path(self.index_file_path, ''))
+        problems = manifest.config_problems(self.model_name, self.dimension, self.chunker.config_key, self.index_spec)
+        if problems:
+            raise ValueError("index was built with a different configuration: " + "; ".join(problems))
+        index = read_index(self.index_file_path, mmap=mmap, binary=is_binary_spec(self.index_spec))
+        chunks = ChunkTable.load(index_artifact_path(self.index_file_path, '.chunks.npy'), mmap=mmap)
+        if not is_id_keyed(index):
+            raise ValueError("index is not keyed by chunk id (built by an older version)")
+        if not index.ntotal == manifest.ntotal == len(chunks):
+            raise ValueError(f"index has {index.ntotal} vectors, the manifest records {manifest.ntotal} "
+                             f"and the chunk table has {len(chunks)} rows")
+        chunks.bind(self.store)
+        return index, chunks, manifest
+
+    def exists(self):
+        return os.path.exists(self.index_file_path)
+
+    def pending_changes(self, manifest):
+        """
+        (articles to embed, articles to remove) for bringing a loaded index up to date
+        with the document store: O(1) when the manifest names this exact snapshot.
+        """
+        if manifest.matches_corpus(self.store):
+            return 0, 0
+        positions, removed_doc_ids = diff_documents(manifest, self.store, self.doc_mask)
+        return len(positions), len(removed_doc_ids)
+
+    def save(self, index, chunks, manifest):
+        manifest.ntotal = index.ntotal
+        replace_file(self.index_file_path, lambda path: write_index(index, path))
+        replace_file(index_artifact_path(self.index_file_path, '.chunks.npy'), chunks.save)
+        # The manifest goes last: it is what vouches for the files written before it
+        self.save_manifest(manifest)
+
+    def save_manifest(self, manifest):
+        manifest.save(index_artifact_path(self.index_file_path, ''), replace_file)
+
+    def load_full_vectors(self, chunks):
+        """Memory-maps the full-precision vector file; raises if it is missing or does not match chunks."""
+        vectors = FullPrecisionVectors.load(self.full_vectors_path)
+        if len(vectors) != len(chunks) or vectors.vectors.shape[1] != self.dimension:
+            raise ValueError(f"{self.full_vectors_path} holds {len(vectors)} vectors, the index has {len(chunks)} chunks")
+        return vectors
+
+    def save_full_vectors(self, chunks, encode):
+        """
+        Brings the full-precision vector file in line with the chunk table. Vectors of
+        chunks stored with the same article content hash and span are copied; the rest,
+        including every chunk of an edited article, come through encode (in practice
+        the embedding cache, which the index build has just filled).
+        """
+        keys = chunk_keys(chunks, self.store)
+        previous = None
+        if os.path.exists(self.full_vectors_path):
+            try:
+                previous = FullPrecisionVectors.load(self.full_vectors_path)
+                if previous.vectors.shape[1] != self.dimension:
+                    previous = None
+                elif previous.matches(keys):
+                    return
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable full-precision vectors at {self.full_vectors_path}: {e}")
+                previous = None
+        print(f"Writing full-precision vectors for re-ranking to {self.full_vectors_path}...")
+        replace_file(self.full_vectors_path, lambda path: FullPrecisionVectors.write(
+            path, keys, self.dimension,
+            lambda rows: np.asarray(encode(chunks.texts(self.store, rows)), dtype='float32'),
+            previous=previous,
+        ))
+
+    def open_encoder(self):
+        return ChunkEncoder(self)
+
+    def open_embedding_cache(self):
+        return EmbeddingCache(
+            self.cache_dir, self.model_name, self.chunker.config_key, self.dimension
+        )
+
+    def train(self, index, encode):
+        """
+        Trains an IVF/PQ index on chunk vectors of a random sample of articles. The
+        sample goes through the embedding cache, so the build reuses those vectors.
+        """
+        rng = np.random.RandomState(0)
+        positions = np.sort(rng.permutation(np.flatnonzero(self.indexable_mask))[:self.train_sample])
+        sample = ChunkTable.build(self.store, self.chunker, positions)
+        rows = np.sort(rng.permutation(len(sample))[:self.train_sample])
+        vectors = np.asarray(encode(sample.texts(self.store, rows)), dtype='float32')
+        print(f"Training FAISS index '{self.fitted_spec}' on {len(vectors)} chunk vectors...")
+        index.train(vectors)
+
+    def build(self, rebuild=False, checkpoint_every=None, encoder=None):
+        """
+        Loads the existing index (unless rebuild is set) or starts an empty one, then
+        syncs it with the document store. With checkpoint_every, the artifacts are
+        saved every that many batches so an interrupted build resumes where it stopped.
+        encoder (a ChunkEncoder) lets several builds share one embedding cache and
+        worker pool; by default the build opens and closes its own.
+        Returns (index, chunks, stats).
+        """
+        index = None
+        if not rebuild and self.exists():
+            try:
+                print(f"Attempting to load FAISS index from {self.index_file_path}...")
+                index, chunks, manifest = self.load()
+                print(f"FAISS index loaded ({index.ntotal} chunks from {len(manifest.doc_ids)} articles).")
+            except Exception as e:
+                print(f"ERROR: Failed to load FAISS index from {self.index_file_path}: {e}")
+                print("Recreating the index (cached embeddings are reused)...")
+        up_to_date = False
+        loaded = index is not None
+        if index is None:
+            index, chunks, manifest = self.new_index()
+        elif manifest.matches_corpus(self.store):
+            print("FAISS index manifest matches the corpus snapshot; nothing to update.")
+            up_to_date = True
+        elif not supports_removal(index) and len(diff_documents(manifest, self.store, self.doc_mask)[1]):
+            print(f"FAISS index '{self.index_spec}' cannot remove vectors; rebuilding it (cached embeddings are reused)...")
+            index, chunks, manifest = self.new_index()
+            loaded = False
+        elif manifest.trained_spec != self.fitted_spec:
+            print(f"FAISS index was trained as '{manifest.trained_spec}'; {self.training_points} articles now call for "
+                  f"'{self.fitted_spec}'. Rebuilding it (cached embeddings are reused)...")
+            index, chunks, manifest = self.new_index()
+            loaded = False
+
+        # Chunk vectors come from the embedding cache when possible, so rebuilding the
+        # index (new index type, corrupt file) only runs the model on never-seen text
+        own_encoder = encoder is None
+        encode = self.open_encoder() if own_encoder else encoder
+
+        def checkpoint(partial_chunks, partial_manifest):
+            # A partial build must never pass the O(1) "matches this corpus" check
+            partial_manifest.snapshot_fingerprint = None
+            self.save(index, partial_chunks, partial_manifest)
+            print(f"Checkpoint saved: {len(partial_manifest.doc_ids)} articles, {index.ntotal} chunks indexed.")
+
+        stats = new_sync_stats()
+        try:
+            if not up_to_date:
+                if not index.is_trained:
+                    self.train(index, encode)
+                chunks, manifest, stats = sync_index(
+                    index, chunks, manifest, self.store, self.chunker, encode,
+                    batch_size=self.index_batch_size, checkpoint_every=checkpoint_every, on_checkpoint=checkpoint,
+                    doc_mask=self.doc_mask,
+                )
+            if self.full_vectors:
+                self.save_full_vectors(chunks, encode)
+        finally:
+            if own_encoder:
+                encode.close(stats)
+        stats['indexed_docs'] = len(manifest.doc_ids)
+        if not up_to_date:
+            # Saved even when no article changed, so the manifest records the new snapshot
+            # and the next startup can validate in O(1)
+            manifest.snapshot_fingerprint = self.store.snapshot_fingerprint
+            if loaded and not (stats['embedded_docs'] or stats['removed_docs']):
+                # Nothing this index covers changed: leave the index and chunk files untouched
+                self.save_manifest(manifest)
+            else:
+                self.save(index, chunks, manifest)
+                print(f"FAISS index saved to {self.index_file_path} ({index.ntotal} chunks from {len(manifest.doc_ids)} articles).")
+        return index, chunks, stats
@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+
+from .document_store import matches_snapshot
+from .index_sync import save_json, save_npy
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+class IndexManifest:
+    """
+    Sidecar describing what the FAISS index holds: the embedding model, vector
+    dimension, chunking and index_factory spec it was built with (and the spec it was
+    actually trained as, scaled to the data by fit_index_spec), the fingerprint of the corpus
+    snapshot it was synced against (see document_store.snapshot_fingerprint), and the DOC_ID / content hash of every
+    indexed article. Scalars live in '<index>.manifest.json' and the per-article
+    arrays in two .npy files next to it, so validation never needs the model.
+    """
+
+    def __init__(self, model_name, dimension, chunking, index_spec='Flat', doc_ids=None, content_hashes=None,
+                 snapshot_fingerprint=None, ntotal=0, trained_spec=None):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.chunking = chunking
+        self.index_spec = index_spec
+        self.trained_spec = trained_spec or index_spec
+        self.doc_ids = np.empty(0, dtype=np.int64) if doc_ids is None else doc_ids
+        self.content_hashes = np.empty(0, dtype=np.uint64) if content_hashes is None else content_hashes
+        self.snapshot_fingerprint = snapshot_fingerprint
+        self.ntotal = ntotal
+
+    @staticmethod
+    def _paths(base_path):
+        return base_path + '.manifest.json', base_path + '.docids.npy', base_path + '.dochashes.npy'
+
+    @classmethod
+    def load(cls, base_path):
+        json_path, ids_path, hashes_path = cls._paths(base_path)
+        with open(json_path) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != MANIFEST_FORMAT_VERSION:
+            raise ValueError(f"unsupported index manifest version {meta.get('format_version')}")
+        manifest = cls(
+            meta['model_name'], meta['dimension'], meta['chunking'], index_spec=meta.get('index_spec', 'Flat'),
+            doc_ids=np.load(ids_path, mmap_mode='r'),
+            content_hashes=np.load(hashes_path, mmap_mode='r'),
+            snapshot_fingerprint=meta.get('snapshot_fingerprint'), ntotal=meta['ntotal'],
+            trained_spec=meta.get('trained_spec'),
+        )
+        if len(manifest.doc_ids) != meta['indexed_docs'] or len(manifest.content_hashes) != meta['indexed_docs']:
+            raise ValueError("index manifest arrays do not match its recorded article count")
+        return manifest
+
+    def save(self, base_path, write_file):
+        """Writes the manifest; write_file(path, writer) is used so each file is replaced atomically."""
+        json_path, ids_path, hashes_path = self._paths(base_path)
+        # The arrays go first so a manifest on disk never points at arrays from an older build
+        write_file(ids_path, lambda path: save_npy(path, self.doc_ids))
+        write_file(hashes_path, lambda path: save_npy(path, self.content_hashes))
+        meta = {
+            'format_version': MANIFEST_FORMAT_VERSION,
+            'model_name': self.model_name,
+            'dimension': self.dimension,
+            'chunking': self.chunking,
+            'index_spec': self.index_spec,
+            'trained_spec': self.trained_spec,
+            'snapshot_fingerprint': self.snapshot_fingerprint,
+            'indexed_docs': len(self.doc_ids),
+            'ntotal': self.ntotal,
+        }
+        write_file(json_path, lambda path: save_json(path, meta))
+
+    def with_documents(self, doc_ids, content_hashes):
+        """Copy of the manifest describing a different set of indexed articles."""
+        return IndexManifest(
+            self.model_name, self.dimension, self.chunking, self.index_spec, doc_ids=doc_ids, content_hashes=content_hashes,
+            snapshot_fingerprint=self.snapshot_fingerprint, ntotal=self.ntotal,
+            trained_spec=self.trained_spec,
+        )
+
+    def config_problems(self, model_name, dimension, chunking, index_spec):
+        """Reasons the index cannot be reused as-is (empty when it can)."""
+        problems = []
+        if self.model_name != model_name:
+            problems.append(f"model '{self.model_name}' != '{model_name}'")
+        if self.dimension != dimension:
+            problems.append(f"dimension {self.dimension} != {dimension}")
+        if self.chunking != chunking:
+            problems.append(f"chunking '{self.chunking}' != '{chunking}'")
+        if self.index_spec != index_spec:
+            problems.append(f"index spec '{self.index_spec}' != '{index_spec}'")
+        return problems
+
+    def matches_corpus(self, store):
+        """O(1) check that the index was synced against exactly this corpus snapshot."""
+        return matches_snapshot(self.snapshot_fingerprint, store)
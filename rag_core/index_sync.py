@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from .chunking import ChunkTable
+
+
+def diff_documents(manifest, store, doc_mask=None):
+    """
+    Compares the indexed articles with the document store.
+    Returns (positions to embed, DOC_IDs to remove): new and edited articles are
+    embedded, while deleted and edited articles have their old chunks removed.
+    Only canonical articles are indexed; near-duplicate copies are reached through
+    their canonical article, so an article that becomes an alias is removed too.
+    doc_mask limits the index to some store positions (one shard of a sharded
+    index); indexed articles outside it are removed.
+    """
+    indexable = store.canonical_mask
+    if doc_mask is not None:
+        indexable = indexable & doc_mask
+    indexed_positions = store.positions_for_doc_ids(manifest.doc_ids)
+    still_present = indexed_positions >= 0
+    unchanged = np.zeros(len(manifest.doc_ids), dtype=bool)
+    present_positions = indexed_positions[still_present]
+    unchanged[still_present] = (
+        (store.content_hashes[present_positions] == manifest.content_hashes[still_present])
+        & indexable[present_positions]
+    )
+
+    to_remove = manifest.doc_ids[~unchanged]
+    to_embed = np.asarray(indexable).copy()
+    to_embed[indexed_positions[unchanged]] = False
+    return np.flatnonzero(to_embed), to_remove
+
+
+def new_sync_stats():
+    """Counters and stage timings reported by sync_index (all zero: nothing done yet)."""
+    return {
+        'embedded_docs': 0, 'embedded_chunks': 0, 'removed_docs': 0,
+        'chunk_seconds': 0.0, 'embed_seconds': 0.0, 'add_seconds': 0.0,
+    }
+
+
+def _manifest_after(manifest, removed_doc_ids, store, added_positions):
+    kept = ~np.isin(manifest.doc_ids, removed_doc_ids)
+    return manifest.with_documents(
+        doc_ids=np.concatenate([manifest.doc_ids[kept], np.asarray(store.doc_ids[added_positions], dtype=np.int64)]),
+        content_hashes=np.concatenate([
+            manifest.content_hashes[kept], np.asarray(store.content_hashes[added_positions], dtype=np.uint64)
+        ]),
+    )
+
+
+def sync_index(index, chunks, manifest, store, chunker, encode, batch_size=256, checkpoint_every=None, on_checkpoint=None,
+               doc_mask=None):
+    """
+    Brings an ID-mapped index up to date with the document store in place: chunks of
+    deleted or edited articles are removed with remove_ids, and only new or edited
+    articles are chunked, encoded and added with add_with_ids.
+    Every checkpoint_every batches, on_checkpoint(chunks, manifest) is called with a
+    consistent view of the work done so far, so an interrupted sync can resume
+    from it (the next diff only sees the articles that were not reached).
+    Returns (chunks, manifest, stats) where stats counts the work done and the time
+    spent chunking, embedding and adding.
+    """
+    stats = new_sync_stats()
+    positions, removed_doc_ids = diff_documents(manifest, store, doc_mask)
+    if len(positions) == 0 and len(removed_doc_ids) == 0:
+        return chunks, manifest, stats
+    print(f"Index sync: {len(positions)} articles to embed, {len(removed_doc_ids)} to remove "
+          f"({len(manifest.doc_ids)} currently indexed).")
+
+    if len(removed_doc_ids):
+        removed_chunk_ids = chunks.ids[np.isin(chunks.doc_ids, removed_doc_ids)]
+        index.remove_ids(faiss.IDSelectorBatch(removed_chunk_ids))
+        chunks = chunks.without_doc_ids(removed_doc_ids)
+        stats['removed_docs'] = len(removed_doc_ids)
+
+    batches = [chunks]
+    started = time.perf_counter()
+    for batch_number, start in enumerate(range(0, len(positions), batch_size), start=1):
+        batch_positions = positions[start:start + batch_size]
+        stage_started = time.perf_counter()
+        batch = ChunkTable.build(store, chunker, batch_positions)
+        texts = batch.texts(store)
+        stats['chunk_seconds'] += time.perf_counter() - stage_started
+        if len(batch):
+            stage_started = time.perf_counter()
+            embeddings = np.asarray(encode(texts), dtype='float32')
+            stats['embed_seconds'] += time.perf_counter() - stage_started
+            stage_started = time.perf_counter()
+            index.add_with_ids(embeddings, batch.ids)
+            stats['add_seconds'] += time.perf_counter() - stage_started
+        batches.append(batch)
+        stats['embedded_docs'] += len(batch_positions)
+        stats['embedded_chunks'] += len(batch)
+
+        if on_checkpoint is not None and checkpoint_every and batch_number % checkpoint_every == 0 \
+                and stats['embedded_docs'] < len(positions):
+            batches = [ChunkTable.concatenate(batches)]
+            on_checkpoint(batches[0], _manifest_after(manifest, removed_doc_ids, store, positions[:stats['embedded_docs']]))
+
+    if len(positions):
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"Index sync: embedded {len(positions)} articles ({stats['embedded_chunks']} chunks) in {elapsed:.1f}s "
+              f"-- {len(positions) / elapsed:.1f} docs/sec, {stats['embedded_chunks'] / elapsed:.1f} chunks/sec.")
+    chunks = ChunkTable.concatenate(batches)
+    chunks.bind(store)
+    return chunks, _manifest_after(manifest, removed_doc_ids, store, positions), stats
+
+
+def replace_file(path, write):
+    """
+    Writes a file through a uniquely named temporary sibling and renames it into
+    place, so processes replacing the same file concurrently never write into each
+    other's temporary file; the last rename wins.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+    os.close(fd)
+    try:
+        # mkstemp creates the file private to its owner; artifacts are read by the web processes too
+        os.chmod(tmp_path, 0o644)
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_npy(path, array):
+    """Writer for replace_file: saves an array to exactly path (np.save appends .npy to other names)."""
+    with open(path, 'wb') as f:
+        np.save(f, np.asarray(array))
+
+
+def save_json(path, meta):
+    """Writer for replace_file: dumps a metadata dict as indented JSON."""
+    with open(path, 'w') as f:
+        json.dump(meta, f, indent=2)
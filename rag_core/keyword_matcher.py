@@ -0,0 +1,61 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Version of the matching rules below; agent tags computed under other rules are recomputed
+MATCH_RULES = 'word-boundary-v1'
+
+
+def compile_keywords(keywords):
+    """
+    One case-insensitive regex matching any of the keywords as whole words, with an
+    optional plural ending ('bus' matches 'buses' but not 'business', 'fir' not
+    'first'). Spaces inside a keyword match any run of whitespace. Longer keywords
+    are tried first so 'namma metro' wins over 'metro'.
+    """
+    alternatives = [
+        r'\s+'.join(re.escape(word) for word in keyword.split())
+        for keyword in sorted(set(keyword.lower() for keyword in keywords if keyword.strip()), key=len, reverse=True)
+    ]
+    if not alternatives:
+        return None
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')(?:e?s)?\b', re.IGNORECASE)
+
+
+class KeywordMatcher:
+    """
+    Each agent's keywords compiled once into a single word-boundary regex, so a text
+    is checked in one pass instead of one substring scan per keyword. Results for
+    texts passed with a doc_id are kept in a bounded LRU keyed by (agent, DOC_ID,
+    text hash), so the same passage of the same article is only scanned once.
+    """
+
+    def __init__(self, agent_keywords, cache_size=10000):
+        self.patterns = {agent_id: compile_keywords(keywords) for agent_id, keywords in agent_keywords.items()}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def agents(self):
+        return list(self.patterns)
+
+    def matches(self, agent_id, text, doc_id=None):
+        """Whether text contains any of the agent's keywords (always True for agents without keywords)."""
+        pattern = self.patterns.get(agent_id)
+        if pattern is None:
+            return True
+        if doc_id is None or self.cache_size <= 0:
+            return pattern.search(text) is not None
+        key = (agent_id, doc_id, hash(text))
+        with self._lock:
+            matched = self._cache.get(key)
+            if matched is not None:
+                self._cache.move_to_end(key)
+                return matched
+        matched = pattern.search(text) is not None
+        with self._lock:
+            self._cache[key] = matched
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return matched
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from .document_store import matches_snapshot
+from .index_sync import replace_file, save_json, save_npy
+
+_WORD = re.compile(r'\w+')
+
+LEXICAL_FORMAT_VERSION = 1
+# Title words are counted this many times, so a name in the headline outweighs one in passing
+TITLE_WEIGHT = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+_ARRAYS = ('terms', 'indptr', 'postings', 'frequencies', 'doc_ids', 'doc_lengths')
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def term_hash(term):
+    """Stable 64-bit id of a term; the vocabulary is stored as sorted hashes rather than strings."""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _hashes(terms):
+    return np.fromiter((term_hash(term) for term in terms), dtype=np.uint64, count=len(terms))
+
+
+class BM25Index:
+    """
+    Inverted index over DOC_TITL + DOC_DET of the canonical articles, for exact
+    matches on rare names (MUDA, BMRCL, locality names, FIR numbers) that dense
+    embeddings blur. Postings are CSR arrays: the postings of the term at row t of
+    the sorted term hashes are postings[indptr[t]:indptr[t + 1]] (article rows)
+    with their term frequencies, so BM25 scoring is a handful of array slices per
+    query term. Every array is a .npy file in '<index>.bm25/', loaded with mmap.
+    """
+
+    def __init__(self, arrays, average_length, snapshot_fingerprint=None):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.average_length = average_length
+        self.snapshot_fingerprint = snapshot_fingerprint
+        self.positions = None # article row -> document store position, set by bind()
+
+    @classmethod
+    def build(cls, store, block_rows=5000):
+        """Tokenizes every canonical article in the store and builds the postings."""
+        positions = np.flatnonzero(store.canonical_mask)
+        vocabulary = {}
+        doc_lengths = np.zeros(len(positions), dtype=np.int32)
+        term_blocks, row_blocks, frequency_blocks = [], [], []
+        for start in range(0, len(positions), block_rows):
+            block = positions[start:start + block_rows]
+            titles = store.texts('title', int(block[0]), int(block[-1]) + 1)
+            contents = store.texts('content', int(block[0]), int(block[-1]) + 1)
+            for row, position in enumerate(block, start=start):
+                offset = position - block[0]
+                words = tokenize(titles[offset]) * TITLE_WEIGHT + tokenize(contents[offset])
+                doc_lengths[row] = len(words)
+                if not words:
+                    continue
+                term_ids = np.fromiter(
+                    (vocabulary.setdefault(word, len(vocabulary)) for word in words), dtype=np.int64, count=len(words)
+                )
+                terms, frequencies = np.unique(term_ids, return_counts=True)
+                term_blocks.append(terms)
+                row_blocks.append(np.full(len(terms), row, dtype=np.int32))
+                frequency_blocks.append(frequencies.astype(np.int32))
+
+        # Renumber terms by hash order, then group the postings by term
+        hashes = _hashes(list(vocabulary))
+        hash_order = np.argsort(hashes)
+        term_rows = np.empty(len(hashes), dtype=np.int64)
+        term_rows[hash_order] = np.arange(len(hashes))
+        terms = term_rows[np.concatenate(term_blocks)] if term_blocks else np.empty(0, dtype=np.int64)
+        rows = np.concatenate(row_blocks) if row_blocks else np.empty(0, dtype=np.int32)
+        frequencies = np.concatenate(frequency_blocks) if frequency_blocks else np.empty(0, dtype=np.int32)
+        order = np.lexsort((rows, terms))
+        indptr = np.zeros(len(hashes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(hashes)), out=indptr[1:])
+        arrays = {
+            'terms': hashes[hash_order],
+            'indptr': indptr,
+            'postings': rows[order],
+            'frequencies': frequencies[order],
+            'doc_ids': np.asarray(store.doc_ids[positions], dtype=np.int64),
+            'doc_lengths': doc_lengths,
+        }
+        index = cls(arrays, float(doc_lengths.mean()) if len(doc_lengths) else 0.0, store.snapshot_fingerprint)
+        index.bind(store)
+        return index
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != LEXICAL_FORMAT_VERSION:
+            raise ValueError(f"unsupported BM25 index version {meta.get('format_version')}")
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in _ARRAYS}
+        if len(arrays['indptr']) != len(arrays['terms']) + 1 or arrays['indptr'][-1] != len(arrays['postings']):
+            raise ValueError("BM25 index arrays are inconsistent")
+        return cls(arrays, meta['average_length'], meta.get('snapshot_fingerprint'))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            replace_file(os.path.join(directory, name + '.npy'), lambda path, name=name: save_npy(path, getattr(self, name)))
+        meta = {
+            'format_version': LEXICAL_FORMAT_VERSION,
+            'average_length': self.average_length,
+            'snapshot_fingerprint': self.snapshot_fingerprint,
+        }
+        # Written last: the metadata vouches for the arrays written before it
+        replace_file(os.path.join(directory, 'meta.json'), lambda path: save_json(path, meta))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def matches_corpus(self, store):
+        return matches_snapshot(self.snapshot_fingerprint, store)
+
+    def bind(self, store):
+        """Resolves every indexed article's DOC_ID to its position in the given document store."""
+        self.positions = store.positions_for_doc_ids(self.doc_ids)
+
+    def search(self, query, k, doc_mask=None):
+        """
+        BM25 top-k articles for the query. doc_mask (over document store positions)
+        restricts the result to some articles. Returns (positions, scores), best first.
+        """
+        hashes = np.unique(_hashes(tokenize(query)))
+        if len(hashes) == 0 or len(self.terms) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        term_rows = np.minimum(np.searchsorted(self.terms, hashes), len(self.terms) - 1)
+        term_rows = term_rows[self.terms[term_rows] == hashes]
+
+        rows, weights = [], []
+        for term_row in term_rows:
+            start, end = int(self.indptr[term_row]), int(self.indptr[term_row + 1])
+            postings = self.postings[start:end]
+            frequencies = self.frequencies[start:end].astype(np.float32)
+            idf = np.log(1.0 + (len(self) - (end - start) + 0.5) / ((end - start) + 0.5))
+            length_norm = 1.0 - BM25_B + BM25_B * self.doc_lengths[postings] / max(self.average_length, 1e-9)
+            rows.append(postings)
+            weights.append(idf * frequencies * (BM25_K1 + 1.0) / (frequencies + BM25_K1 * length_norm))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+        positions = self.positions[matched]
+        keep = positions >= 0
+        if doc_mask is not None:
+            keep[keep] = doc_mask[positions[keep]]
+        positions, scores = positions[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[top], scores[top]
+        ranking = np.argsort(-scores, kind='stable')
+        return positions[ranking], scores[ranking]
+
+
+def update_lexical_index(directory, store):
+    """Loads the BM25 index from directory, rebuilding and saving it when it does not match the store."""
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        try:
+            index = BM25Index.load(directory)
+            if index.matches_corpus(store):
+                index.bind(store)
+                return index
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable BM25 index at {directory}: {e}")
+    print(f"Building BM25 index over titles and article text into {directory}...")
+    index = BM25Index.build(store)
+    index.save(directory)
+    print(f"BM25 index saved ({len(index)} articles, {len(index.terms)} terms, {len(index.postings)} postings).")
+    return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses rankings (arrays of document store positions, best first) by reciprocal
+    rank: each list adds 1 / (k + rank) to the score of every document it contains.
+    Returns the positions ordered by fused score; ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[int(position)] = scores.get(int(position), 0.0) + 1.0 / (k + rank)
+    ordered = sorted(scores.items(), key=lambda item: -item[1])
+    return np.array([position for position, _ in ordered], dtype=np.int64)
+
+
+def query_term_counts(query, texts):
+    """How many occurrences of the query's terms each text contains (used to pick a passage)."""
+    terms = set(tokenize(query))
+    return np.array([sum(word in terms for word in tokenize(text)) for text in texts], dtype=np.int64)
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Per-process model, loaded once by the pool initializer
+_worker_model = None
+_worker_batch_size = 32
+
+
+def _init_worker(model_name, batch_size, threads_per_worker):
+    global _worker_model, _worker_batch_size
+    # Keep workers from each grabbing every core for intra-op threads
+    os.environ.setdefault('OMP_NUM_THREADS', str(threads_per_worker))
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    from sentence_transformers import SentenceTransformer
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    _worker_model = SentenceTransformer(model_name)
+    _worker_batch_size = batch_size
+
+
+def _encode_shard(texts):
+    return np.asarray(_worker_model.encode(texts, batch_size=_worker_batch_size), dtype=np.float32)
+
+
+class ParallelEncoder:
+    """
+    Encodes texts across a pool of worker processes, each holding its own
+    SentenceTransformer. Input is cut into contiguous shards and the partial
+    embedding matrices are stitched back together in input order.
+    Use as a context manager (or call close()) so the workers are shut down.
+    """
+
+    def __init__(self, model_name, workers, batch_size=32, shard_size=None):
+        self.model_name = model_name
+        self.workers = workers
+        self.batch_size = batch_size
+        # Several shards per worker keeps the pool busy when shard costs differ
+        self.shard_size = shard_size or batch_size * 4
+        threads_per_worker = max(1, (os.cpu_count() or workers) // workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'), # fork is unsafe once torch has started threads
+            initializer=_init_worker,
+            initargs=(model_name, batch_size, threads_per_worker),
+        )
+        self.texts_encoded = 0
+        self.seconds = 0.0
+
+    def encode(self, texts):
+        started = time.perf_counter()
+        shards = [texts[start:start + self.shard_size] for start in range(0, len(texts), self.shard_size)]
+        parts = list(self._pool.map(_encode_shard, shards))
+        self.seconds += time.perf_counter() - started
+        self.texts_encoded += len(texts)
+        if not parts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(parts)
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
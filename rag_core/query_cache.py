@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .index_sync import replace_file
+
+QUERY_CACHE_FORMAT_VERSION = 2
+
+
+def normalize_query(query):
+    """Cache key text of a query: case and whitespace are folded (the MiniLM tokenizer is uncased)."""
+    return ' '.join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings, so repeated questions ("metro news
+    today", "bangalore rain") skip transformer inference. Entries are keyed by the
+    normalized query text under one model name; the least recently used entry is
+    evicted once capacity is reached. With a path, the entries are saved to
+    '<path>.npz' every save_every new entries and reloaded on start. The queries,
+    their float32 vectors (least recent first) and the model name share one file,
+    so a process can never read vectors saved by another next to its own queries.
+    """
+
+    def __init__(self, model_name, dimension, capacity=1024, path=None, save_every=20):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.capacity = capacity
+        self.path = path
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # normalized query -> float32 vector
+        self._unsaved = 0
+        # Web servers may answer requests from several threads of one process
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path + '.npz'):
+            try:
+                self._load()
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable query embedding cache at {path}: {e}")
+                self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query, encode):
+        """
+        Embedding of the query as a (1, dimension) float32 array, calling
+        encode(query) only when it is not cached.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector[np.newaxis].copy()
+        # Encode outside the lock; two threads missing on the same query both encode it once
+        vector = np.asarray(encode(query), dtype=np.float32).reshape(self.dimension)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            save = self.path is not None and self._unsaved >= self.save_every
+        if save:
+            self.save()
+        return vector[np.newaxis].copy()
+
+    def _load(self):
+        with np.load(self.path + '.npz', allow_pickle=False) as saved:
+            meta = json.loads(str(saved['meta']))
+            if meta.get('format_version') != QUERY_CACHE_FORMAT_VERSION:
+                raise ValueError(f"unsupported query cache version {meta.get('format_version')}")
+            if meta['model_name'] != self.model_name or meta['dimension'] != self.dimension:
+                print(f"Query embedding cache at {self.path} was built for another model; starting empty.")
+                return
+            queries, vectors = saved['queries'].tolist(), saved['vectors']
+        if vectors.shape != (len(queries), self.dimension):
+            raise ValueError("query cache vectors do not match their queries")
+        # Keep the most recent entries when the capacity has shrunk
+        for query, vector in list(zip(queries, vectors))[-self.capacity:]:
+            self._entries[query] = vector
+
+    def save(self):
+        """
+        Writes the cached entries to disk (no-op without a path). A failed write is
+        only reported: the cache keeps serving from memory and retries later.
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            queries = list(self._entries)
+            vectors = np.array([self._entries[query] for query in queries], dtype=np.float32).reshape(-1, self.dimension)
+            self._unsaved = 0
+        meta = {
+            'format_version': QUERY_CACHE_FORMAT_VERSION,
+            'model_name': self.model_name,
+            'dimension': self.dimension,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            replace_file(self.path + '.npz', lambda path: _save_npz(path, meta, queries, vectors))
+        except Exception as e:
+            print(f"Warning: Could not save query embedding cache to {self.path}: {e}")
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"Query embedding cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate, {len(self)} entries)."
+
+
+def _save_npz(path, meta, queries, vectors):
+    # np.savez appends .npz to names without it, so write through an open file
+    with open(path, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), queries=np.array(queries, dtype=str), vectors=vectors)
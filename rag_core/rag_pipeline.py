@@ -1,18 +1,128 @@
+import atexit
 import os
+from itertools import count, islice
 import pandas as pd
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 from openai import OpenAI
 from django.conf import settings # To access Django settings (like API key)
+from .agent_tags import AgentTags, update_agent_tags
+from .answer_cache import SemanticAnswerCache
+from .ann_index import applies_selector, compose_spec, has_transform, search_parameters
+from .batching_encoder import BatchingEncoder
+from .binary_index import DEFAULT_RERANK_CANDIDATES, is_binary_spec
+from .chunking import Chunker
+from .corpus_snapshot import load_snapshot, open_snapshot
+from .document_store import DocumentStore
+from .search_filters import SearchFilter, chunk_selector, document_chunk_mask
+from .index_builder import IndexBuilder, index_artifact_path
+from .title_index import TitleIndex, similarity_from_distance, update_title_index
+from .lexical_index import BM25Index, query_term_counts, reciprocal_rank_fusion, update_lexical_index
+from .query_cache import QueryEmbeddingCache
+from .sharded_index import ShardedIndex, ShardedIndexBuilder
+
+
+def _setting(name, default):
+    """Reads an optional RAG tuning knob from Django settings."""
+    return getattr(settings, name, default)
+
+
+def create_chunker(model):
+    """Chunker configured from settings, measuring windows with the model's tokenizer."""
+    return Chunker(
+        getattr(model, 'tokenizer', None),
+        max_tokens=_setting('RAG_CHUNK_MAX_TOKENS', 200),
+        overlap_tokens=_setting('RAG_CHUNK_OVERLAP_TOKENS', 40),
+    )
+
+
+def index_spec_from_settings():
+    """FAISS_INDEX_SPEC with the optional FAISS_TRANSFORM (e.g. 'PCA128') in front of it."""
+    return compose_spec(_setting('FAISS_INDEX_SPEC', 'Flat'), _setting('FAISS_TRANSFORM', None))
+
+
+def create_index_builder(index_file_path, store, model, model_name, chunker):
+    """IndexBuilder configured from settings (a ShardedIndexBuilder when FAISS_SHARD_PERIOD is set)."""
+    options = {}
+    builder_class = IndexBuilder
+    if _setting('FAISS_SHARD_PERIOD', None):
+        builder_class = ShardedIndexBuilder
+        options = {
+            'period': _setting('FAISS_SHARD_PERIOD', None),
+            'search_threads': _setting('FAISS_SHARD_SEARCH_THREADS', 4),
+        }
+    return builder_class(
+        index_file_path, store, model, model_name, chunker,
+        index_spec=index_spec_from_settings(),
+        train_sample=_setting('FAISS_TRAIN_SAMPLE', 50000),
+        full_vectors=_setting('FAISS_RERANK_CANDIDATES', 0) > 0,
+        embedding_workers=_setting('RAG_EMBEDDING_WORKERS', 1),
+        embedding_batch_size=_setting('RAG_EMBEDDING_BATCH_SIZE', 32),
+        index_batch_size=_setting('RAG_INDEX_BATCH_SIZE', 256),
+        cache_dir=_setting('RAG_EMBEDDING_CACHE_DIR', None),
+        **options,
+    )
+
+
+def load_corpus(csv_file_path, snapshot_dir):
+    """Loads the document store, compiling the corpus snapshot from the CSV if it is stale."""
+    manifest, columns = load_snapshot(
+        csv_file_path, snapshot_dir,
+        block_rows=_setting('RAG_INGEST_BLOCK_ROWS', 5000),
+        dedup_threshold=_setting('RAG_DEDUP_THRESHOLD', 0.8),
+    )
+    return DocumentStore.from_snapshot(manifest, columns)
+
 
 class RAGPipeline:
-    def __init__(self, csv_file_path, index_file_path):
+    def __init__(self, csv_file_path, index_file_path, snapshot_dir=None, build_index=None, agent_keywords=None):
         self.csv_file_path = csv_file_path
         self.index_file_path = index_file_path
-        self.data = pd.DataFrame() # Initialize as empty DataFrame
+        # Columnar snapshot of the CSV; defaults to a directory next to the CSV
+        self.snapshot_dir = snapshot_dir or os.path.splitext(csv_file_path)[0] + '_snapshot'
+        # Whether this process may (re)build the snapshot and index, or only load prebuilt ones
+        self.build_index = _setting('RAG_BUILD_INDEX_ON_STARTUP', False) if build_index is None else build_index
+        self.data = DocumentStore.create_empty() # Initialize as empty document store
+        self.model_name = _setting('RAG_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
         self.model = None
+        self.query_cache = None # QueryEmbeddingCache: LRU of query vectors, so repeated questions skip the model
+        self.query_encoder = None # BatchingEncoder sharing model.encode calls between concurrent queries
+        # Query cache and batching counters are printed every this many retrievals (0 disables them)
+        self.query_stats_every = _setting('RAG_QUERY_STATS_EVERY', 500)
+        self._retrievals = count(1)
+        self.chunker = None
+        self.chunks = None # ChunkTable: FAISS chunk id -> article position, DOC_ID and character span
         self.index = None
+        # Chunk hits fetched per requested article, so several passages can collapse into one result
+        self.chunk_candidates_per_result = _setting('RAG_CHUNK_CANDIDATES_PER_RESULT', 4)
+        # Default recall/latency knobs for IVF (nprobe) and HNSW (efSearch) indexes
+        self.nprobe = _setting('FAISS_NPROBE', 16)
+        self.ef_search = _setting('FAISS_EF_SEARCH', 64)
+        # Chunk candidates re-scored against full-precision vectors (0 disables re-ranking);
+        # binary and dimension-reduced indexes are only a prefilter, so they always re-score
+        self.rerank_candidates = _setting('FAISS_RERANK_CANDIDATES', 0)
+        index_spec = _setting('FAISS_INDEX_SPEC', 'Flat')
+        if is_binary_spec(index_spec) or has_transform(index_spec) or _setting('FAISS_TRANSFORM', None):
+            self.rerank_candidates = self.rerank_candidates or DEFAULT_RERANK_CANDIDATES
+        self.full_vectors = None # FullPrecisionVectors side file, loaded when re-ranking is enabled
+        # Serving processes memory-map the prebuilt index so web workers share one copy
+        self.mmap_index = _setting('FAISS_MMAP_INDEX', True)
+        # BM25 articles fused with the FAISS results by reciprocal rank (0 disables lexical search)
+        self.lexical_candidates = _setting('RAG_BM25_CANDIDATES', 20)
+        self.rrf_k = _setting('RAG_RRF_K', 60)
+        self.lexical_index = None # BM25Index over titles and article text
+        # Headline vectors searched next to the chunks; combined per article as 'max' or 'sum' of the
+        # body similarity and title_weight * title similarity
+        self.title_candidates = _setting('RAG_TITLE_CANDIDATES', 20)
+        self.title_weight = _setting('RAG_TITLE_WEIGHT', 0.9)
+        self.title_combine = _setting('RAG_TITLE_COMBINE', 'max')
+        # Enough titles at least this similar answer the query without searching the chunks (None: always search)
+        self.title_first_similarity = _setting('RAG_TITLE_FIRST_SIMILARITY', 0.8)
+        self.title_index = None # TitleIndex of DOC_TITL vectors keyed by DOC_ID
+        # {agent id: keywords} of the personas whose searches are scoped to their tagged articles
+        self.agent_keywords = agent_keywords or {}
+        self.agent_tags = None # AgentTags: agent bitmask of every article
+        self.answer_cache = None # SemanticAnswerCache of LLM answers per agent
 
         print("Initializing RAGPipeline components...")
         self._initialize_components()
@@ -27,7 +137,7 @@ class RAGPipeline:
         # 1. Load Data
         self.data = self._load_data()
         if self.data.empty:
-            print("Status: Data loading FAILED or returned empty DataFrame.")
+            print("Status: Data loading FAILED or returned an empty document store.")
             return # Stop initialization if data is not loaded
 
         # 2. Load Embedding Model
@@ -35,6 +145,15 @@ class RAGPipeline:
         if self.model is None:
             print("Status: Embedding model loading FAILED.")
             return # Stop initialization if model is not loaded
+        self.chunker = create_chunker(self.model)
+        if _setting('RAG_QUERY_CACHE_SIZE', 1024) > 0:
+            self.query_cache = self._create_query_cache()
+        if _setting('RAG_QUERY_BATCH_SIZE', 16) > 1:
+            self.query_encoder = BatchingEncoder(
+                lambda texts: self.model.encode(texts, batch_size=len(texts)),
+                max_batch=_setting('RAG_QUERY_BATCH_SIZE', 16),
+                max_wait_ms=_setting('RAG_QUERY_BATCH_WAIT_MS', 5),
+            )
 
         # 3. Load or Create FAISS Index
         self.index = self._load_faiss_index()
@@ -42,12 +161,52 @@ class RAGPipeline:
             print("Status: FAISS index loading/creation FAILED.")
             return # Stop initialization if index is not loaded/created
 
+        # 4. Load or Create the title vector index (optional: retrieval then ranks by body chunks alone)
+        if self.title_candidates > 0:
+            self.title_index = self._load_title_index()
+
+        # 5. Load or Create the BM25 index (optional: retrieval falls back to FAISS alone)
+        if self.lexical_candidates > 0:
+            self.lexical_index = self._load_lexical_index()
+
+        # 6. Load or compute the agent persona of every article (optional: agents then search everything)
+        if self.agent_keywords:
+            self.agent_tags = self._load_agent_tags()
+
+        # 7. Answer cache, valid for one corpus snapshot and index only (see current_index_version)
+        if _setting('RAG_ANSWER_CACHE_SIZE', 500) > 0:
+            self.answer_cache = SemanticAnswerCache(
+                self.model.get_sentence_embedding_dimension(),
+                max_entries=_setting('RAG_ANSWER_CACHE_SIZE', 500),
+                ttl_seconds=_setting('RAG_ANSWER_CACHE_TTL', 3600),
+                similarity_threshold=_setting('RAG_ANSWER_CACHE_SIMILARITY', 0.95),
+                min_overlap=_setting('RAG_ANSWER_CACHE_MIN_OVERLAP', 0.5),
+            )
+
+
+    def current_index_version(self):
+        """
+        Identifies the corpus snapshot and index answers are generated from; cached
+        answers are dropped when it changes. Besides what this process loaded, it
+        includes the modification stamp of the index manifest and chunk table on disk,
+        so a `build_rag_index` run by another process invalidates the cached answers
+        at the next lookup instead of at the next restart.
+        """
+        stamps = []
+        for suffix in ('.manifest.json', '.chunks.npy'):
+            try:
+                stat = os.stat(index_artifact_path(self.index_file_path, suffix))
+                stamps.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+            except OSError:
+                stamps.append('-')
+        return "|".join([self.model_name, index_spec_from_settings(), str(self.data.snapshot_fingerprint),
+                         str(self.index.ntotal)] + stamps)
 
     def _load_embedding_model(self):
         """Loads the SentenceTransformer model."""
         try:
-            print("Attempting to load SentenceTransformer model 'all-MiniLM-L6-v2'...")
-            model = SentenceTransformer('all-MiniLM-L6-v2')
+            print(f"Attempting to load SentenceTransformer model '{self.model_name}'...")
+            model = SentenceTransformer(self.model_name)
             print("SentenceTransformer model loaded successfully.")
             return model
         except Exception as e:
@@ -55,111 +214,476 @@ class RAGPipeline:
             print("Please check your internet connection or if the model files are corrupted.")
             return None
 
+    def _create_query_cache(self):
+        """Query embedding cache for this model, reloaded from disk when RAG_QUERY_CACHE_PATH is set."""
+        try:
+            cache = QueryEmbeddingCache(
+                self.model_name, self.model.get_sentence_embedding_dimension(),
+                capacity=_setting('RAG_QUERY_CACHE_SIZE', 1024),
+                path=_setting('RAG_QUERY_CACHE_PATH', None),
+                save_every=_setting('RAG_QUERY_CACHE_SAVE_EVERY', 20),
+            )
+            if cache.path is not None:
+                atexit.register(cache.save)
+            return cache
+        except Exception as e:
+            print(f"Warning: Query embedding cache disabled: {e}")
+            return None
+
+    def _encode_one(self, text):
+        if self.query_encoder is None:
+            return self.model.encode([text])[0]
+        return self.query_encoder.encode(text)
+
+    def encode_query(self, query):
+        """
+        float32 (1, dimension) embedding of the query, from the query cache when it was
+        seen before, otherwise encoded together with any concurrent queries.
+        """
+        if self.query_cache is None:
+            return np.asarray(self._encode_one(query), dtype=np.float32)[np.newaxis]
+        return self.query_cache.get(query, self._encode_one)
+
+    def log_query_stats(self):
+        """Prints the query cache and query batching counters."""
+        if self.query_cache is not None:
+            print(self.query_cache.stats_line())
+        if self.query_encoder is not None:
+            print(self.query_encoder.stats_line())
+
+    def _count_retrieval(self):
+        # next() on itertools.count is atomic, so concurrent requests each get their own number
+        if self.query_stats_every > 0 and next(self._retrievals) % self.query_stats_every == 0:
+            self.log_query_stats()
+
     def _load_data(self):
-        """Loads data from the CSV file."""
+        """
+        Loads data from the columnar corpus snapshot. Only builder processes compile the
+        snapshot from the CSV; otherwise the prebuilt snapshot is memory-mapped as-is.
+        """
         try:
-            print(f"Attempting to load data from CSV: {self.csv_file_path}")
-            df = pd.read_csv(self.csv_file_path)
-
-            # --- CRITICAL FIX START ---
-            # Define the actual column that holds your main text content
-            # Based on your provided columns, 'DOC_DET' or 'DOC_DESC' are likely candidates.
-            # You MUST verify this in your actual CSV file.
-            text_column_name = 'DOC_DET' # <--- CONFIRM THIS IS THE CORRECT COLUMN IN YOUR CSV
-            # If it's 'DOC_DESC', change it to 'DOC_DESC'. If it's another, use that name.
-
-            if text_column_name not in df.columns:
-                print(f"ERROR: Specified text column '{text_column_name}' not found in CSV. Available columns: {df.columns.tolist()}")
-                return pd.DataFrame()
-
-            # Rename the actual text column to 'content' for internal consistency
-            df = df.rename(columns={text_column_name: 'content'})
-            # --- CRITICAL FIX END ---
-
-            # Optional: Drop rows where 'content' might be empty after renaming
-            df = df.dropna(subset=['content']).reset_index(drop=True)
-
-            if 'content' not in df.columns: # This check is now mostly for double-checking after rename
-                print(f"ERROR: After renaming, 'content' column is still not found. This should not happen if text_column_name was correct.")
-                return pd.DataFrame()
-
-            print(f"Data loaded successfully. Rows: {len(df)}")
-            return df
-        except FileNotFoundError:
-            print(f"ERROR: CSV file not found at {self.csv_file_path}")
-            return pd.DataFrame()
+            print(f"Attempting to load corpus snapshot for CSV: {self.csv_file_path}")
+            if self.build_index:
+                store = load_corpus(self.csv_file_path, self.snapshot_dir)
+            else:
+                store = DocumentStore.from_snapshot(*open_snapshot(self.csv_file_path, self.snapshot_dir))
+            print(f"Data loaded successfully. Rows: {len(store)}")
+            return store
+        except FileNotFoundError as e:
+            print(f"ERROR: Corpus file not found: {e}")
+            if not self.build_index:
+                print("Build the corpus snapshot and index with `python manage.py build_rag_index`.")
+            return DocumentStore.create_empty()
         except pd.errors.EmptyDataError:
             print(f"ERROR: CSV file at {self.csv_file_path} is empty.")
-            return pd.DataFrame()
+            return DocumentStore.create_empty()
         except Exception as e:
-            print(f"ERROR: An unexpected error occurred loading CSV file: {e}")
-            return pd.DataFrame()
-
-    def _create_faiss_index(self, embeddings):
-        """Creates a new FAISS index and saves it to disk."""
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings.astype('float32')) # Ensure embeddings are float32
-        faiss.write_index(index, self.index_file_path)
-        print(f"FAISS index created and saved to {self.index_file_path}")
-        return index
+            print(f"ERROR: An unexpected error occurred loading corpus data: {e}")
+            return DocumentStore.create_empty()
 
     def _load_faiss_index(self):
-        """Loads an existing FAISS index or creates a new one if it doesn't exist."""
-        if os.path.exists(self.index_file_path):
+        """
+        Loads the prebuilt FAISS index and its sidecar files. When this process is
+        allowed to build, missing or stale artifacts are brought up to date first.
+        """
+        builder = create_index_builder(self.index_file_path, self.data, self.model, self.model_name, self.chunker)
+        if self.build_index:
             try:
-                print(f"Attempting to load FAISS index from {self.index_file_path}...")
-                index = faiss.read_index(self.index_file_path)
-                print("FAISS index loaded successfully.")
-                return index
+                index, self.chunks, _ = builder.build()
             except Exception as e:
-                print(f"ERROR: Failed to load FAISS index from {self.index_file_path}: {e}")
-                print("Attempting to recreate the index due to loading error...")
-                if not self.data.empty and self.model is not None:
-                    embeddings = self.model.encode(self.data['content'].tolist())
-                    return self._create_faiss_index(embeddings.astype('float32'))
-                else:
-                    print("Cannot recreate index: Data or model not loaded/available.")
-                    return None
+                print(f"ERROR: Failed to build FAISS index at {self.index_file_path}: {e}")
+                return None
+            self._load_full_vectors(builder)
+            return index
+
+        if not builder.exists():
+            print(f"ERROR: FAISS index not found at {self.index_file_path}.")
+            print("Build it offline with `python manage.py build_rag_index`.")
+            return None
+        try:
+            print(f"Attempting to load FAISS index from {self.index_file_path}...")
+            index, chunks, manifest = builder.load(mmap=self.mmap_index)
+        except Exception as e:
+            print(f"ERROR: Failed to load FAISS index from {self.index_file_path}: {e}")
+            print("Rebuild it with `python manage.py build_rag_index`.")
+            return None
+        # O(1) when the manifest names this exact snapshot; otherwise an O(n) DOC_ID diff
+        pending, removed = builder.pending_changes(manifest)
+        if pending or removed:
+            print(f"Warning: FAISS index is behind the corpus snapshot ({pending} articles to embed, "
+                  f"{removed} to remove). Run `python manage.py build_rag_index` to update it.")
+        self.chunks = chunks
+        self._load_full_vectors(builder)
+        print("FAISS index loaded successfully.")
+        return index
+
+    def _load_title_index(self):
+        """Memory-maps the title vector index next to the FAISS index, building it first when allowed."""
+        path = index_artifact_path(self.index_file_path, '.titles.faiss')
+        try:
+            if self.build_index:
+                cache_dir = _setting('RAG_EMBEDDING_CACHE_DIR', None) or index_artifact_path(self.index_file_path, '.embeddings')
+                return update_title_index(path, self.data, self.model, self.model_name, cache_dir,
+                                          batch_size=_setting('RAG_EMBEDDING_BATCH_SIZE', 32))
+            title_index = TitleIndex.load(path, mmap=self.mmap_index)
+            if not title_index.matches_corpus(self.data, self.model_name):
+                print("Warning: Title index was built from a different corpus snapshot or model. "
+                      "Run `python manage.py build_rag_index` to update it.")
+            return title_index
+        except Exception as e:
+            print(f"Warning: Title search disabled, title index could not be loaded from {path}: {e}")
+            return None
+
+    def _load_lexical_index(self):
+        """Memory-maps the BM25 index next to the FAISS index, building it first when allowed."""
+        directory = index_artifact_path(self.index_file_path, '.bm25')
+        try:
+            if self.build_index:
+                return update_lexical_index(directory, self.data)
+            lexical_index = BM25Index.load(directory)
+            if not lexical_index.matches_corpus(self.data):
+                print("Warning: BM25 index was built from a different corpus snapshot. "
+                      "Run `python manage.py build_rag_index` to update it.")
+            lexical_index.bind(self.data)
+            return lexical_index
+        except Exception as e:
+            print(f"Warning: Lexical search disabled, BM25 index could not be loaded from {directory}: {e}")
+            return None
+
+    def _load_agent_tags(self):
+        """Memory-maps the per-article agent tags next to the FAISS index, computing them first when allowed."""
+        base_path = index_artifact_path(self.index_file_path, '')
+        try:
+            if self.build_index:
+                return update_agent_tags(base_path, self.data, self.agent_keywords)
+            tags = AgentTags.load(base_path)
+            if not tags.is_current(self.data, self.agent_keywords):
+                print("Warning: Agent tags are stale (corpus or agent keywords changed). "
+                      "Run `python manage.py build_rag_index` to update them.")
+            tags.bind(self.data)
+            return tags
+        except Exception as e:
+            print(f"Warning: Agent-scoped search disabled, agent tags could not be loaded: {e}")
+            return None
+
+    def scopes_agent(self, agent_id):
+        """Whether retrieval for this agent is restricted to its precomputed document set."""
+        return self.agent_tags is not None and agent_id in self.agent_tags.agents
+
+    def _load_full_vectors(self, builder):
+        """Memory-maps the full-precision vectors used for re-ranking, if enabled."""
+        if self.rerank_candidates <= 0:
+            return
+        try:
+            self.full_vectors = builder.load_full_vectors(self.chunks)
+        except Exception as e:
+            print(f"Warning: Re-ranking disabled, full-precision vectors could not be loaded: {e}")
+            print("Rebuild them with `python manage.py build_rag_index`.")
+            if is_binary_spec(_setting('FAISS_INDEX_SPEC', 'Flat')):
+                print("Until then, results are ranked by distances estimated from the binary codes.")
+
+    def _search_index(self, query_embeddings, k, nprobe, ef_search, selector, filters):
+        """Searches the index; a sharded index only searches the shards inside the filter's DOC_PUBDATE range."""
+        if isinstance(self.index, ShardedIndex):
+            pubdate_bounds = filters.pubdate_bounds() if filters is not None else (None, None)
+            return self.index.search(query_embeddings, k, nprobe, ef_search, selector, pubdate_bounds)
+        params = search_parameters(self.index, nprobe, ef_search, selector)
+        return self.index.search(query_embeddings, k, params=params)
+
+    def _index_applies_selector(self):
+        if isinstance(self.index, ShardedIndex):
+            return self.index.applies_selector
+        return applies_selector(self.index)
+
+    def _search_unfiltered(self, query_embeddings, fetch, nprobe, ef_search, chunk_mask, filters):
+        """
+        Search for an index that cannot apply the filter's ID selector (flat PQ, binary
+        IVF): fetches fetch / selectivity hits so that about fetch of them pass the
+        filter, doubling the fetch until every query has fetch passing hits (or the
+        whole index has been fetched). The caller drops the hits outside chunk_mask.
+        """
+        total, selected = len(self.chunks), int(chunk_mask.sum())
+        needed = min(fetch, selected)
+        fetch = min(total, int(np.ceil(fetch * total / max(selected, 1))))
+        while True:
+            D, I = self._search_index(query_embeddings, fetch, nprobe, ef_search, None, filters)
+            if fetch >= total:
+                return D, I
+            hit_rows = self.chunks.rows_for_ids(I.ravel()).reshape(I.shape)
+            passing = ((hit_rows >= 0) & chunk_mask[np.maximum(hit_rows, 0)]).sum(axis=1)
+            if (passing >= needed).all():
+                return D, I
+            fetch = min(total, 2 * fetch)
+
+    def _search_chunks(self, query_embeddings, candidates, nprobe, ef_search, selector, chunk_mask, filters):
+        """
+        Searches the chunk index for every query embedding in one call (re-ranking when
+        enabled). Returns, per query, the chunk table rows of the best hits, nearest
+        first, with their distances.
+        """
+        # Over-fetch from a quantized or binary index, then keep the best candidates by exact distance
+        fetch = candidates if self.full_vectors is None else max(candidates, self.rerank_candidates)
+        nprobe, ef_search = nprobe or self.nprobe, ef_search or self.ef_search
+        # D = distances, I = chunk ids
+        if chunk_mask is None or self._index_applies_selector():
+            D, I = self._search_index(query_embeddings, fetch, nprobe, ef_search, selector, filters)
         else:
-            print("FAISS index not found. Attempting to create a new one...")
-            if not self.data.empty and self.model is not None:
-                embeddings = self.model.encode(self.data['content'].tolist())
-                return self._create_faiss_index(embeddings.astype('float32'))
+            D, I = self._search_unfiltered(query_embeddings, fetch, nprobe, ef_search, chunk_mask, filters)
+        results = []
+        for query_embedding, distances, chunk_ids in zip(query_embeddings, D, I):
+            if chunk_mask is not None:
+                # Binary IVF and flat PQ indexes cannot apply the selector themselves; drop what slipped through
+                hit_rows = self.chunks.rows_for_ids(chunk_ids)
+                keep = (hit_rows >= 0) & chunk_mask[hit_rows]
+                distances, chunk_ids = distances[keep], chunk_ids[keep]
+            if self.full_vectors is not None:
+                distances, chunk_ids = self.full_vectors.rerank(query_embedding, chunk_ids)
+            distances, chunk_ids = distances[:candidates], chunk_ids[:candidates]
+            rows = self.chunks.rows_for_ids(chunk_ids)
+            # Check the retrieved ids are known to the chunk table and their articles are still loaded
+            valid = rows >= 0
+            valid[valid] = self.chunks.doc_positions[rows[valid]] >= 0
+            for chunk_id in chunk_ids[~valid & (chunk_ids != -1)]:
+                print(f"Retrieval Warning: Chunk id {chunk_id} from FAISS has no matching article in the document store.")
+            results.append((rows[valid], distances[valid]))
+        return results
+
+    def _combine_title_scores(self, body_positions, body_similarities, title_positions, title_similarities):
+        """
+        Ranks articles by body similarity (best chunk) and title similarity combined:
+        'max' keeps the better of the two with the title weighted by title_weight,
+        'sum' adds them. A field in which the article was not retrieved counts as absent.
+        """
+        scores = {}
+        for position, similarity in zip(body_positions, body_similarities):
+            scores[int(position)] = [float(similarity), None]
+        for position, similarity in zip(title_positions, title_similarities):
+            scores.setdefault(int(position), [None, None])[1] = self.title_weight * float(similarity)
+
+        def combined(position):
+            body, title = scores[position]
+            if self.title_combine == 'sum':
+                return (body or 0.0) + (title or 0.0)
+            return max(value for value in (body, title) if value is not None)
+
+        return np.array(sorted(scores, key=combined, reverse=True), dtype=np.int64)
+
+    def _search_scope(self, filters, agent_id):
+        """
+        (doc_mask, chunk_mask, selector) restricting a search to the articles that pass
+        the filters and belong to the agent; all None for an unrestricted search. A
+        doc_mask with a None selector means no article qualifies.
+        """
+        doc_mask = chunk_mask = selector = None
+        if filters is not None and not filters.empty:
+            doc_mask = filters.document_mask(self.data)
+        if agent_id is not None and self.scopes_agent(agent_id):
+            agent_mask = self.agent_tags.document_mask(agent_id, len(self.data))
+            doc_mask = agent_mask if doc_mask is None else doc_mask & agent_mask
+        if doc_mask is not None:
+            chunk_mask = document_chunk_mask(self.chunks, doc_mask)
+            selector = chunk_selector(self.chunks, chunk_mask)
+        return doc_mask, chunk_mask, selector
+
+    def _retrieve(self, queries, query_embeddings, top_k, nprobe, ef_search, filters, scope):
+        """
+        Retrieves the results of several queries that share one search scope: titles and
+        chunks are searched for all of them at once, then each query's hits are ranked.
+        """
+        doc_mask, chunk_mask, selector = scope
+        candidates = top_k * self.chunk_candidates_per_result
+        no_titles = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        title_hits = [no_titles] * len(queries)
+        if self.title_index is not None:
+            similarities, positions = self.title_index.search(
+                query_embeddings, self.title_candidates, self.data, doc_mask
+            )
+            title_hits = [(row_positions[row_positions >= 0], row_similarities[row_positions >= 0])
+                          for row_positions, row_similarities in zip(positions, similarities)]
+        # Headline-style queries: when enough titles match closely, the chunk index is not searched
+        chunk_queries = [
+            i for i, (_, title_similarities) in enumerate(title_hits)
+            if self.title_first_similarity is None
+            or int((title_similarities >= self.title_first_similarity).sum()) < top_k
+        ]
+        chunk_hits = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))] * len(queries)
+        if chunk_queries:
+            searched = self._search_chunks(
+                query_embeddings[chunk_queries], candidates, nprobe, ef_search, selector, chunk_mask, filters
+            )
+            for i, hits in zip(chunk_queries, searched):
+                chunk_hits[i] = hits
+        return [
+            self._rank_articles(query, top_k, rows, distances, title_positions, title_similarities, doc_mask)
+            for query, (rows, distances), (title_positions, title_similarities) in zip(queries, chunk_hits, title_hits)
+        ]
+
+    def _rank_articles(self, query, top_k, rows, distances, title_positions, title_similarities, doc_mask):
+        """Collapses one query's chunk, title and BM25 hits onto its top_k result articles."""
+        # Collapse chunk hits onto articles, ranking each article by its best chunk
+        hit_positions = self.chunks.doc_positions[rows]
+        _, first_hits = np.unique(hit_positions, return_index=True)
+        first_hits = np.sort(first_hits)
+        ranked_positions = hit_positions[first_hits]
+        if self.title_index is not None:
+            ranked_positions = self._combine_title_scores(
+                ranked_positions, similarity_from_distance(distances[first_hits]), title_positions, title_similarities
+            )
+        if self.lexical_index is not None:
+            lexical_positions, _ = self.lexical_index.search(query, self.lexical_candidates, doc_mask)
+            ranked_positions = reciprocal_rank_fusion([ranked_positions, lexical_positions], self.rrf_k)
+        ranked_positions = ranked_positions[:top_k]
+
+        relevant_chunks = []
+        for document in self.data.get_batch(ranked_positions):
+            hits = np.flatnonzero(hit_positions == document['position'])
+            if len(hits):
+                article_rows, distance = rows[hits], float(distances[hits[0]])
             else:
-                print("Cannot create index: Data or model not loaded/available.")
-                return None
+                # Found only by title or BM25: use the article's chunk with the most query terms
+                article_rows = self.chunks.rows_for_doc_id(document['doc_id'])
+                if len(article_rows):
+                    counts = query_term_counts(query, self.chunks.texts(self.data, article_rows))
+                    article_rows = article_rows[[int(np.argmax(counts))]]
+                distance = None
+            # An article the index has not chunked (it is behind the corpus) falls back to its text
+            chunk_text = document['content'].strip() if not len(article_rows) \
+                else self.chunks.passage_text(document['content'], article_rows)
+            relevant_chunks.append({
+                'chunk_text': chunk_text,
+                'doc_id': document['doc_id'],
+                'title': document['title'],
+                'url': document['url'],
+                'pubdate': document['pubdate'],
+                'duplicate_doc_ids': document['duplicate_doc_ids'],
+                'distance': distance,
+            })
+        return relevant_chunks
 
-    def retrieve_relevant_chunks(self, query, top_k=5):
-        """Retrieves the most relevant text chunks from the FAISS index."""
+    def retrieve_relevant_chunks(self, query, top_k=5, nprobe=None, ef_search=None, filters=None, agent_id=None,
+                                 query_embedding=None):
+        """
+        Retrieves the top_k most relevant articles from the chunk-level FAISS index.
+        Chunk hits are collapsed onto their articles, and each result carries only the
+        matching passages of the article as its chunk_text.
+        nprobe / ef_search override the configured defaults for this request on IVF /
+        HNSW indexes (higher means better recall, slower search). When re-ranking is
+        enabled, the index's (possibly quantized) distances are replaced by exact ones
+        computed from the full-precision vectors before articles are ranked.
+        filters (a SearchFilter or a dict of its arguments, e.g. {'pubdate_from': '2025-02',
+        'news_categories': ['Civic']}) restricts the search itself to matching articles.
+        With the BM25 index loaded, its best articles are fused with the FAISS ranking by
+        reciprocal rank, so exact matches on rare names surface even when the embedding
+        misses them. With the title index loaded, headline similarity is combined with
+        the best chunk's similarity per article, and a query that closely matches at
+        least top_k headlines skips the chunk search. Articles found only by title or
+        BM25 carry distance None.
+        agent_id limits the search to the articles tagged with that agent persona at
+        ingest, so the agent gets its own top_k rather than a post-filtered global one.
+        query_embedding is encode_query(query) when the caller already has it (it is
+        passed on to generate_answer_with_llm as well).
+        """
         if self.index is None or self.data.empty or self.model is None:
             print("Retrieval Warning: RAG Pipeline not fully initialized (index/data/model is None).")
             return []
         try:
-            query_embedding = self.model.encode([query]).astype('float32')
-            # D = distances, I = indices
-            D, I = self.index.search(query_embedding, top_k)
-            relevant_chunks = []
-            for i in range(len(I[0])):
-                index = I[0][i]
-                # Check if the retrieved index is valid and within the bounds of the DataFrame
-                if 0 <= index < len(self.data):
-                    relevant_chunks.append({'chunk_text': str(self.data['content'].iloc[index])}) # Ensure content is string
-                else:
-                    print(f"Retrieval Warning: Index {index} from FAISS is out of data bounds (size {len(self.data)}).")
+            filters = SearchFilter.coerce(filters)
+            scope = self._search_scope(filters, agent_id)
+            if scope[0] is not None and scope[2] is None:
+                print(f"Retrieved 0 chunks for query: '{query}' (no articles match the filters).")
+                return []
+            if query_embedding is None:
+                query_embedding = self.encode_query(query)
+            self._count_retrieval()
+            relevant_chunks = self._retrieve([query], query_embedding, top_k, nprobe, ef_search, filters, scope)[0]
             print(f"Retrieved {len(relevant_chunks)} chunks for query: '{query}'.")
             return relevant_chunks
         except Exception as e:
             print(f"ERROR: An error occurred during chunk retrieval: {e}")
             return []
 
-    def generate_answer_with_llm(self, query, retrieved_chunks_info, system_message_content, llm_model="gpt-4o-mini"):
-        """Generates an answer using the LLM based on the query and retrieved context."""
+    def retrieve_relevant_chunks_batch(self, queries, top_k=5, nprobe=None, ef_search=None, filters=None,
+                                       agent_id=None, batch_size=256):
+        """
+        Batch form of retrieve_relevant_chunks for offline jobs (evaluation sets, digests).
+        Yields one result list per query, in input order, as each block of batch_size
+        queries completes, so very large inputs are never held in memory at once.
+        Each block is encoded as one matrix; its queries that share a filter are
+        searched with a single FAISS call. filters is either one filter applied to every
+        query or a list with one filter (or None) per query.
+        """
+        if self.index is None or self.data.empty or self.model is None:
+            print("Retrieval Warning: RAG Pipeline not fully initialized (index/data/model is None).")
+            for _ in queries:
+                yield []
+            return
+        per_query_filters = isinstance(filters, (list, tuple))
+        queries = iter(queries)
+        filters_iter = iter(filters) if per_query_filters else None
+        while True:
+            block = list(islice(queries, batch_size))
+            if not block:
+                if per_query_filters and any(True for _ in filters_iter):
+                    raise ValueError("filters must have one entry per query")
+                return
+            block_filters = list(islice(filters_iter, len(block))) if per_query_filters else [filters] * len(block)
+            if len(block_filters) != len(block):
+                raise ValueError("filters must have one entry per query")
+            results = [[] for _ in block]
+            try:
+                query_embeddings = np.asarray(
+                    self.model.encode(block, batch_size=_setting('RAG_EMBEDDING_BATCH_SIZE', 32)), dtype=np.float32
+                )
+                # Queries with the same filter share one search scope and one FAISS search
+                groups = {}
+                for i, query_filters in enumerate(block_filters):
+                    query_filters = SearchFilter.coerce(query_filters)
+                    key = query_filters.key() if query_filters is not None else None
+                    groups.setdefault(key, (query_filters, []))[1].append(i)
+                for query_filters, members in groups.values():
+                    scope = self._search_scope(query_filters, agent_id)
+                    if scope[0] is not None and scope[2] is None:
+                        continue # no articles match the filters
+                    group_results = self._retrieve(
+                        [block[i] for i in members], query_embeddings[members], top_k, nprobe, ef_search,
+                        query_filters, scope,
+                    )
+                    for i, relevant_chunks in zip(members, group_results):
+                        results[i] = relevant_chunks
+            except Exception as e:
+                print(f"ERROR: An error occurred during batch chunk retrieval: {e}")
+            print(f"Retrieved chunks for a batch of {len(block)} queries.")
+            yield from results
+
+    def generate_answer_with_llm(self, query, retrieved_chunks_info, system_message_content, llm_model="gpt-4o-mini",
+                                 agent_id=None, query_embedding=None):
+        """
+        Generates an answer using the LLM based on the query and retrieved context.
+        With an agent_id, a successful answer is cached for that agent and reused for
+        later queries that mean nearly the same and retrieve mostly the same articles.
+        query_embedding is the encode_query(query) result used for retrieval, so the
+        cache lookup does not encode the query again.
+        """
         openai_api_key = settings.OPENAI_API_KEY
         if not openai_api_key or openai_api_key == 'YOUR_OPENAI_API_KEY_HERE':
             print("ERROR: OpenAI API key is missing or not set.")
             return "Error: OpenAI API key is not configured. Please set OPENAI_API_KEY in settings.py or as an environment variable."
 
+        answer_cache = self.answer_cache if agent_id is not None and self.model is not None else None
+        if answer_cache is not None:
+            try:
+                if query_embedding is None:
+                    query_embedding = self.encode_query(query)
+                doc_ids = [chunk['doc_id'] for chunk in retrieved_chunks_info]
+                answer_cache.validate(self.current_index_version())
+                cached_answer = answer_cache.lookup((agent_id, llm_model), query_embedding, doc_ids)
+                if cached_answer is not None:
+                    print(f"LLM Answer served from the answer cache. {answer_cache.stats_line()}")
+                    return cached_answer
+            except Exception as e:
+                print(f"Warning: Answer cache lookup failed, calling the LLM: {e}")
+                answer_cache = None
+
         context_str = "\n\n".join([chunk['chunk_text'] for chunk in retrieved_chunks_info]) if retrieved_chunks_info else "No relevant context found."
         print(f"Sending to LLM (Model: {llm_model}):\nSystem Prompt: {system_message_content[:50]}...\nContext: {context_str[:200]}...\nQuery: {query}") # Debugging LLM input
 
@@ -176,6 +700,8 @@ class RAGPipeline:
             )
             answer = chat_completion.choices[0].message.content.strip()
             print("LLM Answer generated.")
+            if answer_cache is not None:
+                answer_cache.store((agent_id, llm_model), query_embedding, doc_ids, answer)
             return answer
         except Exception as e:
             print(f"ERROR: Failed to generate answer with LLM: {e}")
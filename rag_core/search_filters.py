@@ -0,0 +1,106 @@
+import faiss
+import numpy as np
+
+# Units coarser than a second: an upper bound given at one of these precisions covers the whole unit
+_COARSE_UNITS = ('Y', 'M', 'W', 'D', 'h', 'm')
+
+
+def _lower_bound(value):
+    return np.datetime64(value).astype('datetime64[s]')
+
+
+def _upper_bound(value):
+    """Exclusive datetime64[s] limit for an inclusive upper bound ('2025-02' keeps all of February)."""
+    value = np.datetime64(value)
+    unit = np.datetime_data(value.dtype)[0]
+    if unit in _COARSE_UNITS:
+        return (value + np.timedelta64(1, unit)).astype('datetime64[s]')
+    return value.astype('datetime64[s]') + np.timedelta64(1, 's')
+
+
+class SearchFilter:
+    """
+    Structured restriction of a search to articles whose DOC_PUBDATE / DOC_SDATE fall
+    in a range and whose DOC_CATEGRY / NEWS_CATEGRY is one of the given labels.
+    Date bounds are inclusive at the precision they are given in ('2025-02',
+    '2025-02-14', '2025-02-14 08:00'); articles without the date never match a
+    range on it. Filters are applied inside the FAISS search through an ID
+    selector, so the index returns k matching chunks rather than k chunks that
+    are then thinned out.
+    """
+
+    def __init__(self, pubdate_from=None, pubdate_to=None, sdate_from=None, sdate_to=None,
+                 doc_categories=None, news_categories=None):
+        self.pubdate_from = pubdate_from
+        self.pubdate_to = pubdate_to
+        self.sdate_from = sdate_from
+        self.sdate_to = sdate_to
+        self.doc_categories = doc_categories
+        self.news_categories = news_categories
+
+    @classmethod
+    def coerce(cls, filters):
+        """Accepts None, a SearchFilter or a dict of SearchFilter keyword arguments."""
+        if filters is None or isinstance(filters, cls):
+            return filters
+        return cls(**filters)
+
+    @property
+    def empty(self):
+        return all(value in (None, '', [], ()) for value in vars(self).values())
+
+    def key(self):
+        """Hashable form of the filter, so queries with equal filters can share one search."""
+        return tuple(
+            (name, tuple(value) if isinstance(value, (list, tuple)) else value) for name, value in sorted(vars(self).items())
+        )
+
+    def pubdate_bounds(self):
+        """(inclusive lower, exclusive upper) DOC_PUBDATE limits as datetime64[s], None where unbounded."""
+        return (
+            _lower_bound(self.pubdate_from) if self.pubdate_from else None,
+            _upper_bound(self.pubdate_to) if self.pubdate_to else None,
+        )
+
+    def document_mask(self, store):
+        """Boolean mask over document store positions of the articles that pass the filter."""
+        mask = np.ones(len(store), dtype=bool)
+        for dates, lower, upper in (
+            (store.pubdates, self.pubdate_from, self.pubdate_to),
+            (store.sdates, self.sdate_from, self.sdate_to),
+        ):
+            # NaT compares False, so undated articles drop out of any range on that date
+            if lower:
+                mask &= dates >= _lower_bound(lower)
+            if upper:
+                mask &= dates < _upper_bound(upper)
+        for field, labels in (('doc_category', self.doc_categories), ('news_category', self.news_categories)):
+            if labels:
+                if isinstance(labels, str):
+                    labels = [labels]
+                codes, _ = store.categories[field]
+                mask &= np.isin(codes, store.category_codes(field, [label.strip() for label in labels]))
+        return mask
+
+
+def document_chunk_mask(chunks, doc_mask):
+    """Boolean mask over chunk table rows whose articles are selected by doc_mask (over store positions)."""
+    mask = np.zeros(len(chunks), dtype=bool)
+    bound = chunks.doc_positions >= 0
+    mask[bound] = doc_mask[chunks.doc_positions[bound]]
+    return mask
+
+
+def chunk_selector(chunks, chunk_mask):
+    """
+    faiss.IDSelector over the chunk ids of the selected table rows (None when no row
+    is selected). The table is sorted by chunk id, so when the selected rows form one
+    run -- date filters on an export whose DOC_IDs follow publication order -- a
+    constant-size IDSelectorRange replaces the id batch.
+    """
+    rows = np.flatnonzero(chunk_mask)
+    if len(rows) == 0:
+        return None
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return faiss.IDSelectorRange(int(chunks.ids[rows[0]]), int(chunks.ids[rows[-1]]) + 1)
+    return faiss.IDSelectorBatch(np.ascontiguousarray(chunks.ids[rows]))
@@ -0,0 +1,262 @@
+import glob
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from .ann_index import applies_selector, search_parameters
+from .chunking import ChunkTable
+from .full_vectors import VectorShards
+from .index_builder import IndexBuilder, index_artifact_path
+from .index_sync import new_sync_stats, replace_file
+
+# numpy datetime units an index can be partitioned by (shard files are named after the period)
+SHARD_PERIODS = ('Y', 'M', 'W', 'D')
+UNDATED_SHARD = 'undated'
+_NAT = np.datetime64('NaT').astype(np.int64)
+
+
+def shard_periods(pubdates, period):
+    """Period number of every article's DOC_PUBDATE (NaT's integer value for undated articles)."""
+    return np.asarray(pubdates).astype(f'datetime64[{period}]').view(np.int64)
+
+
+def shard_key(period_number, period):
+    """File name of a period's shard: '2025-02' for months, 'undated' for articles without a DOC_PUBDATE."""
+    if period_number == _NAT:
+        return UNDATED_SHARD
+    return str(np.array(period_number, dtype=np.int64).view(f'datetime64[{period}]'))
+
+
+def merge_results(results, k):
+    """
+    Merges per-shard (distances, ids) search results, each sorted by distance, into
+    the k nearest hits per query. Rows are padded with (inf, -1) like FAISS does.
+    """
+    n = len(results[0][0]) if results else 0
+    D = np.full((n, k), np.inf, dtype=np.float32)
+    I = np.full((n, k), -1, dtype=np.int64)
+    for query in range(n):
+        hits = heapq.merge(*(
+            zip(distances[query][ids[query] >= 0], ids[query][ids[query] >= 0]) for distances, ids in results
+        ))
+        merged = list(islice(hits, k))
+        if merged:
+            D[query, :len(merged)], I[query, :len(merged)] = zip(*merged)
+    return D, I
+
+
+class ShardedIndex:
+    """
+    Chunk index made of one FAISS index per DOC_PUBDATE period. A search fans out to
+    the shards whose period overlaps the query's date bounds on a thread pool (FAISS
+    releases the GIL while searching) and merges their hits with a heap.
+    """
+
+    def __init__(self, shards, period, threads=4):
+        self.shards = shards # [(period number, index)], oldest first; the undated shard comes first
+        self.period = period
+        self.threads = threads
+        self._pool = None
+
+    @property
+    def ntotal(self):
+        return sum(index.ntotal for _, index in self.shards)
+
+    @property
+    def applies_selector(self):
+        return all(applies_selector(index) for _, index in self.shards)
+
+    def shards_between(self, lower=None, upper=None):
+        """
+        Indexes of the shards whose period overlaps [lower, upper) (datetime64 or None).
+        A date-bounded search never matches undated articles, so it skips their shard.
+        """
+        selected = []
+        for number, index in self.shards:
+            if number == _NAT:
+                if lower is None and upper is None:
+                    selected.append(index)
+                continue
+            start = np.array(number, dtype=np.int64).view(f'datetime64[{self.period}]')
+            if lower is not None and start + np.timedelta64(1, self.period) <= lower:
+                continue
+            if upper is not None and start >= upper:
+                continue
+            selected.append(index)
+        return selected
+
+    def search(self, vectors, k, nprobe=None, ef_search=None, selector=None, pubdate_bounds=(None, None)):
+        """Searches the shards relevant to pubdate_bounds; returns (distances, chunk ids) like index.search."""
+        shards = self.shards_between(*pubdate_bounds)
+
+        def search_shard(index):
+            return index.search(vectors, k, params=search_parameters(index, nprobe, ef_search, selector))
+
+        if len(shards) <= 1 or self.threads <= 1:
+            results = [search_shard(index) for index in shards]
+        else:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='faiss-shard')
+            results = list(self._pool.map(search_shard, shards))
+        if not results:
+            return np.full((len(vectors), k), np.inf, dtype=np.float32), np.full((len(vectors), k), -1, dtype=np.int64)
+        return merge_results(results, k)
+
+
+class ShardedIndexBuilder(IndexBuilder):
+    """
+    Write path for an index partitioned by DOC_PUBDATE period: every period gets its
+    own FAISS index, chunk table, manifest (and vector side file) under
+    '<index>.shards/', built by an IndexBuilder restricted to that period's articles.
+    Ingest only rewrites shards whose articles changed -- in practice the current
+    period's. Past periods with no changes are sealed: they are memory-mapped
+    read-only and their files are never rewritten. A combined chunk table at
+    '<index>.chunks.npy' maps chunk ids back to articles across all shards.
+    """
+
+    def __init__(self, index_file_path, store, model, model_name, chunker, period='M', search_threads=4, **options):
+        if period not in SHARD_PERIODS:
+            raise ValueError(f"unsupported shard period '{period}' (expected one of {', '.join(SHARD_PERIODS)})")
+        super().__init__(index_file_path, store, model, model_name, chunker, **options)
+        self.period = period
+        self.search_threads = search_threads
+        self.shard_dir = index_artifact_path(index_file_path, '.shards')
+        self.chunks_path = index_artifact_path(index_file_path, '.chunks.npy')
+        self.shard_chunks = [] # [(period number, shard chunk table)] of the last build() or load()
+
+    def shard_builder(self, period_number, doc_mask=None):
+        return IndexBuilder(
+            os.path.join(self.shard_dir, shard_key(period_number, self.period) + '.faiss'),
+            self.store, self.model, self.model_name, self.chunker,
+            index_spec=self.index_spec, train_sample=self.train_sample, full_vectors=self.full_vectors,
+            embedding_workers=self.embedding_workers, embedding_batch_size=self.embedding_batch_size,
+            index_batch_size=self.index_batch_size, cache_dir=self.cache_dir, doc_mask=doc_mask,
+        )
+
+    def store_shards(self):
+        """{period number: mask of the store positions in that period} for the current store."""
+        periods = shard_periods(self.store.pubdates, self.period)
+        return {int(number): periods == number for number in np.unique(periods[self.store.canonical_mask])}
+
+    def disk_shards(self):
+        """Period numbers of the shards present on disk, oldest first (undated first)."""
+        numbers = []
+        for path in glob.glob(os.path.join(self.shard_dir, '*.faiss')):
+            key = os.path.splitext(os.path.basename(path))[0]
+            if key == UNDATED_SHARD:
+                numbers.append(int(_NAT))
+            else:
+                numbers.append(int(np.datetime64(key).astype(f'datetime64[{self.period}]').view(np.int64)))
+        return sorted(numbers)
+
+    def exists(self):
+        return os.path.exists(self.chunks_path)
+
+    def load(self, mmap=False):
+        """
+        Reads every shard and the combined chunk table (see IndexBuilder.load).
+        Returns (ShardedIndex, chunks, {period number: manifest}).
+        """
+        shards, shard_chunks, manifests = [], [], {}
+        for number in self.disk_shards():
+            index, chunks, manifests[number] = self.shard_builder(number).load(mmap=mmap)
+            shards.append((number, index))
+            shard_chunks.append((number, chunks))
+        self.shard_chunks = shard_chunks
+        index = ShardedIndex(shards, self.period, self.search_threads)
+        chunks = ChunkTable.load(self.chunks_path, mmap=mmap)
+        if len(chunks) != index.ntotal:
+            raise ValueError(f"combined chunk table has {len(chunks)} rows, the shards hold {index.ntotal} vectors")
+        chunks.bind(self.store)
+        return index, chunks, manifests
+
+    def pending_changes(self, manifests):
+        """(articles to embed, articles to remove) across all shards, including periods with no shard yet."""
+        pending = removed = 0
+        shard_masks = self.store_shards()
+        for number, manifest in manifests.items():
+            doc_mask = shard_masks.get(number, np.zeros(len(self.store), dtype=bool))
+            shard_pending, shard_removed = self.shard_builder(number, doc_mask).pending_changes(manifest)
+            pending, removed = pending + shard_pending, removed + shard_removed
+        for number, doc_mask in shard_masks.items():
+            if number not in manifests:
+                pending += int((self.store.canonical_mask & doc_mask).sum())
+        return pending, removed
+
+    def load_full_vectors(self, chunks):
+        vectors = VectorShards([
+            self.shard_builder(number).load_full_vectors(shard_chunks) for number, shard_chunks in self.shard_chunks
+        ])
+        if len(vectors) != len(chunks):
+            raise ValueError(f"vector side files hold {len(vectors)} vectors, the index has {len(chunks)} chunks")
+        return vectors
+
+    def _load_sealed(self, builder):
+        """
+        Maps a past period's shard read-only when none of its articles changed.
+        Returns (index, chunks, stats), or None when the shard has to be synced.
+        """
+        try:
+            index, chunks, manifest = builder.load(mmap=True)
+            if builder.pending_changes(manifest) != (0, 0):
+                return None
+            if builder.full_vectors:
+                builder.load_full_vectors(chunks)
+        except Exception:
+            return None
+        if not manifest.matches_corpus(self.store):
+            manifest.snapshot_fingerprint = self.store.snapshot_fingerprint
+            builder.save_manifest(manifest)
+        stats = new_sync_stats()
+        stats['indexed_docs'] = len(manifest.doc_ids)
+        return index, chunks, stats
+
+    def build(self, rebuild=False, checkpoint_every=None, encoder=None):
+        """
+        Builds or updates every shard (one embedding cache and worker pool shared by
+        all of them), deletes shards of periods that no longer have articles and
+        writes the combined chunk table. Returns (ShardedIndex, chunks, stats) with
+        stats summed over the shards.
+        """
+        shard_masks = self.store_shards()
+        current = max((number for number in shard_masks if number != _NAT), default=None)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        for number in self.disk_shards():
+            if number not in shard_masks:
+                print(f"Removing FAISS index shard '{shard_key(number, self.period)}' (no articles left in it).")
+                for path in glob.glob(os.path.join(self.shard_dir, shard_key(number, self.period) + '.*')):
+                    os.remove(path)
+
+        own_encoder = encoder is None
+        encode = self.open_encoder() if own_encoder else encoder
+        shards, shard_chunks = [], []
+        stats = new_sync_stats()
+        stats['indexed_docs'] = 0
+        try:
+            for number, doc_mask in sorted(shard_masks.items()):
+                builder = self.shard_builder(number, doc_mask)
+                built = None
+                if not rebuild and number != current and builder.exists():
+                    built = self._load_sealed(builder)
+                if built is None:
+                    print(f"--- FAISS index shard '{shard_key(number, self.period)}' ---")
+                    built = builder.build(rebuild=rebuild, checkpoint_every=checkpoint_every, encoder=encode)
+                index, chunks, shard_stats = built
+                shards.append((number, index))
+                shard_chunks.append((number, chunks))
+                for name, value in shard_stats.items():
+                    stats[name] = stats.get(name, 0) + value
+        finally:
+            if own_encoder:
+                encode.close(stats)
+
+        chunks = ChunkTable.concatenate([table for _, table in shard_chunks]) if shard_chunks else ChunkTable.create_empty()
+        replace_file(self.chunks_path, chunks.save)
+        chunks.bind(self.store)
+        self.shard_chunks = shard_chunks
+        index = ShardedIndex(shards, self.period, self.search_threads)
+        print(f"FAISS index ready: {len(shards)} shards, {index.ntotal} chunks from {stats['indexed_docs']} articles.")
+        return index, chunks, stats
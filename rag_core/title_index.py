@@ -0,0 +1,122 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+from .ann_index import read_index, search_parameters, write_index
+from .document_store import matches_snapshot
+from .embedding_cache import EmbeddingCache
+from .index_sync import replace_file, save_json
+
+TITLE_INDEX_FORMAT_VERSION = 1
+# Embedding cache namespace for headlines (chunk vectors are keyed by the chunking config)
+TITLE_CACHE_KEY = 'titles'
+
+
+def similarity_from_distance(distances):
+    """Cosine similarity from the squared L2 distances FAISS returns (the embeddings are unit length)."""
+    return 1.0 - np.asarray(distances, dtype=np.float32) / 2.0
+
+
+class TitleIndex:
+    """
+    Second vector field: one embedding per canonical article of its DOC_TITL, in a
+    flat FAISS index keyed by DOC_ID. Headlines are short and carefully written, so
+    a query phrased like one often matches a title better than any body chunk.
+    At one vector per article the index is a fraction of the chunk index and is
+    rebuilt whole, from the embedding cache, whenever the corpus snapshot changes.
+    """
+
+    def __init__(self, index, model_name, snapshot_fingerprint=None):
+        self.index = index
+        self.model_name = model_name
+        self.snapshot_fingerprint = snapshot_fingerprint
+
+    @staticmethod
+    def _meta_path(path):
+        return os.path.splitext(path)[0] + '.json'
+
+    @classmethod
+    def build(cls, store, model_name, dimension, encode, batch_size=1024):
+        """Embeds the title of every canonical article through encode(texts)."""
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        positions = np.flatnonzero(store.canonical_mask)
+        for start in range(0, len(positions), batch_size):
+            block = positions[start:start + batch_size]
+            titles = store.texts('title', int(block[0]), int(block[-1]) + 1)
+            titles = [titles[position - block[0]].strip() for position in block]
+            has_title = np.array([bool(title) for title in titles], dtype=bool)
+            if has_title.any():
+                vectors = np.asarray(encode([title for title in titles if title]), dtype='float32')
+                index.add_with_ids(vectors, np.asarray(store.doc_ids[block[has_title]], dtype=np.int64))
+        return cls(index, model_name, store.snapshot_fingerprint)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        with open(cls._meta_path(path)) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != TITLE_INDEX_FORMAT_VERSION:
+            raise ValueError(f"unsupported title index version {meta.get('format_version')}")
+        index = read_index(path, mmap=mmap)
+        if index.ntotal != meta['ntotal']:
+            raise ValueError(f"title index has {index.ntotal} vectors, its metadata records {meta['ntotal']}")
+        return cls(index, meta['model_name'], meta.get('snapshot_fingerprint'))
+
+    def save(self, path):
+        replace_file(path, lambda tmp_path: write_index(self.index, tmp_path))
+        meta = {
+            'format_version': TITLE_INDEX_FORMAT_VERSION,
+            'model_name': self.model_name,
+            'snapshot_fingerprint': self.snapshot_fingerprint,
+            'ntotal': self.index.ntotal,
+        }
+        replace_file(self._meta_path(path), lambda tmp_path: save_json(tmp_path, meta))
+
+    def matches_corpus(self, store, model_name):
+        return (
+            self.model_name == model_name
+            and matches_snapshot(self.snapshot_fingerprint, store)
+        )
+
+    def search(self, query_vectors, k, store, doc_mask=None):
+        """
+        Nearest titles to each query, restricted to the articles in doc_mask (over store
+        positions) if given. Returns (cosine similarities, store positions); padding
+        slots have similarity -inf and position -1.
+        """
+        selector = None
+        if doc_mask is not None:
+            selected = np.flatnonzero(doc_mask & store.canonical_mask)
+            if len(selected) == 0:
+                return np.full((len(query_vectors), k), -np.inf, dtype=np.float32), \
+                    np.full((len(query_vectors), k), -1, dtype=np.int64)
+            selector = faiss.IDSelectorBatch(np.asarray(store.doc_ids[selected], dtype=np.int64))
+        D, I = self.index.search(query_vectors, k, params=search_parameters(self.index, selector=selector))
+        positions = np.full(I.shape, -1, dtype=np.int64)
+        found = I >= 0
+        positions[found] = store.positions_for_doc_ids(I[found])
+        similarities = similarity_from_distance(D)
+        similarities[positions < 0] = -np.inf
+        return similarities, positions
+
+
+def update_title_index(path, store, model, model_name, cache_dir, batch_size=32):
+    """Loads the title index at path, rebuilding it (through the embedding cache) when it does not match the store."""
+    if os.path.exists(TitleIndex._meta_path(path)):
+        try:
+            title_index = TitleIndex.load(path)
+            if title_index.matches_corpus(store, model_name):
+                return title_index
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable title index at {path}: {e}")
+    dimension = model.get_sentence_embedding_dimension()
+    cache = EmbeddingCache(cache_dir, model_name, TITLE_CACHE_KEY, dimension)
+    print(f"Building title index into {path}...")
+    title_index = TitleIndex.build(
+        store, model_name, dimension, lambda texts: cache.encode(texts, lambda missing: model.encode(missing, batch_size=batch_size)),
+    )
+    print(cache.stats_line())
+    title_index.save(path)
+    print(f"Title index saved ({title_index.index.ntotal} headlines).")
+    return title_index